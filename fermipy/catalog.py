@@ -1,6 +1,8 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import, division, print_function
 import os
+import hashlib
+import pickle
 import numpy as np
 from astropy import units as u
 from astropy.table import Table, Column
@@ -8,6 +10,7 @@ from astropy.coordinates import SkyCoord
 from astropy.io import fits
 import fermipy
 from fermipy import spectrum
+from fermipy import utils
 
 
 def add_columns(t0, t1):
@@ -59,6 +62,108 @@ def row_to_dict(row):
     return o
 
 
+def table_to_dicts(tab):
+    """Convert the rows of a table to a list of dictionaries.  This
+    is equivalent to calling `row_to_dict` on each row but accesses
+    the table one column at a time."""
+
+    cols = []
+    for colname in tab.colnames:
+        col = tab[colname]
+        if col.ndim == 1:
+            col = list(col)
+        cols += [(colname, col)]
+
+    o = []
+    for i in range(len(tab)):
+        row = {}
+        for colname, col in cols:
+            v = col[i]
+            row[colname] = str(v) if isinstance(v, np.string_) else v
+        o.append(row)
+
+    return o
+
+
+# In-memory cache of catalog objects keyed on catalog name and file
+# path.  Each entry stores the file modification time and size used to
+# validate it.
+_catalog_cache = {}
+
+
+def clear_cache():
+    """Clear the in-memory catalog cache."""
+    _catalog_cache.clear()
+
+
+def get_catalog_file(name):
+    """Get the path to the FITS file of a catalog.
+
+    Parameters
+    ----------
+    name : str
+        Catalog name or path to a catalog FITS file.
+
+    """
+
+    extname = os.path.splitext(name)[1]
+    if extname == '.fits' or extname == '.fit':
+        if not os.path.isfile(name):
+            name = os.path.join(fermipy.PACKAGE_DATA, 'catalogs', name)
+        return name
+    elif name == '3FGL':
+        return os.path.join(fermipy.PACKAGE_DATA, 'catalogs',
+                            'gll_psc_v16.fit')
+    elif name == '2FHL':
+        return os.path.join(fermipy.PACKAGE_DATA, 'catalogs',
+                            'gll_psch_v08.fit')
+    else:
+        raise Exception('Unrecognized catalog type.')
+
+
+def _get_file_key(path):
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size)
+
+
+def _get_sidecar_file(cachedir, name, fitsfile):
+    h = hashlib.md5((name + ':' + os.path.abspath(fitsfile)).encode('utf-8'))
+    basename = os.path.splitext(os.path.basename(fitsfile))[0]
+    return os.path.join(cachedir, '%s_%s.pkl' % (basename, h.hexdigest()[:12]))
+
+
+def _read_sidecar(path, key):
+    """Load a catalog object from a sidecar file.  Returns None if the
+    file does not exist or is out of date."""
+
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+
+    if data.get('key') != key:
+        return None
+
+    return data['catalog']
+
+
+def _write_sidecar(path, key, cat):
+
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    tmpfile = path + '.%i.tmp' % os.getpid()
+    with open(tmpfile, 'wb') as f:
+        pickle.dump({'key': key, 'catalog': cat}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(tmpfile, path)
+
+
 class Catalog(object):
     """Source catalog object.  This class provides a simple wrapper around
     FITS catalog tables."""
@@ -77,6 +182,7 @@ class Catalog(object):
                                  self._src_skydir.dec.deg)).T
         self._glonlat = np.vstack((self._src_skydir.galactic.l.deg,
                                    self._src_skydir.galactic.b.deg)).T
+        self._xyz = None
 
         if 'Spatial_Filename' not in self.table.columns:
             self.table['Spatial_Filename'] = Column(dtype='S20',length=len(self.table))
@@ -104,33 +210,82 @@ class Catalog(object):
     def glonlat(self):
         return self._glonlat
 
+    @property
+    def xyz(self):
+        """Unit vectors of the source positions with shape (N,3)."""
+        if self._xyz is None:
+            radec = np.radians(self._radec.astype(float))
+            self._xyz = utils.lonlat_to_xyz(radec[:, 0], radec[:, 1]).T
+        return self._xyz
+
     @staticmethod
-    def create(name):
+    def create(name, cache=True, cachedir=None):
+        """Create a catalog object.  Catalogs are cached in memory
+        keyed on the catalog name and the path and modification time
+        of the catalog file.  Cached catalog objects are shared
+        between calls and should be treated as read-only.
+
+        Parameters
+        ----------
+        name : str
+            Catalog name or path to a catalog FITS file.
 
-        extname = os.path.splitext(name)[1]
-        if extname == '.fits' or extname == '.fit':
-            fitsfile = name
-            if not os.path.isfile(fitsfile):
-                fitsfile = os.path.join(fermipy.PACKAGE_DATA, 'catalogs',
-                                        fitsfile)
+        cache : bool
+            Use the in-memory catalog cache.
 
-            # Try to guess the catalog type form its name
-            if 'gll_psc' in fitsfile:                
-                return Catalog3FGL(fitsfile)
+        cachedir : str
+            Directory in which a pickled copy of the catalog will be
+            stored.  This copy is used to skip parsing the FITS file
+            when the catalog is not yet in the in-memory cache.  If
+            None then no sidecar file is used.
 
-            tab = Table.read(fitsfile)
+        """
 
-            if 'NickName' in tab.columns:
-                return Catalog4FGLP(fitsfile)
-            else:
-                return Catalog(Table.read(fitsfile))
+        fitsfile = get_catalog_file(name)
 
-        elif name == '3FGL':
-            return Catalog3FGL()
+        if not cache:
+            return Catalog._create(name, fitsfile)
+
+        key = _get_file_key(fitsfile)
+        cache_key = (name, os.path.abspath(fitsfile))
+
+        if cache_key in _catalog_cache and \
+                _catalog_cache[cache_key][0] == key:
+            return _catalog_cache[cache_key][1]
+
+        cat = None
+        if cachedir is not None:
+            cachedir = os.path.expandvars(cachedir)
+            sidecar = _get_sidecar_file(cachedir, name, fitsfile)
+            cat = _read_sidecar(sidecar, key)
+
+        if cat is None:
+            cat = Catalog._create(name, fitsfile)
+            # Evaluate the unit vectors before the catalog is stored
+            cat.xyz
+            if cachedir is not None:
+                _write_sidecar(sidecar, key, cat)
+
+        _catalog_cache[cache_key] = (key, cat)
+        return cat
+
+    @staticmethod
+    def _create(name, fitsfile):
+
+        if name == '3FGL':
+            return Catalog3FGL(fitsfile)
         elif name == '2FHL':
-            return Catalog2FHL()
+            return Catalog2FHL(fitsfile)
+        # Try to guess the catalog type form its name
+        elif 'gll_psc' in fitsfile:
+            return Catalog3FGL(fitsfile)
+
+        tab = Table.read(fitsfile)
+
+        if 'NickName' in tab.columns:
+            return Catalog4FGLP(fitsfile)
         else:
-            raise Exception('Unrecognized catalog type.')
+            return Catalog(tab)
 
 
 class Catalog2FHL(Catalog):
@@ -23,6 +23,11 @@ data = {
     'scfile': (None, 'Path to FT2 (spacecraft) file.', str),
     'ltcube': (None, 'Path to livetime cube.  If none a livetime cube will be generated with ``gtmktime``.', str),
     'cacheft1': (True, 'Cache FT1 files when performing binned analysis.  If false then only the counts cube is retained.', bool),
+    'photon_store': (None, 'Path to a HEALPix-indexed photon store.  If set, event selection and (for WCS projections) '
+                     'counts cube binning are performed in-process from the store instead of with gtselect, gtmktime, '
+                     'and gtbin.  The store is built from ``evfile`` if it does not exist.  Selections with options the '
+                     'store does not support (e.g. a ``filter`` with functions other than ABS, SQRT, and ANGSEP) fall '
+                     'back to gtselect and gtmktime.', str),
 }
 
 # Options for data selection.
@@ -76,6 +81,9 @@ model = {
     'extdir': (None, 'Set a directory that will be searched for extended source FITS templates.  Template files in this directory '
                'will take precendence over catalog source templates with the same name.', str),
     'catalogs': (None, '', list),
+    'catalog_cachedir': (None, 'Directory in which parsed FITS catalogs will be cached.  Cached '
+                         'catalogs are reloaded from this directory instead of parsing the '
+                         'catalog file again.  If none then catalogs are only cached in memory.', str),
     'merge_sources' :
         (True, 'Merge properties of sources that appear in multiple '
          'source catalogs.  If merge_sources=false then subsequent sources with '
@@ -104,7 +112,19 @@ gtlike = {
     'srcmap': (None, '', str),
     'bexpmap': (None, '', str),
     'wmap': (None, 'Likelihood weights map.', str),
+    'srcmap_shift_tol': (0.0, 'Maximum displacement in pixels for which the source map of a moving source (e.g. '
+                         'during a localization scan) is generated by translating the previously computed map with '
+                         'an FFT phase ramp rather than rebuilding it.  Larger displacements trigger a full rebuild.  '
+                         'Set to 0 to always rebuild.', float),
+    'expcube_backend': ('gtexpcube2', 'Method used to compute the exposure cube with the binning of the ROI '
+                        '(gtexpcube2 or native).  The native method evaluates the exposure of each pixel directly '
+                        'from the LT cube and the effective area including the livetime-dependent efficiency '
+                        'correction.', str),
     'llscan_npts': (20,'Number of evaluation points to use when performing a likelihood scan.',int),
+    'setup_nworkers': (1, 'Number of worker processes used to run the data preparation steps (gtselect through '
+                       'gtsrcmaps) of the analysis components in parallel during setup.  Workers are only used on '
+                       'platforms where processes are started with fork.  Otherwise the components are set up '
+                       'sequentially.', int),
     'src_expscale': (None, 'Dictionary of exposure corrections for individual sources keyed to source name.  The exposure '
                      'for a given source will be scaled by this value.  A value of 1.0 corresponds to the nominal exposure.', dict),
     'expscale': (None, 'Exposure correction that is applied to all sources in the analysis component.  '
@@ -150,6 +170,16 @@ fileio = {
                       'This option only takes effect when ``usescratch`` is True.', list),
     'usescratch': (
         False, 'Run analysis in a temporary working directory under ``scratchdir``.', bool),
+    'setup_cachedir': (None, 'Path to a directory in which the products of gtltcube, gtbin, and gtexpcube2 are cached.  '
+                       'Products are keyed by the application parameters and the contents of the input files and are '
+                       'linked into the working directory of any analysis that requires the same product.  '
+                       'PSF tables and the livetime cubes loaded for each ROI are also persisted in this directory.  '
+                       'If none the cache is disabled.', str),
+    'setup_cache_maxsize': (None, 'Maximum size in GB of the setup cache.  When the cache exceeds this size the least '
+                            'recently used products are removed.  Products that are still hard-linked into the working '
+                            'directory of an analysis are never removed and their space is only reclaimed once all links '
+                            'are gone, so the cache can exceed this size.  If none the size of the cache is not limited.',
+                            float),
 }
 
 logging = {
@@ -339,8 +369,15 @@ extension = {
     'width_min': (0.01, 'Minimum value in degrees for the likelihood scan over spatial extent.', float),
     'width_max': (1.0, 'Maximum value in degrees for the likelihood scan over spatial extent.', float),
     'width_nstep': (21, 'Number of steps for the spatial likelihood scan.', int),
+    'method': ('scan', 'Method used to find the best-fit extension.  With ``scan`` the likelihood is evaluated '
+               'on a fixed grid of widths.  With ``brent`` the best-fit width is found with a bounded '
+               '1-D optimizer on log(width) and the errors and upper limit are found by root finding.', str),
     'fix_background': (False, 'Fix any background parameters that are currently free in the model when '
                        'performing the likelihood scan over extension.', bool),
+    'nworkers': (1, 'Number of worker processes used for the likelihood scan over extension.  Scan points are '
+                 'split into contiguous chunks that are fitted in parallel.  The fit at every scan point starts from '
+                 'the parameters of the baseline fit such that the result does not depend on the number of workers.  '
+                 'Workers that are not forked reload the analysis from a snapshot written with write_roi.', int),
     'update': (False, 'Update the source model with the best-fit spatial extension.', bool),
     'save_model_map': (False, 'Save model counts cubes for the best-fit model of extension.', bool),
     'sqrt_ts_threshold': (None, 'Threshold on sqrt(TS_ext) that will be applied when ``update`` is True.  If None then no'
@@ -375,6 +412,10 @@ extension_output = OrderedDict((
 localize = {
     'nstep': (5, 'Number of steps along each spatial dimension in the refined likelihood scan.', int),
     'dtheta_max': (0.3, 'Half-width of the search region in degrees used for the first pass of the localization search.', float),
+    'method': ('scan', 'Method used to refine the position after the TS map fit.  With ``scan`` the likelihood is '
+               'evaluated on a grid of ``nstep`` x ``nstep`` points.  With ``optimize`` the position is found with a '
+               'Nelder-Mead search starting from the TS map peak and the uncertainty ellipse is fit to a 3 x 3 '
+               'stencil of likelihood evaluations around the best-fit position.', str),
     'fix_background': (True, 'Fix background parameters when fitting the '
                        'source flux in each energy bin.', bool),
     'update': (False, 'Update the source model with the best-fit position.', bool)
@@ -1,13 +1,17 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import, division, print_function
 import os
+import re
 import copy
 import shutil
 import collections
 import logging
 import tempfile
+import time
 import filecmp
 import numpy as np
+import scipy.optimize
+from scipy.optimize import brentq
 # pyLikelihood needs to be imported before astropy to avoid CFITSIO header
 # error
 import pyLikelihood as pyLike
@@ -19,6 +23,8 @@ import fermipy.wcs_utils as wcs_utils
 import fermipy.fits_utils as fits_utils
 import fermipy.gtutils as gtutils
 import fermipy.srcmap_utils as srcmap_utils
+import fermipy.setup_cache as setup_cache
+import fermipy.photon_store as photon_store
 import fermipy.skymap as skymap
 import fermipy.plotting as plotting
 import fermipy.irfs as irfs
@@ -32,8 +38,9 @@ from fermipy.skymap import Map, HpxMap
 from fermipy.hpx_utils import HPX
 from fermipy.roi_model import ROIModel
 from fermipy.plotting import AnalysisPlotter
-from fermipy.logger import Logger, log_level
+from fermipy.logger import Logger, RecordBuffer, log_level
 from fermipy.config import ConfigSchema
+from fermipy.setup_pipeline import SetupPipeline, SetupStage
 # pylikelihood
 import GtApp
 import FluxDensity
@@ -376,6 +383,69 @@ def filter_dict(d, val):
             del d[k]
 
 
+# Analysis instance shared with the worker processes of a parallel
+# extension scan.  Forked workers inherit the in-memory likelihood
+# through this reference.  With any other start method each worker
+# rebuilds it from a snapshot (see _init_scan_extension_worker).
+_scan_analysis = None
+
+# Analysis instance shared with the worker processes that run the
+# setup of individual components in parallel.  Workers are forked from
+# the parent process and inherit the analysis through this reference.
+_setup_analysis = None
+
+
+def _get_source_items(sources):
+    """Convert a dictionary of source names and source dictionaries
+    to a list of (name, src_dict) tuples."""
+
+    if sources is None:
+        return []
+    elif isinstance(sources, dict):
+        return list(sources.items())
+    return list(sources)
+
+
+def _setup_component_worker(args):
+    """Run the ST applications of one analysis component in a worker
+    process and return the log records emitted while doing so."""
+    idx, overwrite = args
+    c = _setup_analysis.components[idx]
+
+    buf = RecordBuffer()
+    handlers = c.logger.handlers
+    c.logger.handlers = [buf]
+    try:
+        c._setup_files(overwrite=overwrite)
+        success = True
+    except Exception:
+        c.logger.exception('Setup failed for Analysis Component: %s',
+                           c.name)
+        success = False
+    finally:
+        c.logger.handlers = handlers
+
+    return buf.records, success
+
+
+def _init_scan_extension_worker(roi_file):
+    """Load the analysis state saved with `GTAnalysis.write_roi` in a
+    worker process that was not forked from the parent."""
+    global _scan_analysis
+    _scan_analysis = GTAnalysis.create(roi_file)
+
+
+def _scan_extension_worker(args):
+    name, spatial_model, width, params, optimizer = args
+    gta = _scan_analysis
+    # Parameter indices may differ in an analysis reloaded from a
+    # snapshot
+    params = [dict(p, idx=gta.like.par_index(p['src_name'], p['par_name']))
+              for p in params]
+    return gta._scan_extension_widths(name, spatial_model, width, params,
+                                      optimizer)
+
+
 class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
                  ResidMapGenerator, TSMapGenerator, TSCubeGenerator,
                  SourceFinder):
@@ -1050,9 +1120,16 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         # Run data selection step
 
+        nworkers = min(self.config['gtlike']['setup_nworkers'],
+                       len(self._components))
+        if nworkers > 1:
+            self._setup_components(nworkers, overwrite=overwrite)
+        else:
+            for c in self._components:
+                c.setup(overwrite=overwrite)
+
         self._like = SummedLikelihood()
-        for i, c in enumerate(self._components):
-            c.setup(overwrite=overwrite)
+        for c in self._components:
             self._like.addComponent(c.like)
 
         self._ccube_file = os.path.join(self.workdir,
@@ -1071,6 +1148,47 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         self.logger.info('Finished setup')
 
+    def _setup_components(self, nworkers, overwrite=False):
+        """Run the setup of the analysis components with the ST
+        applications of different components executing concurrently
+        in a pool of ``nworkers`` processes.  The log output of each
+        component is collected in its worker and written out once
+        the component has finished.  Likelihood objects are created
+        in this process."""
+
+        self.logger.info('Running setup for %i components with %i workers',
+                         len(self._components), nworkers)
+
+        # Templates and model files are shared between components so
+        # they are written before starting the workers
+        for c in self._components:
+            c._setup_model()
+
+        global _setup_analysis
+        _setup_analysis = self
+        args = [(i, overwrite) for i in range(len(self._components))]
+        try:
+            results = utils.pool_map(_setup_component_worker, args,
+                                     nworkers, logger=self.logger)
+        finally:
+            _setup_analysis = None
+
+        failed = []
+        for c, (records, success) in zip(self._components, results):
+            for record in records:
+                c.logger.handle(record)
+            if not success:
+                failed += [c.name]
+
+        if failed:
+            raise Exception('Setup failed for components: %s' %
+                            ', '.join(failed))
+
+        for c in self._components:
+            c._setup_likelihood()
+            self.logger.info('Finished setup for Analysis Component: %s',
+                             c.name)
+
     def _create_likelihood(self, srcmdl):
         self._like = SummedLikelihood()
         for c in self.components:
@@ -1344,6 +1462,151 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
         if self._fitcache is not None:
             self._fitcache.update_source(name)
 
+    def add_sources(self, sources, free=False, init_source=True,
+                    save_source_maps=True, **kwargs):
+        """Add several sources to the ROI model in a single batch.
+        This is equivalent to calling
+        `~fermipy.gtanalysis.GTAnalysis.add_source` for each source
+        but updates the source maps file and the fixed model weights
+        of each component only once.
+
+        Parameters
+        ----------
+
+        sources : dict or list
+            Dictionary mapping source names to source dictionaries (or
+            `~fermipy.roi_model.Source` objects) or list of (name,
+            src_dict) tuples.
+
+        free : bool
+            Initialize the sources with a free normalization parameter.
+
+        Returns
+        -------
+        srcs : list
+            List of the added `~fermipy.roi_model.Source` objects.
+
+        """
+        return self.edit_sources(add=sources, free=free,
+                                 init_source=init_source,
+                                 save_source_maps=save_source_maps,
+                                 **kwargs)
+
+    def edit_sources(self, add=None, delete=None, free=False,
+                     init_source=True, save_template=True,
+                     delete_source_map=False, save_source_maps=True,
+                     **kwargs):
+        """Apply a batch of source additions and deletions to the ROI
+        model.  Deletions are applied before additions.  The source
+        maps file, the ROI source index and the fixed model weights of
+        each component are updated once for the whole batch.
+
+        Parameters
+        ----------
+
+        add : dict or list
+            Dictionary mapping source names to source dictionaries (or
+            `~fermipy.roi_model.Source` objects) or list of (name,
+            src_dict) tuples defining the sources to be added.
+
+        delete : list
+            List of names of sources to be deleted.
+
+        free : bool
+            Initialize the added sources with a free normalization
+            parameter.
+
+        init_source : bool
+            Initialize the properties of the added sources and update
+            the ROI model.
+
+        save_template : bool
+            Keep the SpatialMap FITS templates associated with the
+            deleted sources.
+
+        delete_source_map : bool
+            Delete the source maps of the deleted sources from the
+            source maps file.
+
+        save_source_maps : bool
+            Write the source maps of the added sources to the source
+            maps file.
+
+        Returns
+        -------
+        srcs : list
+            List of the added `~fermipy.roi_model.Source` objects.
+
+        """
+
+        loglevel = kwargs.pop('loglevel', logging.INFO)
+        add = _get_source_items(add)
+
+        del_srcs = []
+        for name in ([] if delete is None else delete):
+            if not self.roi.has_source(name):
+                self.logger.error('No source with name: %s', name)
+                continue
+            del_srcs.append(self.roi.get_source_by_name(name))
+        del_names = [s.name for s in del_srcs]
+
+        names = []
+        for name, src_dict in add:
+            if name in names or (self.roi.has_source(name) and
+                                 self.roi.get_source_by_name(name).name
+                                 not in del_names):
+                msg = 'Source %s already exists.' % name
+                self.logger.error(msg)
+                raise Exception(msg)
+            names.append(name)
+
+        for name in del_names:
+            self.logger.log(loglevel, 'Deleting source %s', name)
+            # STs require a source to be freed before deletion
+            if self._like is not None and \
+                    not self.like.normPar(name).isFree():
+                self.free_norm(name, loglevel=logging.DEBUG)
+
+        for name in names:
+            self.logger.log(loglevel, 'Adding source ' + name)
+
+        for c in self.components:
+            c.edit_sources(add=add, delete=del_names, free=True,
+                           save_template=save_template,
+                           delete_source_map=delete_source_map,
+                           save_source_maps=save_source_maps)
+
+        if del_srcs:
+            self.roi.delete_sources(del_srcs, build_index=not add)
+        srcs = self.roi.create_sources(add)
+
+        if self._like is None:
+            return srcs
+
+        for src in srcs:
+            if self.config['gtlike']['edisp'] and src.name not in \
+                    self.config['gtlike']['edisp_disable']:
+                self.set_edisp_flag(src.name, True)
+            self.like.syncSrcParams(str(src.name))
+
+        self.like.model = self.like.components[0].model
+
+        for src in srcs:
+            self.free_norm(src.name, free, loglevel=logging.DEBUG)
+
+        if init_source:
+            for src in srcs:
+                self._init_source(src.name)
+
+        if del_srcs or (srcs and init_source):
+            self._update_roi()
+
+        if self._fitcache is not None:
+            for src in srcs:
+                self._fitcache.update_source(src.name)
+
+        return srcs
+
     def add_sources_from_roi(self, names, roi, free=False, **kwargs):
         """Add multiple sources to the current ROI model copied from another ROI model.
 
@@ -1361,8 +1624,8 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         """
 
-        for name in names:
-            self.add_source(name, roi[name].data, free=free, **kwargs)
+        self.add_sources([(name, roi[name].data) for name in names],
+                         free=free, **kwargs)
 
     def delete_source(self, name, save_template=True, delete_source_map=False,
                       build_fixed_wts=True, **kwargs):
@@ -1414,7 +1677,7 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
     def delete_sources(self, cuts=None, distance=None,
                        skydir=None, minmax_ts=None, minmax_npred=None,
-                       square=False, exclude_diffuse=True):
+                       square=False, exclude_diffuse=True, names=None):
         """Delete sources in the ROI model satisfying the given
         selection criteria.
 
@@ -1449,6 +1712,10 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
             selection on the maximum projected distance from the ROI
             center.
 
+        names : list
+            List of names of sources to delete.  If this parameter is
+            not None the other selections are ignored.
+
         Returns
         -------
         srcs : list
@@ -1456,20 +1723,17 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         """
 
-        srcs = self.roi.get_sources(skydir=skydir, distance=distance, cuts=cuts,
-                                    minmax_ts=minmax_ts, minmax_npred=minmax_npred,
-                                    square=square, exclude_diffuse=exclude_diffuse,
-                                    coordsys=self.config['binning']['coordsys'])
-
-        for s in srcs:
-            self.delete_source(s.name, build_fixed_wts=False)
-
-        # Build fixed model weights in one pass
-        for c in self.components:
-            c.like.logLike.buildFixedModelWts()
-
-        self._update_roi()
-
+        if names is not None:
+            srcs = [self.roi.get_source_by_name(name) for name in names]
+        else:
+            srcs = self.roi.get_sources(skydir=skydir, distance=distance,
+                                        cuts=cuts, minmax_ts=minmax_ts,
+                                        minmax_npred=minmax_npred,
+                                        square=square,
+                                        exclude_diffuse=exclude_diffuse,
+                                        coordsys=self.config['binning']['coordsys'])
+
+        self.edit_sources(delete=[s.name for s in srcs])
         return srcs
 
     def free_sources(self, free=True, pars=None, cuts=None,
@@ -1873,6 +2137,21 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         return [params[k] for k in sorted(params.keys())]
 
+    def _set_params(self, params):
+        """Restore parameter values, bounds, and free flags from a list
+        of parameter dictionaries generated with
+        `~fermipy.gtanalysis.GTAnalysis.get_params`."""
+
+        for p in params:
+            par = self.like[p['idx']]
+            bounds = par.getBounds()
+            par.setBounds(min(bounds[0], p['bounds'][0]),
+                          max(bounds[1], p['bounds'][1]))
+            par.setValue(p['value'])
+            par.setBounds(*p['bounds'])
+            par.setFree(p['free'])
+        self.like.syncSrcParams()
+
     def get_free_param_vector(self):
         free = []
         for p in self.like.params():
@@ -2121,11 +2400,28 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
             Scan points will be spaced evenly on a logarithmic scale
             between log(width_min) and log(width_max).
 
+        method : str
+            Method used to find the best-fit extension.  With
+            ``scan`` the likelihood is evaluated on a fixed grid of
+            widths.  With ``brent`` the best-fit width is found with a
+            bounded 1-D optimizer on log(width) between width_min and
+            width_max and the 1-sigma errors and upper limit are
+            found by root finding on the profile likelihood.  The
+            ``width`` and ``loglike`` output vectors will then contain
+            only the evaluated points.
+
         width : array-like
             Sequence of values in degrees for the spatial extension
             scan.  If this argument is None then the scan points will
             be determined from width_min/width_max/width_nstep.
 
+        nworkers : int
+            Number of worker processes used for the likelihood scan
+            over width.  Each worker fits a contiguous chunk of the
+            scan points starting from the parameters of the baseline
+            fit.  If processes cannot be forked the scan runs
+            sequentially.
+
         fix_background : bool
             Fix all background sources when performing the extension fit.
 
@@ -2253,32 +2549,22 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
         self.delete_source(src_ptsrc.name, save_template=False,
                            loglevel=logging.DEBUG)
 
-        # Perform scan over width parameter
-        self.logger.debug('Width scan vector:\n %s', width)
-
-        if not hasattr(self.components[0].like.logLike, 'setSourceMapImage'):
-            o['loglike'] = self._scan_extension_pylike(src_ext, spatial_model,
-                                                       width, config['optimizer'])
+        if config['method'] == 'brent':
+            self.logger.debug('Fitting width between %.3f and %.3f deg',
+                              width_min, width_max)
+            try:
+                o.update(self._fit_extension(src_ext, spatial_model,
+                                             width_min, width_max,
+                                             o['loglike_ptsrc'],
+                                             config['optimizer']))
+            except Exception:
+                self.logger.error('Extension fit failed.', exc_info=True)
+        elif config['method'] == 'scan':
+            self._scan_extension_profile(o, src_ext, spatial_model,
+                                         config['optimizer'],
+                                         config['nworkers'])
         else:
-            o['loglike'] = self._scan_extension(src_ext, spatial_model,
-                                                width, config['optimizer'])
-
-        self.logger.debug('Likelihood: %s',o['loglike'])
-        o['loglike'] = np.concatenate(([o['loglike_ptsrc']], o['loglike']))
-        o['dloglike'] = o['loglike'] - o['loglike_ptsrc']
-
-        try:
-
-            ul_data = utils.get_parameter_limits(o['width'], o['dloglike'])
-
-            o['ext'] = ul_data['x0']
-            o['ext_ul95'] = ul_data['ul']
-            o['ext_err_lo'] = ul_data['err_lo']
-            o['ext_err_hi'] = ul_data['err_hi']
-            o['ts_ext'] = 2 * ul_data['lnlmax']
-            o['ext_err'] = ul_data['err']
-        except Exception:
-            self.logger.error('Upper limit failed.', exc_info=True)
+            raise Exception('Unrecognized method: %s' % config['method'])
 
         self.logger.info('Best-fit extension: %6.4f + %6.4f - %6.4f'
                          % (o['ext'], o['ext_err_lo'], o['ext_err_hi']))
@@ -2375,23 +2661,270 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
             h.header['CREATOR'] = 'fermipy ' + fermipy.__version__
         hdulist.writeto(filename, clobber=True)
         
-    def _scan_extension(self, src, spatial_model, width, optimizer):
+    def _scan_extension_profile(self, o, src, spatial_model, optimizer,
+                                nworkers=1):
+
+        # Perform scan over width parameter
+        self.logger.debug('Width scan vector:\n %s', o['width'])
+
+        if not hasattr(self.components[0].like.logLike, 'setSourceMapImage'):
+            if nworkers > 1:
+                self.logger.warning('Parallel extension scan requires '
+                                    'setSourceMapImage.  Running a '
+                                    'sequential scan.')
+            o['loglike'] = self._scan_extension_pylike(src, spatial_model,
+                                                       o['width'], optimizer)
+        else:
+            o['loglike'] = self._scan_extension(src, spatial_model,
+                                                o['width'], optimizer,
+                                                nworkers)
+
+        self.logger.debug('Likelihood: %s',o['loglike'])
+        o['loglike'] = np.concatenate(([o['loglike_ptsrc']], o['loglike']))
+        o['dloglike'] = o['loglike'] - o['loglike_ptsrc']
+
+        try:
+
+            ul_data = utils.get_parameter_limits(o['width'], o['dloglike'])
+
+            o['ext'] = ul_data['x0']
+            o['ext_ul95'] = ul_data['ul']
+            o['ext_err_lo'] = ul_data['err_lo']
+            o['ext_err_hi'] = ul_data['err_hi']
+            o['ts_ext'] = 2 * ul_data['lnlmax']
+            o['ext_err'] = ul_data['err']
+        except Exception:
+            self.logger.error('Upper limit failed.', exc_info=True)
+
+    def _fit_extension(self, src, spatial_model, width_min, width_max,
+                       loglike_ptsrc, optimizer, ul_confidence=0.95,
+                       xtol=0.1):
+        """Find the best-fit extension with a bounded scalar optimizer
+        on log10(width) and compute the errors and upper limit by root
+        finding on the profile likelihood.  Root searches start from
+        an interpolation of the widths already evaluated by the
+        optimizer.  Every width at which the model is refit is
+        recorded in the returned likelihood profile.  The point-source
+        likelihood is used for width=0.
+
+        Parameters
+        ----------
+
+        xtol : float
+            Tolerance in log10(width) for the optimizer and the root
+            searches.  The default matches the spacing of the default
+            width scan.
+        """
+
+        use_srcmap_image = hasattr(self.components[0].like.logLike,
+                                   'setSourceMapImage')
+
+        if use_srcmap_image:
+            src.set_spatial_model('PSFSource', width_max)
+            self.add_source(src.name, src, free=True, init_source=False)
+            self._fitcache = None
+
+        profile = {0.0: loglike_ptsrc}
+
+        def loglike_fn(w):
+
+            w = float(w)
+            if w in profile:
+                return profile[w]
+
+            if use_srcmap_image:
+                self._update_srcmap(src.name, self.roi[src.name].skydir,
+                                    spatial_model, w)
+            else:
+                src.set_spatial_model(spatial_model, w)
+                self.add_source(src.name, src, free=True, init_source=False,
+                                loglevel=logging.DEBUG)
+
+            fit_output = self._fit(**optimizer)
+            self.logger.debug('Fitting width: %10.3f deg LogLike %10.2f',
+                              w, fit_output['loglike'])
+
+            if not use_srcmap_image:
+                self.delete_source(src.name, save_template=False,
+                                   loglevel=logging.DEBUG)
+
+            profile[w] = fit_output['loglike']
+            return profile[w]
+
+        def interp_root(lo, hi, lnlmax, delta):
+            """Estimate the width between lo and hi at which the
+            log-likelihood drops by delta.  The profile is modeled as a
+            parabola in log(width) through the three evaluated widths
+            closest to the bracket.  Linear interpolation is used if
+            the parabola has no root inside the bracket."""
+
+            w = np.array(sorted([t for t in profile.keys() if t > 0]))
+            f = np.array([profile[t] for t in w]) - lnlmax + delta
+            t = np.log10(w)
+            tlo = np.log10(lo) if lo > 0 else -np.inf
+            thi = np.log10(hi)
+
+            if len(w) >= 3:
+                tc = np.clip(0.5 * (max(tlo, t[0]) + thi), t[0], t[-1])
+                idx = np.sort(np.argsort(np.abs(t - tc))[:3])
+                c = np.polyfit(t[idx], f[idx], 2)
+                r = np.roots(c)
+                r = np.real(r[np.isreal(r)])
+                r = r[(r > tlo) & (r < thi)]
+                if len(r):
+                    return 10**r[np.argmin(np.abs(r - tc))]
+
+            flo = profile[lo] - lnlmax + delta
+            fhi = profile[hi] - lnlmax + delta
+            if lo > 0:
+                return 10**(tlo + (thi - tlo) * flo / (flo - fhi))
+            return lo + (hi - lo) * flo / (flo - fhi)
+
+        def find_root(x0, xb, lnlmax, delta):
+            """Find the width between x0 and xb at which the
+            log-likelihood drops by delta.  The crossing is estimated
+            from the widths that were already evaluated and the model
+            is refit at the estimate until the bracket is narrower
+            than xtol or successive estimates agree to within xtol."""
+
+            xprev = None
+            for i in range(10):
+
+                w = np.array(sorted(profile.keys()))
+                w = w[(w >= min(x0, xb)) & (w <= max(x0, xb))]
+                if xb < x0:
+                    w = w[::-1]
+
+                f = np.array([profile[t] for t in w]) - lnlmax + delta
+                m = np.sign(f) != np.sign(f[0])
+                if not np.any(m):
+                    if xb in profile:
+                        return np.nan
+                    loglike_fn(xb)
+                    continue
+
+                j = np.argmax(m)
+                lo, hi = sorted((w[j - 1], w[j]))
+                x = interp_root(lo, hi, lnlmax, delta)
+
+                if lo > 0:
+                    converged = np.log10(hi / lo) < xtol
+                else:
+                    converged = hi < width_min
+
+                if xprev is not None and x > 0 and xprev > 0:
+                    converged |= np.abs(np.log10(x / xprev)) < xtol
+
+                if converged:
+                    return x
+
+                loglike_fn(x)
+                xprev = x
+
+            return x
+
+        try:
+            res = scipy.optimize.minimize_scalar(
+                lambda t: -loglike_fn(10**t),
+                bounds=(np.log10(width_min), np.log10(width_max)),
+                method='bounded', options={'xatol': xtol})
+
+            x0 = 10**res.x
+            lnlmax = loglike_fn(x0)
+            if loglike_ptsrc > lnlmax:
+                x0 = 0.0
+                lnlmax = loglike_ptsrc
+
+            deltalnl = utils.onesided_cl_to_dlnl(ul_confidence)
+            ul = find_root(x0, width_max, lnlmax, deltalnl)
+            err_hi = np.abs(x0 - find_root(x0, width_max, lnlmax, 0.5))
+            err_lo = np.abs(x0 - find_root(x0, 0.0, lnlmax, 0.5))
+        finally:
+            if use_srcmap_image:
+                self.delete_source(src.name, save_template=False)
+
+        if np.isfinite(err_lo):
+            err = 0.5 * (err_lo + err_hi)
+        else:
+            err = err_hi
+
+        width = np.array(sorted(profile.keys()))
+        loglike = np.array([profile[w] for w in width])
+
+        self.logger.debug('Evaluated likelihood at %i widths',
+                          len(width) - 1)
+
+        o = {'width': width,
+             'loglike': loglike,
+             'dloglike': loglike - loglike_ptsrc,
+             'ext': x0,
+             'ext_ul95': ul,
+             'ext_err_lo': err_lo,
+             'ext_err_hi': err_hi,
+             'ext_err': err,
+             'ts_ext': 2 * (lnlmax - loglike_ptsrc)}
+        return o
+
+    def _scan_extension(self, src, spatial_model, width, optimizer,
+                        nworkers=1):
 
         src.set_spatial_model('PSFSource', width[-1])
         self.add_source(src.name, src, free=True, init_source=False)
         self._fitcache = None
 
+        # The fit at every width starts from the parameters of the
+        # baseline fit such that the profile does not depend on how
+        # the widths are split between workers
+        params = self.get_params()
+        nworkers = min(nworkers, len(width) - 1)
+        if nworkers > 1:
+            global _scan_analysis
+            args = [(src.name, spatial_model, w, params, optimizer)
+                    for w in np.array_split(width[1:], nworkers)]
+            tmpdir = None
+            try:
+                if utils.get_start_method() == 'fork':
+                    _scan_analysis = self
+                    kw = dict(inherit_state=True)
+                else:
+                    tmpdir = tempfile.mkdtemp(prefix='scan_extension_',
+                                              dir=self.workdir)
+                    self.write_roi(os.path.join(tmpdir, 'roi'))
+                    kw = dict(inherit_state=False,
+                              initializer=_init_scan_extension_worker,
+                              initargs=(os.path.join(tmpdir, 'roi.npy'),))
+                results = utils.pool_map(_scan_extension_worker, args,
+                                         nworkers, logger=self.logger, **kw)
+            finally:
+                _scan_analysis = None
+                if tmpdir is not None:
+                    shutil.rmtree(tmpdir, ignore_errors=True)
+            loglike = np.concatenate(results)
+        else:
+            loglike = self._scan_extension_widths(src.name, spatial_model,
+                                                  width[1:], params,
+                                                  optimizer)
+
+        self.delete_source(src.name, save_template=False)
+
+        return loglike
+
+    def _scan_extension_widths(self, name, spatial_model, width, params,
+                               optimizer):
+        """Fit the model at a sequence of widths.  The parameters are
+        restored from the snapshot ``params`` before the fit at each
+        width."""
+
         loglike = []
-        for i, w in enumerate(width[1:]):
-            self._update_srcmap(src.name, self.roi[src.name].skydir,
+        for i, w in enumerate(width):
+            self._set_params(params)
+            self._update_srcmap(name, self.roi[name].skydir,
                                 spatial_model, w)
             fit_output = self._fit(**optimizer)
             self.logger.debug('Fitting width: %10.3f deg LogLike %10.2f',
                               w,fit_output['loglike'])
             loglike += [fit_output['loglike']]
 
-        self.delete_source(src.name, save_template=False)
-
         return np.array(loglike)
 
     def _scan_extension_pylike(self, src, spatial_model, width, optimizer):
@@ -3609,6 +4142,7 @@ class GTAnalysis(fermipy.config.Configurable, sed.SEDGenerator,
 
         for c in self.components:
             c.like.logLike.saveSourceMaps(str(c.files['srcmap']))
+            c.srcmap_store.invalidate()
 
         if save_model_map:
             self.write_model_map(prefix)
@@ -4059,11 +4593,19 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         self._files['ft1_filtered'] = 'ft1_filtered%s.fits'
         self._files['ccube'] = 'ccube%s.fits'
         self._files['ccubemc'] = 'ccubemc%s.fits'
+        self._files['setup_manifest'] = 'setup_manifest%s.json'
         self._files['srcmap'] = 'srcmap%s.fits'
         self._files['bexpmap'] = 'bexpmap%s.fits'
         self._files['bexpmap_roi'] = 'bexpmap_roi%s.fits'
         self._files['srcmdl'] = 'srcmdl%s.xml'
 
+        # Last source map kernel generated for each source by
+        # _update_srcmap
+        self._srcmap_kernels = {}
+        self._srcmap_store = None
+        self._setup_cache = setup_cache.SetupCache.create(
+            self.config['fileio'])
+
         # Fill dictionary of exposure corrections
         self._src_expscale = {}
         if self.config['gtlike']['expscale'] is not None:
@@ -4251,6 +4793,19 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
     def src_expscale(self):
         return self._src_expscale
 
+    @property
+    def srcmap_store(self):
+        """Source map file of this component
+        (`~fermipy.srcmap_utils.FITSSourceMapStore`).  All updates of
+        the source map file go through the store so that its cached
+        index of source names stays current."""
+
+        if self._srcmap_store is None or \
+                self._srcmap_store.path != self.files['srcmap']:
+            self._srcmap_store = srcmap_utils.FITSSourceMapStore(
+                self.files['srcmap'])
+        return self._srcmap_store
+
     def reload_source(self, name):
         """Delete and reload a single source in the model.  This function will
         force the recomputation of source maps.
@@ -4267,8 +4822,9 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             else:
                 self.like.logLike.loadSourceMap(str(name), True, False)
 
-            srcmap_utils.delete_source_map(self.files['srcmap'], name)
+            self.srcmap_store.delete(name)
             self.like.logLike.saveSourceMaps(str(self.files['srcmap']))
+            self.srcmap_store.invalidate()
             self.like.logLike.buildFixedModelWts()
         else:
             self.write_xml('tmp')
@@ -4320,33 +4876,150 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
 
         """
 
-        if self.roi.has_source(name):
-            msg = 'Source %s already exists.' % name
-            self.logger.error(msg)
-            raise Exception(msg)
+        self.edit_sources(add=[(name, src_dict)], free=free,
+                          save_source_maps=save_source_maps)
 
-        srcmap_utils.delete_source_map(self.files['srcmap'], name)
+    def add_sources(self, sources, free=False, save_source_maps=True):
+        """Add several new sources to the model in a single batch.
+        See `~fermipy.gtanalysis.GTBinnedAnalysis.edit_sources`.
 
-        src = self.roi.create_source(name, src_dict)
-        self.make_template(src, self.config['file_suffix'])
+        Parameters
+        ----------
+
+        sources : dict or list
+            Dictionary mapping source names to source dictionaries or
+            list of (name, src_dict) tuples.
+
+        free : bool
+            Initialize the sources with the normalization parameter free.
+
+        save_source_maps : bool
+            Write the source maps for these sources to the source maps
+            file.
+
+        """
+        return self.edit_sources(add=sources, free=free,
+                                 save_source_maps=save_source_maps)
+
+    def edit_sources(self, add=None, delete=None, free=False,
+                     save_template=True, delete_source_map=False,
+                     save_source_maps=True):
+        """Apply a batch of source additions and deletions to the
+        model.  Deletions are applied before additions.  The source
+        maps file is updated once, the ROI source index is rebuilt
+        once and the fixed model weights are recomputed once for the
+        whole batch.
+
+        Parameters
+        ----------
+
+        add : dict or list
+            Dictionary mapping source names to source dictionaries (or
+            `~fermipy.roi_model.Source` objects) or list of (name,
+            src_dict) tuples defining the sources to be added.
+
+        delete : list
+            List of names of sources to be deleted.
+
+        free : bool
+            Initialize the added sources with the normalization
+            parameter free.
+
+        save_template : bool
+            Keep the SpatialMap FITS templates associated with the
+            deleted sources.
+
+        delete_source_map : bool
+            Delete the source maps of the deleted sources from the
+            source maps file.
+
+        save_source_maps : bool
+            Write the source maps of the added sources to the source
+            maps file.
+
+        Returns
+        -------
+        srcs : list
+            List of the added `~fermipy.roi_model.Source` objects.
+
+        """
+
+        add = _get_source_items(add)
+        del_srcs = [self.roi.get_source_by_name(name)
+                    for name in ([] if delete is None else delete)]
+        del_names = [s.name for s in del_srcs]
+
+        names = []
+        for name, src_dict in add:
+            if name in names or (self.roi.has_source(name) and
+                                 self.roi.get_source_by_name(name).name
+                                 not in del_names):
+                msg = 'Source %s already exists.' % name
+                self.logger.error(msg)
+                raise Exception(msg)
+            names.append(name)
+
+        build_fixed_wts = len(del_srcs) > 0
+        if self.like is not None:
+            for src in del_srcs:
+                self.logger.debug('Deleting source %s', src.name)
+                if str(src.name) in self.like.sourceNames():
+                    self.like.deleteSource(str(src.name))
+                    self.like.logLike.eraseSourceMap(str(src.name))
+
+        for src in del_srcs:
+            if not save_template and 'Spatial_Filename' in src and \
+                    src['Spatial_Filename'] is not None and \
+                    os.path.isfile(src['Spatial_Filename']):
+                os.remove(src['Spatial_Filename'])
+            self._srcmap_kernels.pop(src.name, None)
+
+        if del_srcs:
+            self.roi.delete_sources(del_srcs, build_index=not add)
+
+        # Drop stale maps of the added sources together with those of
+        # the deleted sources
+        srcmap_names = list(names)
+        if delete_source_map:
+            srcmap_names += del_names
+
+        if srcmap_names:
+            self.srcmap_store.delete(srcmap_names)
+
+        srcs = self.roi.create_sources(add)
+        for src in srcs:
+            self.make_template(src, self.config['file_suffix'])
+            if self.config['gtlike']['expscale'] is not None and \
+                    src.name not in self._src_expscale:
+                self._src_expscale[src.name] = \
+                    self.config['gtlike']['expscale']
 
-        if self.config['gtlike']['expscale'] is not None and \
-                name not in self._src_expscale:
-            self._src_expscale[name] = self.config['gtlike']['expscale']
-                    
         if self._like is None:
-            return
+            return srcs
 
-        self._update_srcmap_file([src], True)
+        if srcs:
+            self._update_srcmap_file(srcs, True)
 
-        pylike_src = self._create_source(src, free=True)
-        self.like.addSource(pylike_src)
-        self.like.syncSrcParams(str(name))
-        self.like.logLike.buildFixedModelWts()
-        if save_source_maps:
-            self.like.logLike.saveSourceMaps(str(self.files['srcmap']))
+            for src in srcs:
+                pylike_src = self._create_source(src, free=True)
+                self.like.addSource(pylike_src)
+                self.like.syncSrcParams(str(src.name))
 
-        self.set_exposure_scale(name)
+            if save_source_maps:
+                self.like.logLike.saveSourceMaps(str(self.files['srcmap']))
+                self.srcmap_store.invalidate()
+
+            scale_map = {src.name: self._src_expscale[src.name]
+                         for src in srcs if src.name in self._src_expscale}
+            if scale_map:
+                self._scale_srcmap(scale_map, build_fixed_wts=False)
+
+            build_fixed_wts = True
+
+        if build_fixed_wts:
+            self.like.logLike.buildFixedModelWts()
+
+        return srcs
 
     def _create_source(self, src, free=False):
         """Create a pyLikelihood Source object from a
@@ -4435,12 +5108,35 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             os.remove(src['Spatial_Filename'])
 
         self.roi.delete_sources([src])
+        self._srcmap_kernels.pop(src.name, None)
 
         if delete_source_map:
-            srcmap_utils.delete_source_map(self.files['srcmap'], name)
+            self.srcmap_store.delete(name)
 
         return src
 
+    def delete_sources(self, names, save_template=True,
+                       delete_source_map=False):
+        """Delete several sources from the model in a single batch.
+        See `~fermipy.gtanalysis.GTBinnedAnalysis.edit_sources`.
+
+        Parameters
+        ----------
+
+        names : list
+            List of source names.
+
+        Returns
+        -------
+        srcs : list
+            List of the deleted `~fermipy.roi_model.Model` objects.
+
+        """
+        srcs = [self.roi.get_source_by_name(name) for name in names]
+        self.edit_sources(delete=names, save_template=save_template,
+                          delete_source_map=delete_source_map)
+        return srcs
+
     def set_exposure_scale(self, name, scale=None):
         """Set the exposure correction of a source.
 
@@ -4650,86 +5346,126 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         self.logger.info("Running setup for Analysis Component: " +
                          self.name)
 
-        srcmdl_file = self.files['srcmdl']
+        self._setup_model()
+        self._setup_files(overwrite=overwrite)
+        self._setup_likelihood()
 
-        # If ltcube or ccube do not exist then rerun data selection
-        if not os.path.isfile(self.files['ccube']) or \
-                not os.path.isfile(self.files['ltcube']):
-            self._select_data(overwrite=overwrite)
+        self.logger.info('Finished setup for Analysis Component: %s',
+                         self.name)
 
-        # Run gtltcube
-        kw = dict(evfile=self.files['ft1'],
-                  scfile=self.config['data']['scfile'],
-                  outfile=self.files['ltcube'],
-                  zmax=self.config['selection']['zmax'])
+    def _setup_model(self):
+        """Write the spatial templates of extended sources and the
+        XML model file used as input to gtsrcmaps."""
 
-        if self._ext_ltcube:
-            self.logger.debug('Using external LT cube.')
-        elif not os.path.isfile(self.files['ltcube']) or overwrite:
-            run_gtapp('gtltcube', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtltcube')
+        # Make spatial templates for extended sources
+        for s in self.roi.sources:
+            if s.diffuse:
+                continue
+            if not s.extended:
+                continue
+            self.make_template(s, self.config['file_suffix'])
 
-        self.logger.debug('Loading LT Cube %s', self.files['ltcube'])
-        self._ltc = irfs.LTCube.create(self.files['ltcube'])
+        # Write ROI XML
+        # if not os.path.isfile(srcmdl_file):
+        self.roi.write_xml(self.files['srcmdl'])
 
-        self.logger.debug('Creating PSF model')
-        self._psf = irfs.PSFModel(self.roi.skydir, self._ltc,
-                                  self.config['gtlike']['irfs'],
-                                  self.config['selection']['evtype'],
-                                  self.log_energies)
+    def _setup_files(self, overwrite=False):
+        """Run the ST applications (gtselect, gtmktime, gtltcube,
+        gtbin, gtexpcube2, gtsrcmaps) that generate the input files
+        of this component.  Only stages whose parameters or inputs
+        changed since the last setup are rerun.  This method only
+        writes files in the working directory and can be run in a
+        separate process."""
+
+        pipeline = self._create_setup_pipeline()
+        stale = pipeline.run(overwrite=overwrite)
+        self.logger.debug('Setup stages run: %s', stale)
+
+    def _create_setup_pipeline(self):
+        """Build the pipeline of setup stages of this component.  Each
+        stage records a fingerprint of its parameters and inputs in
+        the setup manifest of the component."""
+
+        srcmdl_file = self.files['srcmdl']
+        evtype = self.config['selection']['evtype']
+
+        kw_gtselect = dict(infile=self.config['data']['evfile'],
+                           outfile=self.files['ft1'],
+                           ra=self.roi.skydir.ra.deg,
+                           dec=self.roi.skydir.dec.deg,
+                           rad=self.config['selection']['radius'],
+                           convtype=self.config['selection']['convtype'],
+                           phasemin=self.config['selection']['phasemin'],
+                           phasemax=self.config['selection']['phasemax'],
+                           evtype=self.config['selection']['evtype'],
+                           evclass=self.config['selection']['evclass'],
+                           tmin=self.config['selection']['tmin'],
+                           tmax=self.config['selection']['tmax'],
+                           emin=self.config['selection']['emin'],
+                           emax=self.config['selection']['emax'],
+                           zmax=self.config['selection']['zmax'],
+                           chatter=self.config['logging']['chatter'])
 
-        # Run gtbin
+        kw_gtmktime = dict(evfile=self.files['ft1'],
+                           outfile=self.files['ft1_filtered'],
+                           scfile=self.config['data']['scfile'],
+                           roicut=self.config['selection']['roicut'],
+                           filter=self.config['selection']['filter'])
+
+        if self.config['selection']['roicut'] != 'yes' and \
+                self.config['selection']['filter'] is None:
+            kw_gtmktime = None
+
+        # Parameters for gtltcube
+        kw_gtltcube = dict(evfile=self.files['ft1'],
+                           scfile=self.config['data']['scfile'],
+                           outfile=self.files['ltcube'],
+                           zmax=self.config['selection']['zmax'])
+
+        # Parameters for gtbin
         if self.projtype == "WCS":
-            kw = dict(algorithm='ccube',
-                      nxpix=self.npix, nypix=self.npix,
-                      binsz=self.config['binning']['binsz'],
-                      evfile=self.files['ft1'],
-                      outfile=self.files['ccube'],
-                      scfile=self.config['data']['scfile'],
-                      xref=self._xref,
-                      yref=self._yref,
-                      axisrot=0,
-                      proj=self.config['binning']['proj'],
-                      ebinalg='LOG',
-                      emin=self.config['selection']['emin'],
-                      emax=self.config['selection']['emax'],
-                      enumbins=self._enumbins,
-                      coordsys=self.config['binning']['coordsys'],
-                      chatter=self.config['logging']['chatter'])
+            kw_gtbin = dict(algorithm='ccube',
+                            nxpix=self.npix, nypix=self.npix,
+                            binsz=self.config['binning']['binsz'],
+                            evfile=self.files['ft1'],
+                            outfile=self.files['ccube'],
+                            scfile=self.config['data']['scfile'],
+                            xref=self._xref,
+                            yref=self._yref,
+                            axisrot=0,
+                            proj=self.config['binning']['proj'],
+                            ebinalg='LOG',
+                            emin=self.config['selection']['emin'],
+                            emax=self.config['selection']['emax'],
+                            enumbins=self._enumbins,
+                            coordsys=self.config['binning']['coordsys'],
+                            chatter=self.config['logging']['chatter'])
         elif self.projtype == "HPX":
             hpx_region = "DISK(%.3f,%.3f,%.3f)" % (
                 self._xref, self._yref, 0.5 * self.config['binning']['roiwidth'])
-            kw = dict(algorithm='healpix',
-                      evfile=self.files['ft1'],
-                      outfile=self.files['ccube'],
-                      scfile=self.config['data']['scfile'],
-                      xref=self._xref,
-                      yref=self._yref,
-                      proj=self.config['binning']['proj'],
-                      hpx_ordering_scheme=self.config['binning'][
-                          'hpx_ordering_scheme'],
-                      hpx_order=self.config['binning']['hpx_order'],
-                      hpx_ebin=self.config['binning']['hpx_ebin'],
-                      hpx_region=hpx_region,
-                      ebinalg='LOG',
-                      emin=self.config['selection']['emin'],
-                      emax=self.config['selection']['emax'],
-                      enumbins=self._enumbins,
-                      coordsys=self.config['binning']['coordsys'],
-                      chatter=self.config['logging']['chatter'])
+            kw_gtbin = dict(algorithm='healpix',
+                            evfile=self.files['ft1'],
+                            outfile=self.files['ccube'],
+                            scfile=self.config['data']['scfile'],
+                            xref=self._xref,
+                            yref=self._yref,
+                            proj=self.config['binning']['proj'],
+                            hpx_ordering_scheme=self.config['binning'][
+                                'hpx_ordering_scheme'],
+                            hpx_order=self.config['binning']['hpx_order'],
+                            hpx_ebin=self.config['binning']['hpx_ebin'],
+                            hpx_region=hpx_region,
+                            ebinalg='LOG',
+                            emin=self.config['selection']['emin'],
+                            emax=self.config['selection']['emax'],
+                            enumbins=self._enumbins,
+                            coordsys=self.config['binning']['coordsys'],
+                            chatter=self.config['logging']['chatter'])
         else:
             self.logger.error(
                 'Unknown projection type, %s. Choices are WCS or HPX',
                 self.projtype)
 
-        if not os.path.isfile(self.files['ccube']) or overwrite:
-            run_gtapp('gtbin', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtbin')
-
-        evtype = self.config['selection']['evtype']
-
         if self.config['gtlike']['irfs'] == 'CALDB':
             if self.projtype == "HPX":
                 cmap = None
@@ -4738,84 +5474,220 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         else:
             cmap = 'none'
 
-        # Run gtexpcube2
-        kw = dict(infile=self.files['ltcube'], cmap=cmap,
-                  ebinalg='LOG',
-                  emin=self.config['selection']['emin'],
-                  emax=self.config['selection']['emax'],
-                  enumbins=self._enumbins,
-                  outfile=self.files['bexpmap'], proj='CAR',
-                  nxpix=360, nypix=180, binsz=1,
-                  xref=0.0, yref=0.0,
-                  evtype=evtype,
-                  irfs=self.config['gtlike']['irfs'],
-                  coordsys=self.config['binning']['coordsys'],
-                  chatter=self.config['logging']['chatter'])
-
-        if not os.path.isfile(self.files['bexpmap']) or overwrite:
-            run_gtapp('gtexpcube2', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtexpcube')
-
+        # Parameters for gtexpcube2
+        kw_gtexpcube = dict(infile=self.files['ltcube'], cmap=cmap,
+                            ebinalg='LOG',
+                            emin=self.config['selection']['emin'],
+                            emax=self.config['selection']['emax'],
+                            enumbins=self._enumbins,
+                            outfile=self.files['bexpmap'], proj='CAR',
+                            nxpix=360, nypix=180, binsz=1,
+                            xref=0.0, yref=0.0,
+                            evtype=evtype,
+                            irfs=self.config['gtlike']['irfs'],
+                            coordsys=self.config['binning']['coordsys'],
+                            chatter=self.config['logging']['chatter'])
+
+        kw_gtexpcube_roi = None
         if self.projtype == "WCS":
-            kw = dict(infile=self.files['ltcube'], cmap='none',
-                      ebinalg='LOG',
-                      emin=self.config['selection']['emin'],
-                      emax=self.config['selection']['emax'],
-                      enumbins=self._enumbins,
-                      outfile=self.files['bexpmap_roi'], proj='CAR',
-                      nxpix=self.npix, nypix=self.npix,
-                      binsz=self.config['binning']['binsz'],
-                      xref=self._xref, yref=self._yref,
-                      evtype=self.config['selection']['evtype'],
-                      irfs=self.config['gtlike']['irfs'],
-                      coordsys=self.config['binning']['coordsys'],
-                      chatter=self.config['logging']['chatter'])
-            if not os.path.isfile(self.files['bexpmap_roi']) or overwrite:
-                run_gtapp('gtexpcube2', self.logger, kw)
-            else:
-                self.logger.debug('Skipping local gtexpcube')
-        elif self.projtype == "HPX":
-            self.logger.debug('Skipping local gtexpcube for HEALPix')
-        else:
+            kw_gtexpcube_roi = dict(infile=self.files['ltcube'], cmap='none',
+                                    ebinalg='LOG',
+                                    emin=self.config['selection']['emin'],
+                                    emax=self.config['selection']['emax'],
+                                    enumbins=self._enumbins,
+                                    outfile=self.files['bexpmap_roi'],
+                                    proj='CAR',
+                                    nxpix=self.npix, nypix=self.npix,
+                                    binsz=self.config['binning']['binsz'],
+                                    xref=self._xref, yref=self._yref,
+                                    evtype=self.config['selection']['evtype'],
+                                    irfs=self.config['gtlike']['irfs'],
+                                    coordsys=self.config['binning']['coordsys'],
+                                    chatter=self.config['logging']['chatter'])
+        elif self.projtype != "HPX":
             raise Exception(
                 "Did not recognize projection type %s", self.projtype)
 
-        # Make spatial templates for extended sources
-        for s in self.roi.sources:
-            if s.diffuse:
-                continue
-            if not s.extended:
-                continue
-            self.make_template(s, self.config['file_suffix'])
+        # Parameters for gtsrcmaps
+        kw_gtsrcmaps = dict(scfile=self.config['data']['scfile'],
+                            expcube=self.files['ltcube'],
+                            cmap=self.files['ccube'],
+                            srcmdl=srcmdl_file,
+                            bexpmap=self.files['bexpmap'],
+                            outfile=self.files['srcmap'],
+                            irfs=self.config['gtlike']['irfs'],
+                            wmap=self.files['wmap'],
+                            evtype=evtype,
+                            rfactor=self.config['gtlike']['rfactor'],
+                            minbinsz=self.config['gtlike']['minbinsz'],
+                            chatter=self.config['logging']['chatter'],
+                            emapbnds='no')
+
+        if self.config['gtlike']['srcmap'] and self.config['gtlike']['bexpmap']:
+            srcmaps_apps = [('scaled_srcmap',
+                             dict(srcmap=self.config['gtlike']['srcmap'],
+                                  bexpmap=self.config['gtlike']['bexpmap'],
+                                  bexpmap_roi=self.files['bexpmap_roi']))]
+        else:
+            srcmaps_apps = [('gtsrcmaps', kw_gtsrcmaps)]
+
+        use_store = self._use_photon_store()
+        if use_store:
+            kw_select = dict(store=self.config['data']['photon_store'],
+                             evfile=self.config['data']['evfile'],
+                             outfile=self.files['ft1'],
+                             radius=kw_gtselect['rad'],
+                             emin=kw_gtselect['emin'],
+                             emax=kw_gtselect['emax'],
+                             tmin=kw_gtselect['tmin'],
+                             tmax=kw_gtselect['tmax'],
+                             zmax=kw_gtselect['zmax'],
+                             evclass=kw_gtselect['evclass'],
+                             evtype=kw_gtselect['evtype'],
+                             convtype=kw_gtselect['convtype'],
+                             scfile=self.config['data']['scfile'],
+                             filter=self.config['selection']['filter'])
+
+        def run_select(overwrite):
+            if use_store:
+                self._select_data_store(kw_select)
+            else:
+                self._select_data(kw_gtselect, kw_gtmktime)
+
+        def run_ltcube(overwrite):
+            # The LT cube depends on the event file only through its GTIs
+            digests = None
+            if self._setup_cache is not None:
+                digests = {'evfile': setup_cache.gti_digest(
+                    kw_gtltcube['evfile'])}
+            self._run_gtapp('gtltcube', kw_gtltcube, overwrite=overwrite,
+                            digests=digests)
+
+        def run_bin(overwrite):
+            if use_store and self.projtype == 'WCS':
+                self.logger.info('Binning counts cube')
+                photon_store.make_ccube(self.files['ft1'],
+                                        self.files['ccube'],
+                                        self._skywcs, self.npix,
+                                        self._ebin_edges)
+            else:
+                self._run_gtapp('gtbin', kw_gtbin, overwrite=overwrite)
 
-        # Write ROI XML
-        # if not os.path.isfile(srcmdl_file):
-        self.roi.write_xml(srcmdl_file)
+        use_native_expcube = self._use_native_expcube()
 
-        # Run gtsrcmaps
-        kw = dict(scfile=self.config['data']['scfile'],
-                  expcube=self.files['ltcube'],
-                  cmap=self.files['ccube'],
-                  srcmdl=srcmdl_file,
-                  bexpmap=self.files['bexpmap'],
-                  outfile=self.files['srcmap'],
-                  irfs=self.config['gtlike']['irfs'],
-                  wmap=self.files['wmap'],
-                  evtype=evtype,
-                  rfactor=self.config['gtlike']['rfactor'],
-                  #                   resample=self.config['resample'],
-                  minbinsz=self.config['gtlike']['minbinsz'],
-                  chatter=self.config['logging']['chatter'],
-                  emapbnds='no')
+        def run_expcube(overwrite):
+            self._run_gtapp('gtexpcube2', kw_gtexpcube, overwrite=overwrite)
+            if kw_gtexpcube_roi is None:
+                return
+            if use_native_expcube:
+                self._make_exposure_cube(kw_gtexpcube_roi)
+            else:
+                self._run_gtapp('gtexpcube2', kw_gtexpcube_roi,
+                                overwrite=overwrite)
 
-        if not os.path.isfile(self.files['srcmap']) or overwrite:
-            if self.config['gtlike']['srcmap'] and self.config['gtlike']['bexpmap']:
+        def run_srcmaps(overwrite):
+            if srcmaps_apps[0][0] == 'scaled_srcmap':
                 self._make_scaled_srcmap()
             else:
-                run_gtapp('gtsrcmaps', self.logger, kw)
+                run_gtapp('gtsrcmaps', self.logger, kw_gtsrcmaps)
+            self.srcmap_store.invalidate()
+
+        pipeline = SetupPipeline(self.files['setup_manifest'], self.logger)
+
+        if use_store:
+            apps = [('photon_store', kw_select)]
+        else:
+            apps = [('gtselect', kw_gtselect)]
+            if kw_gtmktime is not None:
+                apps += [('gtmktime', kw_gtmktime)]
+        transient = not self.config['data']['cacheft1']
+        pipeline.add_stage(SetupStage('select', run_select,
+                                      outputs=[self.files['ft1']],
+                                      apps=apps, transient=transient))
+
+        ltcube_deps = []
+        if self._ext_ltcube:
+            self.logger.debug('Using external LT cube.')
+        else:
+            pipeline.add_stage(SetupStage('ltcube', run_ltcube,
+                                          outputs=[self.files['ltcube']],
+                                          apps=[('gtltcube', kw_gtltcube)],
+                                          deps=['select']))
+            ltcube_deps = ['ltcube']
+
+        if use_store and self.projtype == 'WCS':
+            apps = [('make_ccube', kw_gtbin)]
         else:
-            self.logger.debug('Skipping gtsrcmaps')
+            apps = [('gtbin', kw_gtbin)]
+        pipeline.add_stage(SetupStage('bin', run_bin,
+                                      outputs=[self.files['ccube']],
+                                      apps=apps, deps=['select']))
+
+        apps = [('gtexpcube2', kw_gtexpcube)]
+        outputs = [self.files['bexpmap']]
+        if kw_gtexpcube_roi is not None:
+            if use_native_expcube:
+                apps += [('native_expcube', kw_gtexpcube_roi)]
+            else:
+                apps += [('gtexpcube2', kw_gtexpcube_roi)]
+            outputs += [self.files['bexpmap_roi']]
+        pipeline.add_stage(SetupStage('expcube', run_expcube,
+                                      outputs=outputs, apps=apps,
+                                      deps=ltcube_deps + ['bin']))
+
+        # The model file is rewritten on every setup so it is
+        # identified by its contents
+        digests = {'srcmdl': setup_cache.md5_file(srcmdl_file)}
+        pipeline.add_stage(SetupStage('srcmaps', run_srcmaps,
+                                      outputs=[self.files['srcmap']],
+                                      apps=srcmaps_apps,
+                                      deps=ltcube_deps + ['bin', 'expcube'],
+                                      digests=digests))
+
+        return pipeline
+
+    def _run_gtapp(self, appname, kw, overwrite=False, digests=None):
+        """Run an ST application that generates the file ``outfile``.
+        If a setup cache is configured the output file is linked from
+        the cache when a product generated with the same application,
+        parameters, and inputs is available and otherwise added to
+        the cache after running the application."""
+
+        if self._setup_cache is None:
+            run_gtapp(appname, self.logger, kw)
+            return
+
+        outfile = kw['outfile']
+        key = self._setup_cache.get_key(appname, kw, digests)
+        if not overwrite and self._setup_cache.fetch(key, outfile):
+            self.logger.info('Using cached %s output %s', appname, key)
+            return
+
+        # Never write into a file that may be linked to the cache
+        if os.path.lexists(outfile):
+            os.remove(outfile)
+
+        run_gtapp(appname, self.logger, kw)
+        self._setup_cache.store(key, outfile)
+
+    def _setup_likelihood(self):
+        """Load the products of `_setup_files` and create the
+        likelihood object of this component."""
+
+        t0 = time.time()
+
+        self.logger.debug('Loading LT Cube %s', self.files['ltcube'])
+        self._ltc = self._load_ltcube(self.files['ltcube'])
+
+        self.logger.debug('Creating PSF model')
+        psf_cachedir = None
+        if self._setup_cache is not None:
+            psf_cachedir = self._setup_cache.psfdir
+        self._psf = irfs.PSFModel(self.roi.skydir, self._ltc,
+                                  self.config['gtlike']['irfs'],
+                                  self.config['selection']['evtype'],
+                                  self.log_energies,
+                                  cachedir=psf_cachedir)
 
         # Create templates for extended sources
         self._update_srcmap_file(None, True)
@@ -4826,44 +5698,139 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             self.logger.debug('Deleting FT1 file.')
             os.remove(self.files['ft1'])
 
-        self.logger.info('Finished setup for Analysis Component: %s',
-                         self.name)
+        SetupPipeline(self.files['setup_manifest'],
+                      self.logger).record('likelihood', time.time() - t0)
 
-    def _select_data(self, overwrite=False):
+    def _use_photon_store(self):
+        """Check whether event selection can be performed with the
+        photon store backend."""
 
-        # Run gtselect and gtmktime
-        kw_gtselect = dict(infile=self.config['data']['evfile'],
-                           outfile=self.files['ft1'],
-                           ra=self.roi.skydir.ra.deg,
-                           dec=self.roi.skydir.dec.deg,
-                           rad=self.config['selection']['radius'],
-                           convtype=self.config['selection']['convtype'],
-                           phasemin=self.config['selection']['phasemin'],
-                           phasemax=self.config['selection']['phasemax'],
-                           evtype=self.config['selection']['evtype'],
-                           evclass=self.config['selection']['evclass'],
-                           tmin=self.config['selection']['tmin'],
-                           tmax=self.config['selection']['tmax'],
-                           emin=self.config['selection']['emin'],
-                           emax=self.config['selection']['emax'],
-                           zmax=self.config['selection']['zmax'],
-                           chatter=self.config['logging']['chatter'])
+        if self.config['data']['photon_store'] is None:
+            return False
 
-        kw_gtmktime = dict(evfile=self.files['ft1'],
-                           outfile=self.files['ft1_filtered'],
-                           scfile=self.config['data']['scfile'],
-                           roicut=self.config['selection']['roicut'],
-                           filter=self.config['selection']['filter'])
+        sel = self.config['selection']
+        unsupported = []
+        if sel['roicut'] == 'yes':
+            unsupported += ['roicut']
+        if sel['phasemin'] is not None or sel['phasemax'] is not None:
+            unsupported += ['phasemin/phasemax']
+        if sel['filter'] is not None:
+            if self.config['data']['scfile'] is None:
+                unsupported += ['filter without scfile']
+            else:
+                try:
+                    photon_store.check_filter(sel['filter'],
+                                              self.config['data']['scfile'])
+                except ValueError as e:
+                    unsupported += ['filter (%s)' % e]
+
+        if unsupported:
+            self.logger.warning('Selection options not supported by the '
+                                'photon store: %s.  Using gtselect.',
+                                ', '.join(unsupported))
+            return False
+        return True
 
-        if not os.path.isfile(self.files['ft1']) or overwrite:
-            run_gtapp('gtselect', self.logger, kw_gtselect)
-            if self.config['selection']['roicut'] == 'yes' or \
-                    self.config['selection']['filter'] is not None:
-                run_gtapp('gtmktime', self.logger, kw_gtmktime)
-                os.system('mv %s %s' % (self.files['ft1_filtered'],
-                                        self.files['ft1']))
-        else:
-            self.logger.debug('Skipping gtselect')
+    def _use_native_expcube(self):
+        """Check whether the ROI exposure cube can be computed with
+        the native exposure calculation."""
+
+        if self.config['gtlike']['expcube_backend'] == 'gtexpcube2':
+            return False
+        elif self.config['gtlike']['expcube_backend'] != 'native':
+            raise Exception('Unrecognized exposure cube backend: %s' %
+                            self.config['gtlike']['expcube_backend'])
+
+        if self.config['gtlike']['irfs'] == 'CALDB':
+            self.logger.warning('Native exposure calculation requires an '
+                                'explicit IRF name.  Using gtexpcube2.')
+            return False
+        return True
+
+    def _load_ltcube(self, ltfile, radius=None):
+        """Load the LT cube of this component.  For WCS projections
+        only the pixels of a disk centered on the ROI are read.  The
+        loaded cube is persisted in the setup cache if one is
+        configured.
+
+        Parameters
+        ----------
+        ltfile : str
+            Path to the LT cube file.
+
+        radius : float
+            Radius in degrees of the disk.  By default the disk
+            encloses the counts map of this component.
+        """
+
+        cachedir = None
+        if self._setup_cache is not None:
+            cachedir = self._setup_cache.ltcubedir
+
+        # The region can only be defined for a single LT cube file
+        region = None
+        if self.projtype == 'WCS' and os.path.isfile(ltfile) and \
+                re.search('\.txt?', ltfile) is None:
+            if radius is None:
+                radius = (np.sqrt(2.) * 0.5 * self.npix *
+                          self.config['binning']['binsz'])
+            coordsys = fits.getheader(ltfile, 'EXPOSURE').get('COORDSYS',
+                                                              'CEL')
+            # Include every pixel that overlaps the disk such that the
+            # pixel containing any direction in the disk is loaded
+            region = create_hpx_disk_region_string(self.roi.skydir,
+                                                   coordsys, radius,
+                                                   inclusive=4)
+
+        return irfs.LTCube.create(ltfile, cachedir=cachedir, region=region)
+
+    def _make_exposure_cube(self, kw):
+        """Compute the exposure cube defined by the gtexpcube2
+        parameters ``kw`` from the LT cube and the effective area."""
+
+        self.logger.info('Computing exposure cube %s', kw['outfile'])
+        t0 = time.time()
+
+        radius = (np.sqrt(2.) * 0.5 * max(kw['nxpix'], kw['nypix']) *
+                  kw['binsz'])
+        ltc = self._load_ltcube(kw['infile'], radius)
+        wcs = wcs_utils.create_wcs(self.roi.skydir,
+                                   coordsys=kw['coordsys'],
+                                   projection=kw['proj'],
+                                   cdelt=kw['binsz'],
+                                   crpix=(1.0 + 0.5 * (kw['nxpix'] - 1),
+                                          1.0 + 0.5 * (kw['nypix'] - 1)))
+        log_energies = np.linspace(np.log10(kw['emin']),
+                                   np.log10(kw['emax']),
+                                   kw['enumbins'] + 1)
+        irfs.make_exposure_cube(kw['outfile'], ltc, kw['irfs'],
+                                kw['evtype'], log_energies, wcs=wcs,
+                                npix=(kw['nxpix'], kw['nypix']))
+
+        self.logger.debug('Finished exposure cube (%.2f s)',
+                          time.time() - t0)
+
+    def _select_data_store(self, kw):
+        """Select the events of this component from the photon store
+        and write them to the FT1 file of the component."""
+
+        kw = copy.deepcopy(kw)
+        store = photon_store.PhotonStore.open(kw.pop('store'),
+                                              kw.pop('evfile'),
+                                              logger=self.logger)
+        outfile = kw.pop('outfile')
+        self.logger.info('Selecting events from photon store %s',
+                         store.path)
+        store.write_ft1(outfile, self.roi.skydir, **kw)
+
+    def _select_data(self, kw_gtselect, kw_gtmktime=None):
+
+        # Run gtselect and gtmktime
+        run_gtapp('gtselect', self.logger, kw_gtselect)
+        if kw_gtmktime is not None:
+            run_gtapp('gtmktime', self.logger, kw_gtmktime)
+            os.system('mv %s %s' % (self.files['ft1_filtered'],
+                                    self.files['ft1']))
 
     def _create_binned_analysis(self, xmlfile=None):
 
@@ -4919,29 +5886,32 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         # Apply exposure corrections
         self._scale_srcmap(self._src_expscale)
 
-    def _scale_srcmap(self, scale_map):
-        srcmap = fits.open(self.files['srcmap'])
+    def _scale_srcmap(self, scale_map, build_fixed_wts=True):
 
-        for hdu in srcmap[1:]:
-            if hdu.name not in scale_map:
-                continue
+        with srcmap_utils.lock_source_maps(self.files['srcmap']):
 
-            scale = scale_map[hdu.name]
-            if scale<1e-20:
-                self.logger.warning("The expscale parameter was zero, setting it to 1e-8")
-                scale = 1e-8
-            if 'EXPSCALE' in hdu.header:
-                old_scale = hdu.header['EXPSCALE']
-            else:
-                old_scale = 1.0
-            hdu.data *= scale/old_scale
-            hdu.header['EXPSCALE'] = scale
+            with fits.open(self.files['srcmap'], mode='update',
+                           memmap=True) as srcmap:
+
+                for hdu in srcmap[1:]:
+                    if hdu.name not in scale_map:
+                        continue
 
-        srcmap.writeto(self.files['srcmap'], clobber=True)
+                    scale = scale_map[hdu.name]
+                    if scale<1e-20:
+                        self.logger.warning("The expscale parameter was zero, setting it to 1e-8")
+                        scale = 1e-8
+                    if 'EXPSCALE' in hdu.header:
+                        old_scale = hdu.header['EXPSCALE']
+                    else:
+                        old_scale = 1.0
+                    hdu.data *= scale/old_scale
+                    hdu.header['EXPSCALE'] = scale
 
         for name in scale_map.keys():
             self.like.logLike.eraseSourceMap(str(name))
-        self.like.logLike.buildFixedModelWts()
+        if build_fixed_wts:
+            self.like.logLike.buildFixedModelWts()
 
     def _make_scaled_srcmap(self):
         """Make an exposure cube with the same binning as the counts map."""
@@ -4950,7 +5920,6 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
 
         bexp0 = fits.open(self.files['bexpmap_roi'])
         bexp1 = fits.open(self.config['gtlike']['bexpmap'])
-        srcmap = fits.open(self.config['gtlike']['srcmap'])
 
         if bexp0[0].data.shape != bexp1[0].data.shape:
             raise Exception('Wrong shape for input exposure map file.')
@@ -4963,15 +5932,20 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
                                                                bexp_ratio),
                                                            np.max(bexp_ratio)))
 
-        for hdu in srcmap[1:]:
+        # Copy the input file and rescale the maps in place
+        with srcmap_utils.lock_source_maps(self.files['srcmap']):
 
-            if hdu.name == 'GTI':
-                continue
-            if hdu.name == 'EBOUNDS':
-                continue
-            hdu.data *= bexp_ratio
+            shutil.copy(self.config['gtlike']['srcmap'], self.files['srcmap'])
+            with fits.open(self.files['srcmap'], mode='update',
+                           memmap=True) as srcmap:
+
+                for hdu in srcmap[1:]:
 
-        srcmap.writeto(self.files['srcmap'], clobber=True)
+                    if hdu.name == 'GTI':
+                        continue
+                    if hdu.name == 'EBOUNDS':
+                        continue
+                    hdu.data *= bexp_ratio
 
     def restore_counts_maps(self):
 
@@ -4980,9 +5954,8 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if hasattr(self.like.logLike, 'setCountsMap'):
             self.like.logLike.setCountsMap(np.ravel(cmap.counts.astype(float)))
 
-        srcmap_utils.update_source_maps(self.files['srcmap'],
-                                        {'PRIMARY': cmap.counts},
-                                        logger=self.logger)
+        self.srcmap_store.update({'PRIMARY': cmap.counts},
+                                 logger=self.logger)
 
     def simulate_roi(self, name=None, clear=True, randomize=True):
         """Simulate the whole ROI or inject a simulation of one or
@@ -5018,9 +5991,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if hasattr(self.like.logLike, 'setCountsMap'):
             self.like.logLike.setCountsMap(np.ravel(data))
 
-        srcmap_utils.update_source_maps(self.files['srcmap'],
-                                        {'PRIMARY': data},
-                                        logger=self.logger)
+        self.srcmap_store.update({'PRIMARY': data}, logger=self.logger)
         fits_utils.write_fits_image(data, self.wcs, self.files['ccubemc'])
 
     def write_model_map(self, model_name=None, name=None):
@@ -5081,8 +6052,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if not os.path.isfile(self.files['srcmap']):
             return
 
-        hdulist = fits.open(self.files['srcmap'])
-        hdunames = [hdu.name.upper() for hdu in hdulist]
+        hdunames = self.srcmap_store.names()
 
         srcmaps = {}
 
@@ -5124,8 +6094,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if srcmaps:
             self.logger.debug(
                 'Updating source map file for component %s.', self.name)
-            srcmap_utils.update_source_maps(self.files['srcmap'], srcmaps,
-                                            logger=self.logger)
+            self.srcmap_store.update(srcmaps, logger=self.logger)
 
     def _update_srcmap(self, name, skydir, spatial_model, spatial_width):
 
@@ -5133,13 +6102,21 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         xpix, ypix = wcs_utils.skydir_to_pix(skydir, self._skywcs)
         xpix -= (self.npix - 1.0) / 2.
         ypix -= (self.npix - 1.0) / 2.
-        rebin = min(int(np.ceil(self.binsz/0.01)),8)        
-        k = srcmap_utils.make_srcmap(self.roi.skydir, self._psf, spatial_model,
-                                     spatial_width,
-                                     npix=self.npix, xpix=xpix, ypix=ypix,
-                                     cdelt=self.config['binning']['binsz'],
-                                     rebin=rebin,
-                                     psf_scale_fn=src['psf_scale_fn'])
+
+        k = self._shift_srcmap(name, spatial_model, spatial_width, xpix, ypix)
+
+        if k is None:
+            rebin = min(int(np.ceil(self.binsz/0.01)),8)        
+            k = srcmap_utils.make_srcmap(self.roi.skydir, self._psf,
+                                         spatial_model, spatial_width,
+                                         npix=self.npix, xpix=xpix, ypix=ypix,
+                                         cdelt=self.config['binning']['binsz'],
+                                         rebin=rebin,
+                                         psf_scale_fn=src['psf_scale_fn'])
+
+            if self.config['gtlike']['srcmap_shift_tol'] > 0:
+                self._srcmap_kernels[name] = (spatial_model, spatial_width,
+                                              xpix, ypix, k)
 
         self.like.logLike.setSourceMapImage(str(name), np.ravel(k))
 
@@ -5147,6 +6124,29 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if not normPar.isFree():
             self.like.logLike.buildFixedModelWts()
 
+    def _shift_srcmap(self, name, spatial_model, spatial_width, xpix, ypix):
+        """Generate the source map of a source at a new position by
+        translating the last kernel built for this source with
+        `~fermipy.srcmap_utils.shift_kernel`.  Returns None if the
+        offset from the position of that kernel exceeds
+        ``srcmap_shift_tol`` or the shifted kernel fails the flux
+        conservation check."""
+
+        shift_tol = self.config['gtlike']['srcmap_shift_tol']
+        if not shift_tol or name not in self._srcmap_kernels:
+            return None
+
+        model0, width0, xpix0, ypix0, k0 = self._srcmap_kernels[name]
+        if model0 != spatial_model or width0 != spatial_width:
+            return None
+
+        dx = xpix - xpix0
+        dy = ypix - ypix0
+        if max(np.abs(dx), np.abs(dy)) > shift_tol:
+            return None
+
+        return srcmap_utils.shift_kernel(k0, dx, dy)
+
     def generate_model(self, model_name=None, outfile=None):
         """Generate a counts model map from an XML model file using
         gtmodel.
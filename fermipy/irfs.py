@@ -1,17 +1,25 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import, division, print_function
+import os
 import glob
 import re
+import errno
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
 import healpy as hp
 from astropy.io import fits
+from astropy.coordinates import SkyCoord
 
 import pyIrfLoader
 
 pyIrfLoader.Loader_go()
 
 from fermipy import utils
+from fermipy import wcs_utils
 from fermipy.utils import edge_to_center
 from fermipy.utils import edge_to_width
 from fermipy.skymap import HpxMap
@@ -100,6 +108,100 @@ def compute_ps_counts(ebins, exp, psf, bkg, fn, egy_dim=0):
     return sigc, bkgc
 
 
+def compute_ps_counts_table(ebins, exp, log_energies, psf, bkg, fn,
+                            fraction=0.68):
+    """Calculate the observed signal and background counts for a set
+    of sky directions.  This is equivalent to calling
+    `compute_ps_counts` for each direction with a PSF model built from
+    its PSF table but evaluates all directions at once.
+
+    Parameters
+    ----------
+    ebins : `~numpy.ndarray`
+        Array of energy bin edges.
+
+    exp : `~numpy.ndarray`
+        Exposure at the energy bin centers with shape (nebins, ndir).
+
+    log_energies : `~numpy.ndarray`
+        Energies in log10(E/MeV) at which the PSF tables are
+        evaluated.
+
+    psf : `~numpy.ndarray`
+        PSF tables with shape (ndtheta + 1, len(log_energies), ndir)
+        evaluated on the offset grid returned by
+        `PSFModel.create_dtheta` (e.g. the tables returned by
+        `PSFModel.create_average_psf` for an array of sky
+        directions).
+
+    bkg : `~numpy.ndarray`
+        Background intensities with shape (nebins, ndir).
+
+    fn : `~fermipy.spectrum.SpectralFunction`
+
+    fraction : float
+        Containment fraction of the PSF that sets the scale of the
+        angular bins.
+
+    Returns
+    -------
+    sigc, bkgc : `~numpy.ndarray`
+        Signal and background counts with shape (nebins, nbins, ndir).
+    """
+    ewidth = utils.edge_to_width(ebins)
+    ectr = np.exp(utils.edge_to_center(np.log(ebins)))
+    dtheta = PSFModel.create_dtheta(psf.shape[0] - 1)
+    ie = np.arange(len(ectr))[:, np.newaxis]
+    ip = np.arange(psf.shape[2])[np.newaxis, :]
+    # Interpolate log(PSF) to the energy bin centers.  log(PSF) is
+    # piecewise linear in offset angle such that this commutes with
+    # the interpolation in offset angle of `PSFModel.interp`.
+    egy = np.asarray(log_energies)
+    loge = np.log10(ectr)
+    jdx = np.clip(np.searchsorted(egy, loge) - 1, 0, len(egy) - 2)
+    we = ((loge - egy[jdx]) / (egy[jdx + 1] - egy[jdx]))[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_psf = np.log(psf)
+        log_psf = (1.0 - we) * log_psf[:, jdx] + we * log_psf[:, jdx + 1]
+    vals = np.exp(log_psf)
+
+    # Containment angle (see `PSFModel.containment_angle`)
+    dth = np.radians(dtheta)[:, np.newaxis, np.newaxis]
+    csum = np.cumsum((dth[1:] - dth[:-1]) * np.pi *
+                     (vals[1:] * np.sin(dth[1:]) +
+                      vals[:-1] * np.sin(dth[:-1])), axis=0)
+    j = np.sum(csum <= fraction, axis=0) - 1
+    jc = np.clip(j, 0, len(csum) - 2)
+    x0, x1 = csum[jc, ie, ip], csum[jc + 1, ie, ip]
+    y0, y1 = dth[1:, 0, 0][jc], dth[1:, 0, 0][jc + 1]
+    theta68 = np.degrees(y0 + (fraction - x0) * (y1 - y0) / (x1 - x0))
+    theta68[j < 0] = dtheta[1]
+    theta68[j >= len(csum) - 1] = dtheta[-1]
+
+    theta_edges = (np.linspace(0.0, 3.0, 31)[np.newaxis, :, np.newaxis] *
+                   theta68[:, np.newaxis, :])
+    theta = 0.5 * (theta_edges[:, :-1] + theta_edges[:, 1:])
+    domega = np.pi * (theta_edges[:, 1:]**2 - theta_edges[:, :-1]**2)
+
+    # Evaluate the PSF at the bin centers with linear interpolation
+    # of log(PSF) in offset angle
+    idx = np.clip(np.searchsorted(dtheta, theta, side='right') - 1,
+                  0, len(dtheta) - 2)
+    ie, ip = ie[:, :, np.newaxis], ip[:, np.newaxis, :]
+    v0, v1 = log_psf[idx, ie, ip], log_psf[idx + 1, ie, ip]
+    w = (theta - dtheta[idx]) / (dtheta[idx + 1] - dtheta[idx])
+    sig_pdf = domega * np.exp(v0 + w * (v1 - v0)) * (np.pi / 180.)**2
+    sig_flux = fn.flux(ebins[:-1], ebins[1:])
+
+    # Background and signal counts
+    bkgc = bkg[:, np.newaxis, :] * domega * exp[:, np.newaxis, :] * \
+        ewidth[:, np.newaxis, np.newaxis] * (np.pi / 180.)**2
+    sigc = sig_pdf * sig_flux[:, np.newaxis, np.newaxis] * \
+        exp[:, np.newaxis, :]
+
+    return sigc, bkgc
+
+
 def compute_norm(sig, bkg, ts_thresh, min_counts, sum_axes=None):
     """Solve for the normalization of the signal distribution at which the
     detection test statistic (twice delta-loglikelihood ratio) is >=
@@ -138,11 +240,23 @@ def compute_norm(sig, bkg, ts_thresh, min_counts, sum_axes=None):
     sig_sum = np.apply_over_axes(np.sum, sig, sum_axes)
     sig_scale = sig_scale * min_counts / sig_sum
     ts = np.apply_over_axes(np.sum, poisson_ts(sig * sig_scale, bkg), sum_axes)
-    vals = np.ones(ts.shape[:-1])
+    sig_scale = sig_scale * np.ones(ts.shape)
+
+    # Interpolate the threshold crossing of every TS curve at once.
+    # Each curve is monotonically increasing so the index of the
+    # bracketing interval is the number of points below threshold.
+    nscale = ts.shape[-1]
+    ts = ts.reshape(-1, nscale)
+    sig_scale = sig_scale.reshape(-1, nscale)
+    rows = np.arange(ts.shape[0])
+    idx = np.sum(ts <= ts_thresh, axis=1) - 1
+    idx = np.clip(idx, 0, nscale - 2)
 
-    for idx, v in np.ndenumerate(ts[..., 0]):
-        vals[idx] = np.interp(ts_thresh, ts[idx], sig_scale[idx])
-    return vals
+    x0, x1 = ts[rows, idx], ts[rows, idx + 1]
+    y0, y1 = sig_scale[rows, idx], sig_scale[rows, idx + 1]
+    w = np.clip((ts_thresh - x0) / (x1 - x0), 0.0, 1.0)
+    vals = y0 + w * (y1 - y0)
+    return vals.reshape(sig_sum.shape[:-1])
 
 
 class Exposure(HpxMap):
@@ -151,48 +265,382 @@ class Exposure(HpxMap):
         HpxMap.__init__(self, data, hpx)
 
     @staticmethod
-    def create(ltc, event_class, event_types, log_energies):
+    def create(ltc, event_class, event_types, log_energies, region=None):
+        """Create an exposure map with the pixelization of a livetime
+        cube.
 
-        exp = np.zeros((len(log_energies), ltc.hpx.npix))
-        for et in event_types:
-            aeff = create_aeff(event_class, et, log_energies, ltc.costh_center)
-            exp += np.sum(aeff.T[:, :, np.newaxis] *
-                          ltc.data[:, np.newaxis, :], axis=0)
+        Parameters
+        ----------
+        ltc : `~fermipy.irfs.LTCube`
+
+        event_class : str
+            Event class string (e.g. P8R2_SOURCE_V6).
+
+        event_types : list or int
+            List of event types or an event type bitmask.
+
+        log_energies : `~numpy.ndarray`
+            Evaluation points in log10(E/MeV).
+
+        region : str
+            HEALPix region string (e.g. ``DISK(lon,lat,radius)``) in
+            the coordinate system of the livetime cube.  If defined
+            the exposure is only computed for the pixels inside the
+            region.
+        """
+
+        hpx = HPX(ltc.hpx.nside, ltc.hpx.nest, ltc.hpx.coordsys,
+                  region=region, ebins=log_energies)
 
-        hpx = HPX(ltc.hpx.nside, ltc.hpx.nest,
-                  ltc.hpx.coordsys, ebins=log_energies)
+        ipix = None
+        if region is not None:
+            ipix = HPX.get_index_list(hpx.nside, hpx.nest, region)
+        exp = compute_ltcube_exposure(ltc, event_class, event_types,
+                                      log_energies, ipix)
         return Exposure(exp, hpx)
 
 
+def compute_ltcube_exposure(ltc, event_class, event_types, log_energies,
+                            ipix=None):
+    """Compute the exposure of a set of livetime cube pixels.  The
+    effective area of each event type is corrected for the
+    livetime-dependent efficiency of the IRFs in the same way as
+    gtexpcube2.  The efficiency is linear in the livetime fraction
+    (see `create_efficiency`) and is applied by weighting the livetime
+    (EXPOSURE table of the livetime cube) and the livetime weighted by
+    the livetime fraction (WEIGHTED_EXPOSURE table) with the two
+    efficiency factors.  No correction is applied if the livetime
+    cube does not have weighted livetimes.
+
+    Parameters
+    ----------
+    ltc : `~fermipy.irfs.LTCube`
+
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_types : list or int
+        List of event types or an event type bitmask.
+
+    log_energies : `~numpy.ndarray`
+        Evaluation points in log10(E/MeV).
+
+    ipix : `~numpy.ndarray`
+        Indices of the livetime cube pixels.  If None the exposure of
+        all pixels is computed.
+
+    Returns
+    -------
+    exp : `~numpy.ndarray`
+        Exposure in cm^2 s with shape (len(log_energies), npix).
+    """
+
+    lt, lt_wt = ltc.data, ltc.data_wt
+    if ipix is not None:
+        lt = lt[:, ipix]
+        lt_wt = lt_wt[:, ipix] if lt_wt is not None else None
+
+    # Contract over incidence angle without forming an intermediate
+    # array with the energy and pixel dimensions
+    if lt_wt is None:
+        aeff = create_aeff_sum(event_class, event_types, log_energies,
+                               ltc.costh_center)
+        return np.dot(aeff, lt)
+
+    aeff1, aeff2 = create_aeff_sum(event_class, event_types, log_energies,
+                                   ltc.costh_center, efficiency=True)
+    return np.dot(aeff1, lt) + np.dot(aeff2, lt_wt)
+
+
+def compute_exposure(skydir, ltc, event_class, event_types, log_energies):
+    """Compute the exposure at a set of sky directions.  The
+    livetime distribution of each direction is taken from the
+    livetime cube pixel that contains it.  The effective area is
+    evaluated once for each energy and incidence angle bin and the
+    exposure of every distinct livetime cube pixel is computed with
+    a single matrix product (see `compute_ltcube_exposure`).
+
+    Parameters
+    ----------
+    skydir : `~astropy.coordinates.SkyCoord`
+        Sky directions at which the exposure will be evaluated.
+
+    ltc : `~fermipy.irfs.LTCube`
+
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_types : list or int
+        List of event types or an event type bitmask.
+
+    log_energies : `~numpy.ndarray`
+        Evaluation points in log10(E/MeV).
+
+    Returns
+    -------
+    exp : `~numpy.ndarray`
+        Exposure in cm^2 s with shape (len(log_energies),) +
+        skydir.shape.
+    """
+
+    ipix = ltc.get_skydir_ipix(skydir)
+    upix, idx = np.unique(np.ravel(ipix), return_inverse=True)
+    exp = compute_ltcube_exposure(ltc, event_class, event_types,
+                                  log_energies, upix)[:, idx]
+    return exp.reshape((len(log_energies),) + np.shape(ipix))
+
+
+def make_exposure_cube(outfile, ltc, event_class, event_types,
+                       log_energies, wcs=None, npix=None, hpx=None):
+    """Write a binned exposure cube for a WCS or HEALPix geometry.
+    The output file has the same format as the exposure cubes
+    generated by gtexpcube2.
+
+    Parameters
+    ----------
+    outfile : str
+        Path to the output file.
+
+    ltc : `~fermipy.irfs.LTCube`
+
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_types : list or int
+        List of event types or an event type bitmask.
+
+    log_energies : `~numpy.ndarray`
+        Energies in log10(E/MeV) at which the exposure will be
+        evaluated.  Following gtexpcube2 these are the edges of the
+        energy bins of the counts cube.
+
+    wcs : `~astropy.wcs.WCS`
+        Spatial WCS of the output cube.
+
+    npix : int or tuple
+        Number of pixels in the x and y dimensions of the WCS.
+
+    hpx : `~fermipy.hpx_utils.HPX`
+        HEALPix geometry of the output cube.  Used in place of
+        ``wcs`` if provided.
+    """
+
+    if hpx is not None:
+        lon, lat = hpx.get_sky_coords().T
+        frame = 'galactic' if hpx.coordsys == 'GAL' else 'icrs'
+        skydir = SkyCoord(lon, lat, unit='deg', frame=frame)
+        exp = compute_exposure(skydir, ltc, event_class, event_types,
+                               log_energies)
+        hpx = HPX(hpx.nside, hpx.nest, hpx.coordsys, region=hpx.region,
+                  ebins=log_energies)
+        hpx.write_fits(exp, outfile, clobber=True)
+        return
+
+    npix = np.ravel(npix) * np.ones(2, dtype=int)
+    xpix, ypix = np.meshgrid(np.arange(npix[0]), np.arange(npix[1]))
+    skydir = SkyCoord.from_pixel(xpix, ypix, wcs, origin=0)
+    exp = compute_exposure(skydir, ltc, event_class, event_types,
+                           log_energies)
+
+    w = wcs_utils.wcs_add_energy_axis(wcs, 10 ** log_energies)
+    ecol = fits.Column(name='Energy', format='D', array=10 ** log_energies)
+    hdu_energies = fits.BinTableHDU.from_columns([ecol], name='ENERGIES')
+    hdu_image = fits.PrimaryHDU(exp.astype(np.float32),
+                                header=w.to_header())
+    hdu_image.header['CUNIT3'] = 'MeV'
+    hdu_image.header['BUNIT'] = 'cm**2 s'
+
+    hdulist = fits.HDUList([hdu_image, hdu_energies])
+    hdulist.writeto(outfile, clobber=True)
+
+
+class PSFModelCache(object):
+    """Least-recently-used cache of the tables of `PSFModel`.  The
+    average PSF of a direction depends on the livetime cube only
+    through the livetime distribution of the pixel containing that
+    direction.  Tables are keyed by a checksum of that distribution
+    together with the pixel index, IRF, event types, energies, and
+    angular grid such that analyses of nearby ROIs and repeated
+    setups of the same ROI reuse the same table.
+
+    If a cache directory is given to `get` and `put` the tables are
+    also persisted to disk.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of tables kept in memory.
+    """
+
+    def __init__(self, max_entries=32):
+        self._max_entries = max_entries
+        self._cache = OrderedDict()
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def get_key(skydir, ltc, event_class, event_types, log_energies,
+                dtheta, cth_min, ncth):
+        """Compute the cache key of a PSF table."""
+
+        ipix = int(ltc.get_skydir_ipix(skydir))
+        m = hashlib.sha1()
+        m.update(np.ascontiguousarray(ltc.data[:, ipix],
+                                      dtype=float).tobytes())
+        m.update(np.asarray(ltc.costh_edges, dtype=float).tobytes())
+        m.update(repr((ipix, ltc.hpx.nside, ltc.hpx.nest,
+                       ltc.hpx.coordsys, str(event_class),
+                       [str(t) for t in event_types],
+                       float(cth_min), int(ncth))).encode())
+        m.update(np.asarray(log_energies, dtype=float).tobytes())
+        m.update(np.asarray(dtheta, dtype=float).tobytes())
+        return m.hexdigest()
+
+    def get(self, key, cachedir=None):
+        """Return the (psf, exp) tuple stored under ``key`` or None
+        if it is not found in memory or in ``cachedir``."""
+
+        if key in self._cache:
+            v = self._cache.pop(key)
+            self._cache[key] = v
+            return v
+
+        if cachedir is None:
+            return None
+
+        try:
+            with np.load(os.path.join(cachedir, key + '.npz')) as f:
+                v = (f['psf'], f['exp'])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+        self._add(key, v)
+        return v
+
+    def put(self, key, psf, exp, cachedir=None):
+        """Add a PSF table and its exposure to the cache."""
+
+        self._add(key, (psf, exp))
+        if cachedir is not None:
+            _write_npz(os.path.join(cachedir, key + '.npz'), psf=psf, exp=exp)
+
+    def _add(self, key, v):
+        self._cache[key] = v
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+
+# Process-wide cache of PSF tables used by PSFModel
+psf_cache = PSFModelCache()
+
+
 class PSFModel(object):
+    """Model for the PSF averaged over the observing profile of a sky
+    direction.
+
+    Parameters
+    ----------
+    skydir : `~astropy.coordinates.SkyCoord`
+
+    ltc : `~fermipy.irfs.LTCube`
+
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_types : list or int
+        List of event types or an event type bitmask.
+
+    log_energies : `~numpy.ndarray`
+        Evaluation points in log10(E/MeV).
+
+    use_cache : bool
+        Reuse the PSF table from `psf_cache` if one was computed for
+        the same livetime cube pixel and parameters.
+
+    cachedir : str
+        Directory in which PSF tables are persisted.  If None tables
+        are only cached in memory.
+    """
 
     def __init__(self, skydir, ltc, event_class, event_types,
-                 log_energies, cth_min=0.2, ndtheta=1000, ncth=40):
+                 log_energies, cth_min=0.2, ndtheta=1000, ncth=40,
+                 use_cache=True, cachedir=None):
 
         if isinstance(event_types, int):
             event_types = bitmask_to_bits(event_types)
 
-        self._dtheta = np.logspace(-4, 1.75, ndtheta)
-        self._dtheta = np.insert(self._dtheta, 0, [0])
+        self._dtheta = self.create_dtheta(ndtheta)
         self._log_energies = log_energies
         self._energies = 10**log_energies
         self._scale_fn = None
 
-        self._exp = np.zeros(len(log_energies))
-        self._psf = self.create_average_psf(skydir, ltc, event_class, event_types,
-                                            self._dtheta, log_energies, cth_min, ncth)
+        v = None
+        if use_cache:
+            key = psf_cache.get_key(skydir, ltc, event_class, event_types,
+                                    log_energies, self._dtheta, cth_min, ncth)
+            v = psf_cache.get(key, cachedir)
+
+        if v is None:
+            self._psf, self._exp = self.create_average_psf(
+                skydir, ltc, event_class, event_types, self._dtheta,
+                log_energies, cth_min, ncth, return_exp=True)
+            if use_cache:
+                psf_cache.put(key, self._psf, self._exp, cachedir)
+        else:
+            self._psf = np.array(v[0])
+            self._exp = np.array(v[1])
 
-        self._psf_fn = RegularGridInterpolator((self._dtheta, log_energies),
-                                               np.log(self._psf),
-                                               bounds_error=False,
-                                               fill_value=None)
+        self._create_log_tables()
 
-        cth_edge = np.linspace(cth_min, 1.0, ncth + 1)
-        cth = edge_to_center(cth_edge)
-        ltw = ltc.get_skydir_lthist(skydir, cth_edge)
-        for et in event_types:
-            aeff = create_aeff(event_class, et, log_energies, cth)
-            self._exp += np.sum(aeff * ltw[np.newaxis, :], axis=1)
+    @staticmethod
+    def create_dtheta(ndtheta=1000):
+        """Create the grid of offset angles in degrees on which the PSF
+        is tabulated."""
+        return np.insert(np.logspace(-4, 1.75, ndtheta), 0, [0])
+
+    def _create_log_tables(self):
+        """Precompute the tables used to evaluate the PSF.  Within each
+        interval of the offset grid log(PSF) is linear in dtheta and
+        is stored as an offset and slope.  The offset grid is uniform
+        in log(dtheta) above its first nonzero point so the interval
+        containing a given offset is found arithmetically without a
+        search."""
+
+        with np.errstate(divide='ignore'):
+            self._log_psf = np.ascontiguousarray(np.log(self._psf).T)
+        self._log_psf_slope = (np.diff(self._log_psf, axis=1) /
+                               np.diff(self._dtheta)[np.newaxis, :])
+        self._log_psf_offset = (self._log_psf[:, :-1] -
+                                self._log_psf_slope *
+                                self._dtheta[np.newaxis, :-1])
+        # Append an interval of constant value that is used for
+        # offsets beyond the end of the grid
+        self._log_psf_slope = np.ascontiguousarray(
+            np.pad(self._log_psf_slope, ((0, 0), (0, 1)), 'constant'))
+        self._log_psf_offset = np.hstack((self._log_psf_offset,
+                                          self._log_psf[:, -1:]))
+        self._dtheta_scale = 1. / np.log(self._dtheta[2] / self._dtheta[1])
+        self._dtheta_shift = 1. - np.log(self._dtheta[1]) * self._dtheta_scale
+
+    def _dtheta_index(self, dtheta, extrapolate=False):
+        """Return the index of the offset grid interval containing each
+        element of ``dtheta``.  Offsets beyond the end of the grid are
+        assigned to the last interval if ``extrapolate`` is True and
+        to the interval of constant value otherwise."""
+
+        with np.errstate(divide='ignore'):
+            u = np.log(dtheta, out=np.empty(np.shape(dtheta)))
+        u *= self._dtheta_scale
+        u += self._dtheta_shift
+        # Offsets below the first nonzero grid point fall in the
+        # interval that starts at zero
+        np.maximum(u, 0.0, out=u)
+        np.minimum(u, len(self._dtheta) - (2 if extrapolate else 1), out=u)
+        return u.astype(np.intp)
 
     def eval(self, ebin, dtheta, scale_fn=None):
         """Evaluate the PSF at one of the source map energies.
@@ -219,8 +667,15 @@ class PSFModel(object):
             dtheta = dtheta / scale_fn(self.energies[ebin])
             scale_factor = 1. / scale_fn(self.energies[ebin])**2
 
-        vals = 10**np.interp(dtheta, self.dtheta, np.log10(self.val[:, ebin]))
-        return vals * scale_factor
+        dtheta = np.asarray(dtheta, dtype=float)
+        idx = self._dtheta_index(dtheta)
+        vals = self._log_psf_slope[ebin].take(idx)
+        vals *= dtheta
+        vals += self._log_psf_offset[ebin].take(idx)
+        vals = np.exp(vals)
+        if scale_fn is not None:
+            vals *= scale_factor
+        return vals
 
     def interp(self, energies, dtheta, scale_fn=None):
         """Evaluate the PSF model at an array of energies and angular
@@ -251,7 +706,33 @@ class PSFModel(object):
             dtheta = dtheta / scale_fn(energies)
             scale_factor = 1. / scale_fn(energies)**2
 
-        vals = np.exp(self._psf_fn((dtheta, log_energies)))
+        # Bilinear interpolation in dtheta and log(energy)
+        # with linear extrapolation outside of the grid
+        dtheta, log_energies = np.broadcast_arrays(dtheta, log_energies)
+        dtheta = np.array(dtheta, dtype=float, ndmin=1)
+        idx = self._dtheta_index(dtheta, extrapolate=True)
+        egy = self._log_energies
+        jdx = np.clip(np.searchsorted(egy, log_energies) - 1,
+                      0, len(egy) - 2)
+        we = (log_energies - egy[jdx]) / (egy[jdx + 1] - egy[jdx])
+
+        # Flat indices into the offset and slope tables
+        ncol = self._log_psf_slope.shape[1]
+        idx += jdx * ncol
+        offset = self._log_psf_offset.ravel()
+        slope = self._log_psf_slope.ravel()
+
+        v0 = slope.take(idx)
+        v0 *= dtheta
+        v0 += offset.take(idx)
+        idx += ncol
+        v1 = slope.take(idx)
+        v1 *= dtheta
+        v1 += offset.take(idx)
+        v1 -= v0
+        v1 *= we
+        v1 += v0
+        vals = np.exp(v1, out=v1).reshape(shape)
         return vals * scale_factor
 
     def containment_angle(self, energies=None, fraction=0.68, scale_fn=None):
@@ -306,13 +787,23 @@ class PSFModel(object):
     def val(self):
         return self._psf
 
+    @property
+    def log_val(self):
+        """Natural logarithm of the PSF with shape (len(energies),
+        len(dtheta))."""
+        return self._log_psf
+
     @property
     def exp(self):
         return self._exp
 
     @staticmethod
     def create_average_psf(skydir, ltc, event_class, event_types, dtheta, egy,
-                           cth_min=0.2, ncth=40):
+                           cth_min=0.2, ncth=40, return_exp=False):
+        """Compute the exposure-weighted average PSF for a sky direction
+        or array of sky directions.  The PSF has shape (len(dtheta),
+        len(egy)) + skydir.shape and the exposure has shape
+        (len(egy),) + skydir.shape."""
 
         if isinstance(event_types, int):
             event_types = bitmask_to_bits(event_types)
@@ -320,21 +811,22 @@ class PSFModel(object):
         cth_edge = np.linspace(cth_min, 1.0, ncth + 1)
         cth = edge_to_center(cth_edge)
 
-        wpsf = np.zeros((len(dtheta), len(egy)))
-        exps = np.zeros(len(egy))
-
         ltw = ltc.get_skydir_lthist(skydir, cth_edge)
+        wpsf = np.zeros((len(dtheta), len(egy)) + ltw.shape[:-1])
+        exps = np.zeros((len(egy),) + ltw.shape[:-1])
 
         for et in event_types:
             psf = create_psf(event_class, et, dtheta, egy, cth)
             aeff = create_aeff(event_class, et, egy, cth)
 
-            wpsf += np.sum(psf * aeff[np.newaxis, :, :] *
-                           ltw[np.newaxis, np.newaxis, :], axis=2)
-            exps += np.sum(aeff * ltw[np.newaxis, :], axis=1)
+            wpsf += np.tensordot(psf * aeff[np.newaxis, :, :], ltw,
+                                 axes=([2], [ltw.ndim - 1]))
+            exps += np.tensordot(aeff, ltw, axes=([1], [ltw.ndim - 1]))
 
-        wpsf /= exps[np.newaxis, :]
+        wpsf /= exps[np.newaxis, ...]
 
+        if return_exp:
+            return wpsf, exps
         return wpsf
 
 
@@ -396,13 +888,153 @@ def create_aeff(event_class, event_type, egy, cth):
     return m
 
 
+def create_efficiency(event_class, event_type, egy):
+    """Create the livetime-dependent efficiency factors of the
+    effective area versus energy.  The efficiency of the effective
+    area for a livetime fraction :math:`x` is :math:`f_{1}(E) +
+    f_{2}(E) x`.
+
+    Parameters
+    ----------
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_type : int or str
+
+    egy : array_like
+        Evaluation points in log10(E/MeV).
+
+    Returns
+    -------
+    f1, f2 : `~numpy.ndarray`
+        Efficiency factors of the livetime and of the livetime
+        weighted by the livetime fraction.
+    """
+    irf = create_irf(event_class, event_type)
+    eff = irf.efficiencyFactor()
+    f1 = np.ones(len(egy))
+    f2 = np.zeros(len(egy))
+    if eff is None:
+        return f1, f2
+
+    for i, x in enumerate(egy):
+        f1[i] = eff.value(10**x, 0.0, 0.0)
+        f2[i] = eff.value(10**x, 1.0, 0.0) - f1[i]
+    return f1, f2
+
+
+def create_aeff_sum(event_class, event_types, egy, cth, efficiency=False):
+    """Create a map of the effective area versus energy and incidence
+    angle summed over a set of event types.
+
+    Parameters
+    ----------
+    event_class : str
+        Event class string (e.g. P8R2_SOURCE_V6).
+
+    event_types : list or int
+        List of event types or an event type bitmask.
+
+    egy : array_like
+        Evaluation points in log10(E/MeV).
+
+    cth : array_like
+        Evaluation points in cosine of the incidence angle.
+
+    efficiency : bool
+        Return the sums of the effective area of each event type
+        multiplied with its livetime-dependent efficiency factors
+        (see `create_efficiency`) instead of the sum of the effective
+        area.
+
+    Returns
+    -------
+    aeff : `~numpy.ndarray`
+        Effective area with shape (len(egy), len(cth)).  If
+        ``efficiency`` is True a tuple of the effective areas that
+        multiply the livetime and the weighted livetime.
+    """
+    if isinstance(event_types, int):
+        event_types = bitmask_to_bits(event_types)
+
+    m = np.zeros((len(egy), len(cth)))
+    m_wt = np.zeros((len(egy), len(cth)))
+    for et in event_types:
+        aeff = create_aeff(event_class, et, egy, cth)
+        if not efficiency:
+            m += aeff
+            continue
+        f1, f2 = create_efficiency(event_class, et, egy)
+        m += f1[:, np.newaxis] * aeff
+        m_wt += f2[:, np.newaxis] * aeff
+
+    if efficiency:
+        return m, m_wt
+    return m
+
+
+def _write_npz(path, **kwargs):
+    """Atomically write arrays to an npz file, creating its directory
+    if necessary."""
+
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    fd, tmpfile = tempfile.mkstemp(prefix='.tmp', suffix='.npz',
+                                   dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **kwargs)
+    os.rename(tmpfile, path)
+
+
+def _sum_ltfiles(ltfiles, ipix=None):
+    """Sum the livetime distributions of a list of livetime cube
+    files read with memory mapping.  Only the rows of the pixels in
+    ``ipix`` are read if it is defined.  Returns the summed livetime
+    with the (npix, ncth) layout of the EXPOSURE table together with
+    the start and stop time of the files.  The summed weighted
+    livetime (WEIGHTED_EXPOSURE table) is None unless every file has
+    one."""
+
+    data, data_wt = None, None
+    has_wt = True
+    tstart, tstop = np.inf, -np.inf
+    for ltfile in ltfiles:
+        with fits.open(ltfile, memmap=True) as hdulist:
+            lt = hdulist['EXPOSURE'].data.field(0)
+            if ipix is not None:
+                lt = lt[ipix]
+            if data is None:
+                data = np.zeros(lt.shape)
+            data += lt
+
+            has_wt &= 'WEIGHTED_EXPOSURE' in [h.name for h in hdulist]
+            if has_wt:
+                lt = hdulist['WEIGHTED_EXPOSURE'].data.field(0)
+                if ipix is not None:
+                    lt = lt[ipix]
+                if data_wt is None:
+                    data_wt = np.zeros(lt.shape)
+                data_wt += lt
+
+            tstart = min(tstart, hdulist[0].header['TSTART'])
+            tstop = max(tstop, hdulist[0].header['TSTOP'])
+    return data, (data_wt if has_wt else None), tstart, tstop
+
+
 class LTCube(HpxMap):
     """Class for reading and manipulating livetime cubes generated with
     gtltcube.
     """
 
-    def __init__(self, data, hpx, cth_edges, tstart=None, tstop=None):
+    def __init__(self, data, hpx, cth_edges, tstart=None, tstop=None,
+                 data_wt=None):
         HpxMap.__init__(self, data, hpx)
+        self._data_wt = data_wt
         self._cth_edges = cth_edges
         self._cth_center = edge_to_center(self._cth_edges)
         self._cth_width = edge_to_width(self._cth_edges)
@@ -421,6 +1053,13 @@ class LTCube(HpxMap):
         """Return stop time."""
         return self._tstop
 
+    @property
+    def data_wt(self):
+        """Return the livetime weighted by the livetime fraction with
+        the same layout as the livetime or None if the livetime cube
+        does not have weighted livetimes."""
+        return self._data_wt
+
     @property
     def domega(self):
         """Return solid angle of incidence angle bins in steradians."""
@@ -440,21 +1079,129 @@ class LTCube(HpxMap):
         return self._cth_center
 
     @staticmethod
-    def create(ltfile):
+    def create(ltfile, nthread=None, cachedir=None, region=None):
         """Create a livetime cube from a single file or list of
-        files."""
+        files.  Files are read with memory mapping and summed in a
+        pool of threads.
 
-        if not re.search('\.txt?', ltfile) is None:
+        Parameters
+        ----------
+        ltfile : str or list
+            Path to a livetime cube file, a wildcard expression, a
+            text file containing a list of livetime cube files, or a
+            list of livetime cube files.
+
+        nthread : int
+            Number of threads used to read the input files.  By
+            default one thread is used for every input file up to a
+            maximum of 8.
+
+        cachedir : str
+            Directory in which the summed livetime cube is cached.
+            The cached cube is reused when the same list of files
+            (identified by path, size, and modification time) and
+            region are requested again.
+
+        region : str
+            HEALPix region string (e.g. ``DISK(lon,lat,radius)``) in
+            the coordinate system of the livetime cube.  If defined
+            only the pixels inside the region are read and the
+            livetime of all other pixels is set to zero.
+        """
+
+        if isinstance(ltfile, list):
+            files = ltfile
+        elif not re.search('\.txt?', ltfile) is None:
             files = np.loadtxt(ltfile, unpack=True, dtype='str')
-        elif not isinstance(ltfile, list):
+        else:
             files = glob.glob(ltfile)
-
-        ltc = LTCube.create_from_file(files[0])
-        for f in files[1:]:
-            ltc.load_ltfile(f)
-
+        files = sorted(np.atleast_1d(files).tolist())
+
+        cachefile = None
+        if cachedir is not None:
+            m = hashlib.sha1()
+            for f in files:
+                st = os.stat(f)
+                m.update(json.dumps([os.path.abspath(f), st.st_size,
+                                     st.st_mtime]).encode())
+            m.update(repr(region).encode())
+            # Distinguish caches written before weighted livetimes
+            # were stored
+            m.update(b'WEIGHTED_EXPOSURE')
+            cachefile = os.path.join(cachedir, m.hexdigest() + '.npz')
+            if os.path.isfile(cachefile):
+                return LTCube.create_from_npz(cachefile)
+
+        with fits.open(files[0], memmap=True) as hdulist:
+            cth_edges = np.array(hdulist['CTHETABOUNDS'].data.field(0))
+            cth_edges = np.concatenate(([1], cth_edges))[::-1]
+            hpx = HPX.create_from_header(hdulist['EXPOSURE'].header,
+                                         cth_edges)
+
+        ipix = None
+        if region is not None:
+            ipix = HPX.get_index_list(hpx.nside, hpx.nest, region)
+
+        if nthread is None:
+            nthread = 8
+        nthread = max(min(nthread, len(files)), 1)
+
+        # Each thread sums a subset of the files into its own buffer
+        chunks = [files[i::nthread] for i in range(nthread)]
+        pool = ThreadPool(nthread)
+        try:
+            results = pool.map(lambda x: _sum_ltfiles(x, ipix), chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+        lt = results[0][0]
+        lt_wt = results[0][1]
+        for r in results[1:]:
+            lt += r[0]
+            if lt_wt is not None and r[1] is not None:
+                lt_wt += r[1]
+            else:
+                lt_wt = None
+        tstart = min([r[2] for r in results])
+        tstop = max([r[3] for r in results])
+
+        def reorder(x):
+            if ipix is None:
+                return np.ascontiguousarray(x[:, ::-1].T)
+            v = np.zeros((len(cth_edges) - 1, hpx.npix))
+            v[:, ipix] = x[:, ::-1].T
+            return v
+
+        data = reorder(lt)
+        data_wt = reorder(lt_wt) if lt_wt is not None else None
+        ltc = LTCube(data, hpx, cth_edges, tstart, tstop, data_wt)
+        if cachefile is not None:
+            ltc.write_npz(cachefile)
         return ltc
 
+    @staticmethod
+    def create_from_npz(npzfile):
+        """Create a livetime cube from a file written with
+        `write_npz`."""
+
+        with np.load(npzfile) as f:
+            hpx = HPX(int(f['nside']), bool(f['nest']), str(f['coordsys']),
+                      ebins=f['cth_edges'])
+            data_wt = f['data_wt'] if 'data_wt' in f.files else None
+            return LTCube(f['data'], hpx, f['cth_edges'],
+                          float(f['tstart']), float(f['tstop']), data_wt)
+
+    def write_npz(self, npzfile):
+        """Write this livetime cube to an npz file."""
+        kw = {}
+        if self.data_wt is not None:
+            kw['data_wt'] = self.data_wt
+        _write_npz(npzfile, data=self.data, cth_edges=self.costh_edges,
+                   tstart=self.tstart, tstop=self.tstop,
+                   nside=self.hpx.nside, nest=self.hpx.nest,
+                   coordsys=self.hpx.coordsys, **kw)
+
     @staticmethod
     def create_from_file(ltfile):
 
@@ -466,7 +1213,11 @@ class LTCube(HpxMap):
         cth_edges = np.concatenate(([1], cth_edges))
         cth_edges = cth_edges[::-1]
         hpx = HPX.create_from_header(hdulist['EXPOSURE'].header, cth_edges)
-        return LTCube(data[:, ::-1].T, hpx, cth_edges, tstart, tstop)
+        data_wt = None
+        if 'WEIGHTED_EXPOSURE' in [h.name for h in hdulist]:
+            data_wt = hdulist['WEIGHTED_EXPOSURE'].data.field(0)[:, ::-1].T
+        return LTCube(data[:, ::-1].T, hpx, cth_edges, tstart, tstop,
+                      data_wt)
 
     @staticmethod
     def create_empty(tstart, tstop, fill=0.0, nside=64):
@@ -480,12 +1231,47 @@ class LTCube(HpxMap):
 
         ltc = LTCube.create_from_file(ltfile)
         self._counts += ltc.data
+        if self._data_wt is not None and ltc.data_wt is not None:
+            self._data_wt = self._data_wt + ltc.data_wt
+        else:
+            self._data_wt = None
         self._tstart = min(self.tstart, ltc.tstart)
         self._tstop = max(self.tstop, ltc.tstop)
 
+    def scale(self, factor):
+        """Scale the livetime and the weighted livetime of this cube by
+        a common factor.
+
+        Parameters
+        ----------
+        factor : float or `~numpy.ndarray`
+            Scale factor.  Arrays must be broadcastable to the shape
+            of `data` (e.g. one factor per incidence angle bin with
+            shape (ncth, 1)).
+        """
+        self._counts = self._counts * factor
+        if self._data_wt is not None:
+            self._data_wt = self._data_wt * factor
+
+    def get_skydir_ipix(self, skydir):
+        """Get the indices of the livetime cube pixels that contain a
+        set of sky directions.
+
+        Parameters
+        ----------
+        skydir : `~astropy.coordinates.SkyCoord`
+        """
+        if self.hpx.coordsys == 'GAL':
+            lon, lat = skydir.galactic.l.deg, skydir.galactic.b.deg
+        else:
+            lon, lat = skydir.icrs.ra.deg, skydir.icrs.dec.deg
+
+        return hp.ang2pix(self.hpx.nside, np.pi / 2. - np.radians(lat),
+                          np.radians(lon), nest=self.hpx.nest)
+
     def get_skydir_lthist(self, skydir, cth_edges):
         """Get the livetime distribution (observing profile) for a
-        given sky direction.
+        given sky direction or array of sky directions.
 
         Parameters
         ----------
@@ -493,20 +1279,31 @@ class LTCube(HpxMap):
 
         cth_edges : `~numpy.ndarray`
             Bin edges in cosine of the incidence angle.
+
+        Returns
+        -------
+        lthist : `~numpy.ndarray`
+            Livetime in each incidence angle bin with shape
+            skydir.shape + (len(cth_edges) - 1,).
         """
-        ra = skydir.ra.deg
-        dec = skydir.dec.deg
 
         edges = np.linspace(cth_edges[0], cth_edges[-1],
                             (len(cth_edges) - 1) * 4 + 1)
         center = edge_to_center(edges)
         width = edge_to_width(edges)
-        ipix = hp.ang2pix(self.hpx.nside, np.pi / 2. - np.radians(dec),
-                          np.radians(ra), nest=self.hpx.nest)
-        lt = np.interp(center, self._cth_center,
-                       self.data[:, ipix] / self._cth_width) * width
-        lt = np.sum(lt.reshape(-1, 4), axis=1)
-        return lt
+        ipix = self.get_skydir_ipix(skydir)
+
+        # Linear interpolation weights equivalent to np.interp applied
+        # to every pixel
+        xp = self._cth_center
+        i0 = np.clip(np.searchsorted(xp, center) - 1, 0, len(xp) - 2)
+        w1 = np.clip((center - xp[i0]) / (xp[i0 + 1] - xp[i0]), 0.0, 1.0)
+
+        lt = self.data[:, np.ravel(ipix)] / self._cth_width[:, np.newaxis]
+        lt = ((1.0 - w1)[:, np.newaxis] * lt[i0] +
+              w1[:, np.newaxis] * lt[i0 + 1]) * width[:, np.newaxis]
+        lt = np.sum(lt.reshape(-1, 4, lt.shape[-1]), axis=1)
+        return lt.T.reshape(np.shape(ipix) + (len(cth_edges) - 1,))
 
 
 def plot_hpxmap(hpxmap, **kwargs):
@@ -148,3 +148,24 @@ class StreamLogger(object):
     def flush(self):
         for handler in self.logger.handlers:
             handler.flush()
+
+
+class RecordBuffer(logging.Handler):
+    """Handler that accumulates log records in memory.  Records are
+    rendered on capture so that they can be pickled, passed to another
+    process and re-emitted there with `logging.Logger.handle`."""
+
+    def __init__(self, level=logging.NOTSET):
+        super(RecordBuffer, self).__init__(level)
+        self.records = []
+
+    def emit(self, record):
+        # Render the message and traceback so the record can be pickled
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
@@ -0,0 +1,945 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""In-process event selection and binning from a HEALPix-indexed
+photon store.  The store holds the events of a set of FT1 files as
+memory-mapped column arrays sorted by coarse HEALPix pixel such that
+the events of a region of interest can be read without scanning the
+full dataset."""
+from __future__ import absolute_import, division, print_function
+import os
+import re
+import ast
+import json
+import time
+import errno
+import shutil
+import socket
+import numpy as np
+import healpy as hp
+from astropy.io import fits
+import fermipy
+import fermipy.utils as utils
+
+# Columns of the FT1 EVENTS table that are kept in the store
+EVENT_COLUMNS = ['ENERGY', 'RA', 'DEC', 'L', 'B', 'THETA', 'PHI',
+                 'ZENITH_ANGLE', 'EARTH_AZIMUTH_ANGLE', 'TIME',
+                 'EVENT_ID', 'RUN_ID', 'CONVERSION_TYPE', 'EVENT_CLASS',
+                 'EVENT_TYPE']
+
+# Keywords that describe the layout of a binary table and are
+# regenerated when the table is written
+TABLE_KEYWORDS = re.compile(r'^(XTENSION|BITPIX|NAXIS\d*|PCOUNT|GCOUNT|'
+                            r'TFIELDS|EXTNAME|T(TYPE|FORM|UNIT|DIM|LMIN|'
+                            r'LMAX|NULL|ZERO|SCAL|DISP)\d+)$')
+
+# FITS column formats of the numeric types of FT1 columns
+TFORMS = {'f4': 'E', 'f8': 'D', 'i2': 'I', 'i4': 'J', 'i8': 'K',
+          'u1': 'B', 'i1': 'B'}
+
+DSS_KEYWORDS = re.compile(r'^(DSTYP|DSUNI|DSVAL|DSREF)(\d+)$')
+
+
+def get_evfiles(evfile):
+    """Return the list of FT1 files defined by ``evfile``, which can be
+    the path to an FT1 file or to a text file with one FT1 file per
+    line (optionally prefixed with '@')."""
+
+    evfile = os.path.expandvars(evfile)
+    if evfile.startswith('@'):
+        evfile = evfile[1:]
+
+    with open(evfile, 'rb') as f:
+        is_fits = f.read(6) == b'SIMPLE'
+
+    if is_fits:
+        return [evfile]
+
+    with open(evfile, 'r') as f:
+        return [os.path.expandvars(line.strip()) for line in f
+                if line.strip()]
+
+
+def _read_bits(col):
+    """Convert an FT1 bit-field column to an array of unsigned
+    integers."""
+    col = np.asarray(col)
+    if col.ndim == 1:
+        return col.astype(np.uint32)
+
+    # Bit arrays are returned most significant bit first
+    nbits = col.shape[1]
+    bits = np.zeros((col.shape[0], 32), dtype=bool)
+    bits[:, 32 - nbits:] = col
+    return np.packbits(bits, axis=1).view('>u4')[:, 0].astype(np.uint32)
+
+
+def _strip_header(header):
+    """Remove table layout keywords from a FITS header."""
+    header = header.copy()
+    for k in list(header.keys()):
+        if TABLE_KEYWORDS.match(k):
+            del header[k]
+    return header
+
+
+def merge_intervals(start, stop):
+    """Merge a set of (possibly overlapping) time intervals into a
+    sorted set of disjoint intervals."""
+
+    start = np.asarray(start, dtype=float)
+    stop = np.asarray(stop, dtype=float)
+    if len(start) == 0:
+        return start, stop
+
+    isort = np.argsort(start)
+    start, stop = start[isort], stop[isort]
+    stop = np.maximum.accumulate(stop)
+    # An interval begins wherever its start is past the end of all
+    # previous intervals
+    new = np.concatenate(([True], start[1:] > stop[:-1]))
+    idx = np.where(new)[0]
+    end = np.concatenate((idx[1:] - 1, [len(start) - 1]))
+    return start[idx], stop[end]
+
+
+def intersect_intervals(start0, stop0, start1, stop1):
+    """Compute the intersection of two sets of disjoint sorted
+    intervals."""
+
+    start0, stop0 = np.asarray(start0), np.asarray(stop0)
+    start1, stop1 = np.asarray(start1), np.asarray(stop1)
+
+    # Candidate pairs of overlapping intervals
+    i0 = np.searchsorted(stop1, start0, side='right')
+    i1 = np.searchsorted(start1, stop0, side='left')
+    n = np.maximum(i1 - i0, 0)
+    idx0 = np.repeat(np.arange(len(start0)), n)
+    idx1 = np.repeat(i0, n) + (np.arange(np.sum(n)) -
+                               np.repeat(np.cumsum(n) - n, n))
+
+    start = np.maximum(start0[idx0], start1[idx1])
+    stop = np.minimum(stop0[idx0], stop1[idx1])
+    m = stop > start
+    return start[m], stop[m]
+
+
+def in_intervals(t, start, stop):
+    """Return a mask of the elements of ``t`` that fall within a set of
+    disjoint sorted intervals."""
+    idx = np.searchsorted(start, t, side='right') - 1
+    m = idx >= 0
+    m[m] &= t[m] <= stop[idx[m]]
+    return m
+
+
+# Logical operators of the cfitsio row filter syntax and their python
+# equivalents
+FILTER_OPERATORS = [(re.compile(r'&&|\.and\.', re.I), ' and '),
+                    (re.compile(r'\|\||\.or\.', re.I), ' or '),
+                    (re.compile(r'!(?!=)|\.not\.', re.I), ' not '),
+                    (re.compile(r'\.eq\.', re.I), '=='),
+                    (re.compile(r'\.ne\.', re.I), '!='),
+                    (re.compile(r'\.ge\.', re.I), '>='),
+                    (re.compile(r'\.le\.', re.I), '<='),
+                    (re.compile(r'\.gt\.', re.I), '>'),
+                    (re.compile(r'\.lt\.', re.I), '<')]
+
+# Boolean constants of the cfitsio row filter syntax
+FILTER_CONSTANTS = {'T': True, 'F': False, 'TRUE': True, 'FALSE': False}
+
+
+def _angsep(lon0, lat0, lon1, lat1):
+    """Angular separation in degrees between two points given in
+    degrees."""
+    lon0, lat0, lon1, lat1 = [np.radians(np.asarray(x, dtype=float))
+                              for x in (lon0, lat0, lon1, lat1)]
+    s = (np.sin(0.5 * (lat1 - lat0))**2 +
+         np.cos(lat0) * np.cos(lat1) * np.sin(0.5 * (lon1 - lon0))**2)
+    return np.degrees(2.0 * np.arcsin(np.sqrt(np.clip(s, 0.0, 1.0))))
+
+
+# Functions that can be called in a filter expression and their
+# number of arguments
+FILTER_FUNCTIONS = {'ABS': (np.abs, 1), 'SQRT': (np.sqrt, 1),
+                    'ANGSEP': (_angsep, 4)}
+
+FILTER_BINOPS = {ast.Add: np.add, ast.Sub: np.subtract,
+                 ast.Mult: np.multiply, ast.Div: np.true_divide,
+                 ast.Mod: np.mod, ast.Pow: np.power}
+
+FILTER_CMPOPS = {ast.Eq: np.equal, ast.NotEq: np.not_equal,
+                 ast.Lt: np.less, ast.LtE: np.less_equal,
+                 ast.Gt: np.greater, ast.GtE: np.greater_equal}
+
+FILTER_UNARYOPS = {ast.Not: np.logical_not, ast.USub: np.negative,
+                   ast.UAdd: lambda x: x}
+
+
+def _literal(node):
+    """Return a tuple with the value of a literal node or None if the
+    node is not a literal."""
+    try:
+        return (ast.literal_eval(node),)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_filter(expr, columns):
+    """Parse a gtmktime filter expression (e.g.
+    '(DATA_QUAL>0)&&(LAT_CONFIG==1)').
+
+    The expression is translated to python syntax and its syntax tree
+    is checked against a whitelist of operators (comparisons,
+    arithmetic, and the logical operators &&, ||, and !), functions
+    (see ``FILTER_FUNCTIONS``), literals, and the names of the
+    columns of the FT2 file.  Column names are case-insensitive and
+    T/F denote boolean constants.
+
+    Parameters
+    ----------
+    expr : str
+        Filter expression.
+
+    columns : list
+        Names of the columns of the FT2 file.
+
+    Returns
+    -------
+    tree : `ast.Expression`
+        Syntax tree of the expression.
+
+    Raises
+    ------
+    ValueError
+        If the expression cannot be parsed or contains an operator,
+        function, or name that is not supported.
+    """
+
+    # Translate the operators outside of string literals
+    tokens = re.split(r'("[^"]*"|\'[^\']*\')', expr)
+    for i in range(0, len(tokens), 2):
+        for pattern, repl in FILTER_OPERATORS:
+            tokens[i] = pattern.sub(repl, tokens[i])
+
+    try:
+        tree = ast.parse(''.join(tokens).strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError('Could not parse filter expression: %s' % expr)
+
+    columns = set([c.upper() for c in columns])
+
+    def check(node):
+        if isinstance(node, ast.Expression):
+            check(node.body)
+        elif _literal(node) is not None:
+            value = _literal(node)[0]
+            if not isinstance(value, (bool, int, float, str, type(u''))):
+                raise ValueError('Unsupported literal in filter '
+                                 'expression: %r' % value)
+        elif isinstance(node, ast.Name):
+            name = node.id.upper()
+            if name not in columns and name not in FILTER_CONSTANTS:
+                raise ValueError('Unknown column in filter '
+                                 'expression: %s' % node.id)
+        elif isinstance(node, ast.BoolOp):
+            for v in node.values:
+                check(v)
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in FILTER_UNARYOPS:
+                raise ValueError('Unsupported operator in filter '
+                                 'expression: %s' % expr)
+            check(node.operand)
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in FILTER_BINOPS:
+                raise ValueError('Unsupported operator in filter '
+                                 'expression: %s' % expr)
+            check(node.left)
+            check(node.right)
+        elif isinstance(node, ast.Compare):
+            for op in node.ops:
+                if type(op) not in FILTER_CMPOPS:
+                    raise ValueError('Unsupported operator in filter '
+                                     'expression: %s' % expr)
+            for v in [node.left] + node.comparators:
+                check(v)
+        elif isinstance(node, ast.Call):
+            name = getattr(node.func, 'id', '').upper()
+            if name not in FILTER_FUNCTIONS:
+                raise ValueError('Unsupported function in filter '
+                                 'expression: %s' %
+                                 getattr(node.func, 'id', expr))
+            if node.keywords or \
+                    len(node.args) != FILTER_FUNCTIONS[name][1]:
+                raise ValueError('Wrong arguments to %s in filter '
+                                 'expression: %s' % (node.func.id, expr))
+            for v in node.args:
+                check(v)
+        else:
+            raise ValueError('Unsupported syntax in filter '
+                             'expression: %s' % expr)
+
+    check(tree)
+    return tree
+
+
+def check_filter(expr, scfile):
+    """Check that a gtmktime filter expression can be evaluated with
+    `evaluate_filter` on the columns of an FT2 file.  Raises
+    ValueError if the expression is not supported."""
+
+    with fits.open(get_evfiles(scfile)[0]) as hdulist:
+        parse_filter(expr, hdulist['SC_DATA'].columns.names)
+
+
+def evaluate_filter(expr, table):
+    """Evaluate a gtmktime filter expression (e.g.
+    '(DATA_QUAL>0)&&(LAT_CONFIG==1)') on the columns of an FT2 table.
+    See `parse_filter` for the supported syntax."""
+
+    tree = parse_filter(expr, table.columns.names)
+    names = {k.upper(): k for k in table.columns.names}
+
+    def column(name):
+        v = np.asarray(table[names[name]])
+        if v.dtype.kind == 'S':
+            v = np.char.decode(v, 'ascii')
+        if v.dtype.kind == 'U':
+            v = np.char.strip(v)
+        return v
+
+    def ev(node):
+        value = _literal(node)
+        if value is not None:
+            return value[0]
+        elif isinstance(node, ast.Name):
+            name = node.id.upper()
+            if name in FILTER_CONSTANTS:
+                return FILTER_CONSTANTS[name]
+            return column(name)
+        elif isinstance(node, ast.BoolOp):
+            fn = np.logical_and if isinstance(node.op, ast.And) \
+                else np.logical_or
+            v = ev(node.values[0])
+            for x in node.values[1:]:
+                v = fn(v, ev(x))
+            return v
+        elif isinstance(node, ast.UnaryOp):
+            return FILTER_UNARYOPS[type(node.op)](ev(node.operand))
+        elif isinstance(node, ast.BinOp):
+            return FILTER_BINOPS[type(node.op)](ev(node.left),
+                                                ev(node.right))
+        elif isinstance(node, ast.Compare):
+            v, lhs = True, ev(node.left)
+            for op, x in zip(node.ops, node.comparators):
+                rhs = ev(x)
+                v = np.logical_and(v, FILTER_CMPOPS[type(op)](lhs, rhs))
+                lhs = rhs
+            return v
+        elif isinstance(node, ast.Call):
+            fn = FILTER_FUNCTIONS[node.func.id.upper()][0]
+            return fn(*[ev(x) for x in node.args])
+
+    m = np.asarray(ev(tree.body), dtype=bool)
+    return np.broadcast_to(m, (len(table),)).copy()
+
+
+def apply_filter(start, stop, scfile, expr):
+    """Restrict a set of GTIs to the intervals of an FT2 file that pass
+    a filter expression."""
+
+    scfiles = get_evfiles(scfile)
+    good_start, good_stop = [], []
+    for f in scfiles:
+        with fits.open(f) as hdulist:
+            tab = hdulist['SC_DATA'].data
+            m = evaluate_filter(expr, tab)
+            good_start += [np.array(tab['START'][m], dtype=float)]
+            good_stop += [np.array(tab['STOP'][m], dtype=float)]
+
+    good_start, good_stop = merge_intervals(np.concatenate(good_start),
+                                            np.concatenate(good_stop))
+    return intersect_intervals(start, stop, good_start, good_stop)
+
+
+def update_dss_keywords(header, cuts):
+    """Replace the data subspace (DSS) keywords of a header that
+    describe the given cuts.
+
+    Parameters
+    ----------
+    header : `~astropy.io.fits.Header`
+
+    cuts : list
+        List of (DSTYP, DSUNI, DSVAL, DSREF) tuples.  Existing DSS
+        keywords with a matching type (up to the parameters of BIT_MASK
+        and POS cuts) are removed.
+    """
+
+    def base_type(t):
+        return t.split(',')[0]
+
+    keys = {}
+    for k in header.keys():
+        m = DSS_KEYWORDS.match(k)
+        if m:
+            keys.setdefault(int(m.group(2)), {})[m.group(1)] = header[k]
+
+    types = [base_type(c[0]) for c in cuts]
+    entries = []
+    for i in sorted(keys.keys()):
+        e = keys[i]
+        if base_type(e.get('DSTYP', '')) in types:
+            continue
+        entries += [(e.get('DSTYP'), e.get('DSUNI'), e.get('DSVAL'),
+                     e.get('DSREF'))]
+    entries += cuts
+
+    for k in list(header.keys()):
+        if DSS_KEYWORDS.match(k):
+            del header[k]
+
+    for i, (typ, uni, val, ref) in enumerate(entries):
+        header['DSTYP%i' % (i + 1)] = typ
+        header['DSUNI%i' % (i + 1)] = uni
+        header['DSVAL%i' % (i + 1)] = val
+        if ref is not None:
+            header['DSREF%i' % (i + 1)] = ref
+    header['NDSKEYS'] = len(entries)
+
+
+class StoreLock(object):
+    """Exclusive lock on a photon store.  The lock is a file
+    (``path`` + '.lock') created atomically that records the host and
+    PID of its owner.  A lock is considered stale and is broken if its
+    owner is a process on this host that no longer exists or if it
+    has not been refreshed for more than ``max_age`` seconds.  The
+    owner of the lock should call `refresh` periodically during long
+    operations.
+
+    Parameters
+    ----------
+    path : str
+        Path to the photon store.
+
+    timeout : float
+        Maximum time in seconds to wait for the lock.
+
+    max_age : float
+        Age in seconds after which a lock that has not been refreshed
+        is considered stale.
+
+    poll : float
+        Time in seconds between attempts to acquire the lock.
+
+    logger : `~logging.Logger`
+        Logger used to report stale locks.
+    """
+
+    def __init__(self, path, timeout=86400., max_age=3600., poll=1.0,
+                 logger=None):
+        self._lockfile = os.path.abspath(path).rstrip('/') + '.lock'
+        self._timeout = timeout
+        self._max_age = max_age
+        self._poll = poll
+        self._logger = logger
+        self._owner = '%s %i %x' % (socket.gethostname(), os.getpid(),
+                                    id(self))
+
+    @property
+    def lockfile(self):
+        return self._lockfile
+
+    def _is_stale(self):
+        """Check whether the existing lock file is stale."""
+        try:
+            with open(self._lockfile, 'r') as f:
+                owner = f.read().split()
+            age = time.time() - os.path.getmtime(self._lockfile)
+        except (IOError, OSError):
+            return False
+
+        if age > self._max_age:
+            return True
+        # A lock file that is still being written is not stale
+        if len(owner) < 2 or owner[0] != socket.gethostname():
+            return False
+        try:
+            os.kill(int(owner[1]), 0)
+        except OSError as e:
+            return e.errno == errno.ESRCH
+        return False
+
+    def acquire(self):
+        tstart = time.time()
+        while True:
+            try:
+                fd = os.open(self._lockfile,
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            if self._is_stale():
+                if self._logger is not None:
+                    self._logger.warning('Removing stale photon store '
+                                         'lock %s', self._lockfile)
+                # Break the lock by renaming it such that only one
+                # process removes it
+                stale = '%s.%s.%i' % (self._lockfile,
+                                      socket.gethostname(), os.getpid())
+                try:
+                    os.rename(self._lockfile, stale)
+                    os.remove(stale)
+                except OSError:
+                    pass
+                continue
+
+            if time.time() - tstart > self._timeout:
+                raise Exception('Timed out waiting for lock on photon '
+                                'store: %s' % self._lockfile)
+            time.sleep(self._poll)
+
+        os.write(fd, self._owner.encode())
+        os.close(fd)
+
+    def refresh(self):
+        """Update the modification time of the lock file."""
+        os.utime(self._lockfile, None)
+
+    def release(self):
+        # Leave the lock file alone if the lock was broken and taken
+        # over by another owner
+        try:
+            with open(self._lockfile, 'r') as f:
+                owner = f.read()
+        except (IOError, OSError):
+            owner = None
+
+        if owner == self._owner:
+            os.remove(self._lockfile)
+        elif self._logger is not None:
+            self._logger.warning('Lock on photon store was broken: %s',
+                                 self._lockfile)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class PhotonStore(object):
+    """Event store built from a set of FT1 files.  Events are sorted by
+    their HEALPix pixel (NESTED scheme, order ``order``) in celestial
+    coordinates and each column is stored as a memory-mapped ``.npy``
+    file.  An index of the offset of the first event in each pixel
+    allows the events within a region to be read by loading only the
+    pixels that overlap it.
+
+    Use `PhotonStore.create` to build a store and `PhotonStore.open`
+    to load an existing one.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self._meta = json.load(f)
+        self._nside = 2**self._meta['order']
+        self._offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self._gti = np.load(os.path.join(path, 'gti.npy'))
+        self._cols = {}
+        for k in self._meta['columns']:
+            self._cols[k] = np.load(os.path.join(path, k + '.npy'),
+                                    mmap_mode='r')
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def nside(self):
+        return self._nside
+
+    @property
+    def nevents(self):
+        return self._meta['nevents']
+
+    @property
+    def columns(self):
+        return self._meta['columns']
+
+    @property
+    def evfiles(self):
+        return self._meta['evfiles']
+
+    @property
+    def gti(self):
+        return self._gti
+
+    @property
+    def events_header(self):
+        return fits.Header.fromstring(self._meta['events_header'])
+
+    @property
+    def gti_header(self):
+        return fits.Header.fromstring(self._meta['gti_header'])
+
+    @staticmethod
+    def open(path, evfile=None, order=6, logger=None):
+        """Open the store at ``path``.  If ``evfile`` is given and the
+        store does not exist or was built from a different set of
+        files it is (re)built from ``evfile``."""
+
+        path = os.path.expandvars(path)
+        if evfile is None:
+            return PhotonStore(path)
+
+        evfiles = [os.path.abspath(f) for f in get_evfiles(evfile)]
+        with StoreLock(path, logger=logger) as lock:
+            metafile = os.path.join(path, 'meta.json')
+            if os.path.isfile(metafile):
+                store = PhotonStore(path)
+                if store.evfiles == evfiles:
+                    return store
+            return PhotonStore.create(path, evfiles, order=order,
+                                      logger=logger, lock=lock)
+
+    @staticmethod
+    def create(path, evfiles, order=6, logger=None, lock=None):
+        """Build a photon store from a list of FT1 files.
+
+        The store is built in two passes over the input files.  The
+        first counts the events in each pixel to compute the pixel
+        offsets.  The second writes the events of each file to their
+        slots in the memory-mapped output columns such that only one
+        input file is held in memory at a time.  The store is written
+        to a temporary directory that replaces ``path`` once it is
+        complete such that an existing store at ``path`` is never
+        left partially overwritten.
+
+        Parameters
+        ----------
+        path : str
+            Output directory.
+
+        evfiles : list
+            List of FT1 files.
+
+        order : int
+            HEALPix order of the pixel index.
+
+        lock : `StoreLock`
+            Lock held on ``path`` that is refreshed while the store is
+            built.
+        """
+
+        if utils.isstr(evfiles):
+            evfiles = get_evfiles(evfiles)
+        evfiles = [os.path.abspath(f) for f in evfiles]
+        path = os.path.abspath(path).rstrip('/')
+
+        if logger is not None:
+            logger.info('Creating photon store %s from %i files',
+                        path, len(evfiles))
+
+        # Names of the directories of the new and previous stores
+        # while they are swapped.  These are unique to this process.
+        suffix = '%s.%i' % (socket.gethostname(), os.getpid())
+        tmpdir = '%s.tmp.%s' % (path, suffix)
+        olddir = '%s.old.%s' % (path, suffix)
+        for d in [tmpdir, olddir]:
+            shutil.rmtree(d, ignore_errors=True)
+
+        os.makedirs(tmpdir)
+        try:
+            PhotonStore._build(tmpdir, evfiles, order, lock)
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+        # Swap the new store into place.  Readers that hold memory
+        # maps of the columns of a previous store keep their data.
+        if os.path.exists(path):
+            os.rename(path, olddir)
+        os.rename(tmpdir, path)
+        shutil.rmtree(olddir, ignore_errors=True)
+
+        return PhotonStore(path)
+
+    @staticmethod
+    def _build(path, evfiles, order, lock=None):
+        """Write the files of a photon store to the directory
+        ``path``."""
+
+        nside = 2**order
+        npix = hp.nside2npix(nside)
+
+        def refresh():
+            if lock is not None:
+                lock.refresh()
+
+        # Pass 1: count events per pixel and collect GTIs
+        counts = np.zeros(npix, dtype=np.int64)
+        gti_start, gti_stop = [], []
+        columns, dtypes = None, {}
+        events_header, gti_header = None, None
+        for f in evfiles:
+            refresh()
+            with fits.open(f, memmap=True) as hdulist:
+                evts = hdulist['EVENTS'].data
+                if columns is None:
+                    columns = [c for c in EVENT_COLUMNS
+                               if c in evts.columns.names]
+                    events_header = _strip_header(hdulist['EVENTS'].header)
+                    gti_header = _strip_header(hdulist['GTI'].header)
+                pix = hp.ang2pix(nside, np.radians(90. - evts['DEC']),
+                                 np.radians(evts['RA']), nest=True)
+                counts += np.bincount(pix, minlength=npix)
+                gti_start += [np.array(hdulist['GTI'].data['START'])]
+                gti_stop += [np.array(hdulist['GTI'].data['STOP'])]
+                for c in columns:
+                    if c in ['EVENT_CLASS', 'EVENT_TYPE']:
+                        dtypes[c] = np.uint32
+                    else:
+                        dtypes[c] = evts[c].dtype.newbyteorder('=')
+
+        offsets = np.zeros(npix + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        nevents = int(offsets[-1])
+
+        out = {}
+        for c in columns:
+            out[c] = np.lib.format.open_memmap(os.path.join(path, c + '.npy'),
+                                               mode='w+', dtype=dtypes[c],
+                                               shape=(nevents,))
+
+        # Pass 2: scatter the events of each file to their slots
+        filled = offsets[:-1].copy()
+        for f in evfiles:
+            refresh()
+            with fits.open(f, memmap=True) as hdulist:
+                evts = hdulist['EVENTS'].data
+                pix = hp.ang2pix(nside, np.radians(90. - evts['DEC']),
+                                 np.radians(evts['RA']), nest=True)
+                isort = np.argsort(pix, kind='mergesort')
+                spix = pix[isort]
+                rank = np.arange(len(spix)) - np.searchsorted(spix, spix)
+                idx = filled[spix] + rank
+                filled += np.bincount(pix, minlength=npix)
+
+                for c in columns:
+                    v = evts[c]
+                    if c in ['EVENT_CLASS', 'EVENT_TYPE']:
+                        v = _read_bits(v)
+                    out[c][idx] = np.asarray(v)[isort]
+
+        for c in columns:
+            out[c].flush()
+        del out
+
+        gti_start, gti_stop = merge_intervals(np.concatenate(gti_start),
+                                              np.concatenate(gti_stop))
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'gti.npy'),
+                np.vstack((gti_start, gti_stop)).T)
+
+        meta = dict(order=order, nevents=nevents, columns=columns,
+                    evfiles=evfiles,
+                    events_header=events_header.tostring(),
+                    gti_header=gti_header.tostring(),
+                    creator='fermipy ' + fermipy.__version__)
+
+        # The metadata file is written last and marks a complete store
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def get_pixel_ranges(self, skydir, radius):
+        """Return the ranges of event indices of the pixels that
+        overlap a circular region."""
+
+        vec = hp.ang2vec(np.radians(90. - skydir.icrs.dec.deg),
+                         np.radians(skydir.icrs.ra.deg))
+        pix = hp.query_disc(self.nside, vec, np.radians(radius),
+                            inclusive=True, nest=True)
+        pix = np.sort(pix)
+
+        # Merge runs of consecutive pixels into contiguous ranges
+        brk = np.where(np.diff(pix) != 1)[0]
+        first = pix[np.concatenate(([0], brk + 1))]
+        last = pix[np.concatenate((brk, [len(pix) - 1]))]
+        return self._offsets[first], self._offsets[last + 1]
+
+    def select(self, skydir, radius, emin=None, emax=None, tmin=None,
+               tmax=None, zmax=None, evclass=None, evtype=None,
+               convtype=None, scfile=None, filter=None):
+        """Select the events within a circular region that pass a set of
+        cuts.  The cuts follow the conventions of gtselect and gtmktime.
+
+        Returns
+        -------
+        events : dict
+            Dictionary of event columns.
+
+        gti : `~numpy.ndarray`
+            Array of good time intervals with shape (N,2).
+        """
+
+        i0, i1 = self.get_pixel_ranges(skydir, radius)
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(i0, i1)] +
+                             [np.zeros(0, dtype=int)])
+
+        ra = np.radians(np.array(self._cols['RA'][idx], dtype=float))
+        dec = np.radians(np.array(self._cols['DEC'][idx], dtype=float))
+        xyz0 = utils.lonlat_to_xyz(np.radians(skydir.icrs.ra.deg),
+                                   np.radians(skydir.icrs.dec.deg))
+        cosdist = np.dot(xyz0, utils.lonlat_to_xyz(ra, dec))
+        idx = idx[cosdist >= np.cos(np.radians(radius))]
+
+        def cut(col, fn):
+            return idx[fn(np.asarray(self._cols[col][idx]))]
+
+        if emin is not None:
+            idx = cut('ENERGY', lambda x: x >= emin)
+        if emax is not None:
+            idx = cut('ENERGY', lambda x: x <= emax)
+        if zmax is not None:
+            idx = cut('ZENITH_ANGLE', lambda x: x <= zmax)
+        if evclass is not None:
+            idx = cut('EVENT_CLASS', lambda x: (x & evclass) != 0)
+        if evtype is not None:
+            idx = cut('EVENT_TYPE', lambda x: (x & evtype) != 0)
+        if convtype is not None and convtype >= 0:
+            idx = cut('CONVERSION_TYPE', lambda x: x == convtype)
+
+        start, stop = self._gti[:, 0], self._gti[:, 1]
+        if tmin is not None or tmax is not None:
+            tmin = -np.inf if tmin is None else tmin
+            tmax = np.inf if tmax is None else tmax
+            start, stop = intersect_intervals(start, stop, [tmin], [tmax])
+        if filter is not None:
+            start, stop = apply_filter(start, stop, scfile, filter)
+
+        idx = cut('TIME', lambda x: in_intervals(x, start, stop))
+        idx = np.sort(idx)
+
+        events = {k: np.array(v[idx]) for k, v in self._cols.items()}
+        return events, np.vstack((start, stop)).T
+
+    def write_ft1(self, outfile, skydir, radius, **kwargs):
+        """Write an FT1 file with the events selected with `select`.
+        The DSS keywords of the output file are updated with the
+        applied cuts."""
+
+        events, gti = self.select(skydir, radius, **kwargs)
+
+        cols = []
+        for k in self.columns:
+            v = events[k]
+            if k in ['EVENT_CLASS', 'EVENT_TYPE']:
+                v = v.astype('>u4').view(np.uint8).reshape(-1, 4)
+                v = np.unpackbits(v, axis=1).astype(bool)
+                cols += [fits.Column(k, '32X', array=v)]
+            else:
+                cols += [fits.Column(k, TFORMS[v.dtype.str[1:]], array=v)]
+
+        pass_ver = self.events_header.get('PASS_VER', 'P8R2')
+        cuts = [('POS(RA,DEC)', 'deg', 'CIRCLE(%.4f,%.4f,%.4f)' %
+                 (skydir.icrs.ra.deg, skydir.icrs.dec.deg, radius), None),
+                ('TIME', 's', 'TABLE', ':GTI')]
+        if kwargs.get('emin') is not None or kwargs.get('emax') is not None:
+            cuts += [('ENERGY', 'MeV', '%s:%s' % (kwargs.get('emin') or 0,
+                                                  kwargs.get('emax') or ''),
+                      None)]
+        if kwargs.get('zmax') is not None:
+            cuts += [('ZENITH_ANGLE', 'deg', '0:%s' % kwargs['zmax'], None)]
+        if kwargs.get('evclass') is not None:
+            cuts += [('BIT_MASK(EVENT_CLASS,%i,%s)' % (kwargs['evclass'],
+                                                      pass_ver),
+                      'DIMENSIONLESS', '1:1', None)]
+        if kwargs.get('evtype') is not None:
+            cuts += [('BIT_MASK(EVENT_TYPE,%i,%s)' % (kwargs['evtype'],
+                                                     pass_ver),
+                      'DIMENSIONLESS', '1:1', None)]
+
+        header = self.events_header
+        update_dss_keywords(header, cuts)
+        if len(gti):
+            header['TSTART'] = gti[0, 0]
+            header['TSTOP'] = gti[-1, 1]
+
+        hdu_events = fits.BinTableHDU.from_columns(cols, header=header,
+                                                   name='EVENTS')
+        hdu_gti = fits.BinTableHDU.from_columns(
+            [fits.Column('START', 'D', unit='s', array=gti[:, 0]),
+             fits.Column('STOP', 'D', unit='s', array=gti[:, 1])],
+            header=self.gti_header, name='GTI')
+        hdulist = fits.HDUList([fits.PrimaryHDU(), hdu_events, hdu_gti])
+        hdulist[0].header['CREATOR'] = 'fermipy ' + fermipy.__version__
+        hdulist.writeto(outfile, clobber=True)
+
+
+def make_ccube(evfile, outfile, wcs, npix, ebin_edges):
+    """Bin the events of an FT1 file into a counts cube with the
+    layout of the output of gtbin (algorithm=ccube).
+
+    Parameters
+    ----------
+    evfile : str
+        Input FT1 file.
+
+    outfile : str
+        Output counts cube file.
+
+    wcs : `~astropy.wcs.WCS`
+        Two-dimensional WCS of the counts cube.
+
+    npix : int or tuple
+        Number of pixels in each spatial dimension.
+
+    ebin_edges : `~numpy.ndarray`
+        Energy bin edges in log10(E/MeV).
+    """
+
+    nx, ny = (npix, npix) if np.isscalar(npix) else npix
+
+    with fits.open(evfile) as hdulist:
+        evts = hdulist['EVENTS'].data
+        header = _strip_header(hdulist['EVENTS'].header)
+        gti = hdulist['GTI'].copy()
+        if wcs.wcs.ctype[0].startswith('GLON'):
+            lon, lat = evts['L'], evts['B']
+        else:
+            lon, lat = evts['RA'], evts['DEC']
+        loge = np.log10(np.array(evts['ENERGY'], dtype=float))
+        xpix, ypix = wcs.wcs_world2pix(np.array(lon, dtype=float),
+                                       np.array(lat, dtype=float), 0)
+
+    m = np.isfinite(xpix) & np.isfinite(ypix)
+    counts = np.histogramdd((loge[m], ypix[m], xpix[m]),
+                            bins=(ebin_edges, np.arange(ny + 1) - 0.5,
+                                  np.arange(nx + 1) - 0.5))[0]
+
+    hdu = fits.PrimaryHDU(counts.astype(np.float32))
+    for card in header.cards:
+        if card.keyword in ['EXTNAME', 'COMMENT', 'HISTORY', '']:
+            continue
+        hdu.header[card.keyword] = (card.value, card.comment)
+    hdu.header.update(wcs.to_header())
+    hdu.header['CTYPE3'] = 'log_Energy'
+    hdu.header['CRPIX3'] = 1.0
+    hdu.header['CRVAL3'] = ebin_edges[0]
+    hdu.header['CDELT3'] = ebin_edges[1] - ebin_edges[0]
+    hdu.header['CUNIT3'] = 'log10(MeV)'
+    hdu.header['CREATOR'] = 'fermipy ' + fermipy.__version__
+
+    emin = 10**np.array(ebin_edges[:-1]) * 1E3
+    emax = 10**np.array(ebin_edges[1:]) * 1E3
+    hdu_ebounds = fits.BinTableHDU.from_columns(
+        [fits.Column('CHANNEL', 'I', array=np.arange(1, len(emin) + 1)),
+         fits.Column('E_MIN', 'E', unit='keV', array=emin),
+         fits.Column('E_MAX', 'E', unit='keV', array=emax)],
+        name='EBOUNDS')
+
+    hdulist = fits.HDUList([hdu, hdu_ebounds, gti])
+    hdulist.writeto(outfile, clobber=True)
@@ -4,6 +4,7 @@ import os
 import copy
 import re
 import collections
+import bisect
 import numpy as np
 import xml.etree.cElementTree as ElementTree
 
@@ -13,6 +14,7 @@ from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.io import fits
 from astropy.table import Table, Column
+from scipy.spatial import cKDTree
 
 import fermipy
 import fermipy.config
@@ -122,7 +124,7 @@ def get_skydir_distance_mask(src_skydir, skydir, dist, min_dist=None,
     Parameters
     ----------
 
-    src_skydir : `~astropy.coordinates.SkyCoord` 
+    src_skydir : `~astropy.coordinates.SkyCoord` or `SkyDirIndex`
       Array of sky directions.
 
     skydir : `~astropy.coordinates.SkyCoord` 
@@ -139,6 +141,10 @@ def get_skydir_distance_mask(src_skydir, skydir, dist, min_dist=None,
 
     """
 
+    if isinstance(src_skydir, SkyDirIndex):
+        return src_skydir.get_mask(skydir, dist, min_dist=min_dist,
+                                   square=square, coordsys=coordsys)
+
     if dist is None:
         dist = 180.
 
@@ -186,6 +192,303 @@ def get_dist_to_edge(skydir, lon, lat, width, coordsys='CEL'):
     return dtheta
 
 
+class SkyDirIndex(object):
+    """Spatial index for position queries on an ordered set of sky
+    coordinates.  Positions are stored as unit vectors in celestial
+    coordinates and circular selections are performed with a KD-tree
+    built on the unit sphere.  The index can be updated in place with
+    `insert` and `delete`.  The KD-tree and the
+    `~astropy.coordinates.SkyCoord` representation of the positions
+    are only created on request.
+
+    Parameters
+    ----------
+    radec : `~numpy.ndarray`
+        Array of celestial coordinates in degrees with shape (N,2).
+
+    xyz : `~numpy.ndarray`
+        Precomputed unit vectors with shape (N,3).
+
+    glonlat : `~numpy.ndarray`
+        Precomputed galactic coordinates in degrees with shape (N,2).
+
+    """
+
+    # Upper bound on the ratio of the angular distance to the
+    # projected distance max(|x|,|y|) in the AIT projection used by
+    # square selections.  A square selection of half-width R is
+    # contained in a circle of radius 2R.
+    square_radius_scale = 2.0
+
+    # Indices smaller than this are always searched with a linear
+    # scan.  Otherwise the KD-tree is rebuilt after the index has
+    # been queried this many times without being modified.
+    min_tree_size = 1024
+    tree_rebuild_queries = 8
+
+    def __init__(self, radec=None, xyz=None, glonlat=None):
+
+        if radec is None:
+            radec = np.zeros((0, 2))
+
+        radec = np.array(radec, dtype=float, ndmin=2).reshape((-1, 2))
+        self._n = len(radec)
+        self._radec = radec.copy()
+
+        if xyz is None:
+            xyz = utils.lonlat_to_xyz(np.radians(radec[:, 0]),
+                                      np.radians(radec[:, 1])).T
+        self._xyz = np.array(xyz, dtype=float).reshape((-1, 3))
+
+        if glonlat is not None:
+            glonlat = np.array(glonlat, dtype=float).reshape((-1, 2))
+        self._glonlat = glonlat
+        self._invalidate()
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def radec(self):
+        """Celestial coordinates in degrees with shape (N,2)."""
+        return self._radec[:self._n]
+
+    @property
+    def glonlat(self):
+        """Galactic coordinates in degrees with shape (N,2)."""
+        if self._glonlat is None:
+            self._glonlat = np.zeros(self._radec.shape)
+            if self._n:
+                glon, glat = utils.eq2gal(self.radec[:, 0], self.radec[:, 1])
+                self._glonlat[:self._n] = np.vstack((glon, glat)).T
+        return self._glonlat[:self._n]
+
+    @property
+    def xyz(self):
+        """Unit vectors with shape (N,3)."""
+        return self._xyz[:self._n]
+
+    @property
+    def skydir(self):
+        """Positions as a `~astropy.coordinates.SkyCoord` array."""
+        if self._skydir is None:
+            self._skydir = SkyCoord(ra=self.radec[:, 0],
+                                    dec=self.radec[:, 1], unit=u.deg)
+        return self._skydir
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = cKDTree(self.xyz)
+        return self._tree
+
+    @staticmethod
+    def skydir_to_xyz(skydir):
+        skydir = skydir.icrs
+        return utils.lonlat_to_xyz(skydir.ra.rad, skydir.dec.rad).reshape(3)
+
+    def _invalidate(self):
+        self._skydir = None
+        self._tree = None
+        self._nquery = 0
+
+    def _get_tree(self):
+        """Return the KD-tree or None if the query should be performed
+        with a linear scan."""
+
+        if self._tree is None:
+            self._nquery += 1
+            if (self._n < self.min_tree_size or
+                    self._nquery <= self.tree_rebuild_queries):
+                return None
+        return self.tree
+
+    def _insert_row(self, buf, pos, row):
+        n = self._n
+        if n == len(buf):
+            newbuf = np.zeros((max(2 * n, 16), buf.shape[1]))
+            newbuf[:n] = buf[:n]
+            buf = newbuf
+        buf[pos + 1:n + 1] = buf[pos:n]
+        buf[pos] = row
+        return buf
+
+    def insert(self, pos, radec):
+        """Insert a position before index ``pos``.
+
+        Parameters
+        ----------
+        pos : int
+            Index at which the position will be inserted.
+
+        radec : `~numpy.ndarray`
+            Celestial coordinates in degrees.
+
+        """
+        ra, dec = np.array(radec, dtype=float).reshape(2)
+        xyz = utils.lonlat_to_xyz(np.radians(ra), np.radians(dec))
+
+        self._radec = self._insert_row(self._radec, pos, [ra, dec])
+        self._xyz = self._insert_row(self._xyz, pos, xyz)
+        if self._glonlat is not None:
+            glon, glat = utils.eq2gal(ra, dec)
+            self._glonlat = self._insert_row(self._glonlat, pos,
+                                             [glon[0], glat[0]])
+        self._n += 1
+        self._invalidate()
+
+    def delete(self, idx):
+        """Delete the positions with indices ``idx``."""
+
+        msk = np.ones(self._n, dtype=bool)
+        msk[np.array(idx, dtype=int)] = False
+        n = np.sum(msk)
+
+        self._radec[:n] = self.radec[msk]
+        self._xyz[:n] = self.xyz[msk]
+        if self._glonlat is not None:
+            self._glonlat[:n] = self.glonlat[msk]
+        self._n = n
+        self._invalidate()
+
+    def separation(self, skydir, idx=None):
+        """Compute the angular distance in degrees between a sky
+        coordinate and the positions in the index.
+
+        Parameters
+        ----------
+        skydir : `~astropy.coordinates.SkyCoord`
+
+        idx : `~numpy.ndarray`
+            Indices of the positions.  If None all positions are
+            used.
+
+        """
+        xyz = self.xyz if idx is None else self.xyz[idx]
+        chord = np.sqrt(np.sum((xyz - self.skydir_to_xyz(skydir)) ** 2,
+                               axis=1))
+        return np.degrees(2.0 * np.arcsin(np.clip(0.5 * chord, 0.0, 1.0)))
+
+    def linear_dist(self, skydir, idx=None, coordsys='CEL'):
+        """Compute the projected distance max(|x|,|y|) in radians
+        between a sky coordinate and the positions in the index.  See
+        `get_linear_dist`."""
+
+        if coordsys == 'CEL':
+            lonlat = self.radec
+        elif coordsys == 'GAL':
+            lonlat = self.glonlat
+        else:
+            raise Exception('Unrecognized coordinate system: %s' % coordsys)
+
+        if idx is not None:
+            lonlat = lonlat[idx]
+
+        return get_linear_dist(skydir, np.radians(lonlat[:, 0]),
+                               np.radians(lonlat[:, 1]), coordsys=coordsys)
+
+    def query_radius(self, skydir, dist):
+        """Return the sorted indices of the positions within an
+        angular distance (in degrees) of a sky coordinate."""
+
+        if dist is None or dist >= 180.:
+            return np.arange(self._n)
+        elif not self._n:
+            return np.zeros(0, dtype=int)
+
+        xyz = self.skydir_to_xyz(skydir)
+        chord = 2.0 * np.sin(0.5 * np.radians(dist)) * (1.0 + 1E-8)
+        tree = self._get_tree()
+
+        if tree is None:
+            chord2 = np.sum((self.xyz - xyz) ** 2, axis=1)
+            return np.nonzero(chord2 <= chord ** 2)[0]
+
+        idx = tree.query_ball_point(xyz, chord)
+        return np.sort(np.array(idx, dtype=int))
+
+    def query_nearest(self, skydir, k=1):
+        """Find the k nearest positions to a sky coordinate.
+
+        Returns
+        -------
+        sep : `~numpy.ndarray`
+            Angular distance in degrees of the nearest positions.
+
+        idx : `~numpy.ndarray`
+            Indices of the nearest positions.
+
+        """
+        k = min(k, self._n)
+        if k == 0:
+            return np.zeros(0), np.zeros(0, dtype=int)
+
+        xyz = self.skydir_to_xyz(skydir)
+        tree = self._get_tree()
+
+        if tree is None:
+            chord = np.sqrt(np.sum((self.xyz - xyz) ** 2, axis=1))
+            idx = np.argpartition(chord, k - 1)[:k]
+            idx = idx[np.argsort(chord[idx])]
+            chord = chord[idx]
+        else:
+            chord, idx = tree.query(xyz, k=k)
+            chord = np.array(chord, ndmin=1)
+            idx = np.array(idx, ndmin=1)
+
+        return (np.degrees(2.0 * np.arcsin(np.clip(0.5 * chord, 0.0, 1.0))),
+                idx)
+
+    def get_mask(self, skydir, dist, min_dist=None, square=False,
+                 coordsys='CEL'):
+        """Return a boolean mask selecting positions within a certain
+        angular distance of a sky coordinate.  This is equivalent to
+        `get_skydir_distance_mask`."""
+
+        if dist is None:
+            dist = 180.
+
+        if square:
+            idx = self.query_radius(skydir,
+                                    dist * self.square_radius_scale)
+            dtheta = self.linear_dist(skydir, idx, coordsys=coordsys)
+        else:
+            idx = self.query_radius(skydir, dist)
+            dtheta = np.radians(self.separation(skydir, idx))
+
+        m = (dtheta < np.radians(dist))
+        if min_dist is not None:
+            m &= (dtheta > np.radians(min_dist))
+
+        msk = np.zeros(self._n, dtype=bool)
+        msk[idx[m]] = True
+        return msk
+
+
+def get_xml_source_radec(root):
+    """Extract the celestial coordinates of a source from its XML
+    node without parsing the rest of the source model.  Returns None
+    if the position is not defined by RA/DEC spatial parameters."""
+
+    spat = root.find('spatialModel')
+    if spat is None:
+        return None
+
+    if root.attrib.get('type') != 'PointSource' and \
+            spat.attrib.get('type') not in ['SpatialMap', 'RadialGaussian',
+                                            'RadialDisk']:
+        return None
+
+    pars = {}
+    for p in spat.findall('parameter'):
+        pars[p.attrib.get('name')] = p.attrib.get('value')
+
+    if pars.get('RA') is None or pars.get('DEC') is None:
+        return None
+
+    return float(pars['RA']), float(pars['DEC'])
+
+
 def get_params_dict(pars_dict):
 
     params = {}
@@ -198,6 +501,82 @@ def get_params_dict(pars_dict):
 
     return params
 
+def get_catalog_spectral_pars(spectrum_type, catalog):
+    """Create the spectral parameter dictionary of a source from the
+    values of its catalog entry.
+
+    Parameters
+    ----------
+    spectrum_type : str
+        Spectral model type.
+
+    catalog : dict
+        Dictionary of catalog columns for this source.
+
+    Returns
+    -------
+    spectral_pars : dict
+
+    """
+
+    sp = gtutils.get_function_defaults(spectrum_type)
+
+    if spectrum_type == 'PowerLaw':
+
+        sp['Prefactor']['value'] = catalog['Flux_Density']
+        sp['Prefactor']['scale'] = None
+        sp['Scale']['value'] = catalog['Pivot_Energy']
+        sp['Scale']['scale'] = 1.0
+        sp['Index']['value'] = catalog['Spectral_Index']
+        sp['Index']['max'] = max(5.0, sp['Index']['value'] + 1.0)
+        sp['Index']['min'] = min(0.0, sp['Index']['value'] - 1.0)
+        sp['Index']['scale'] = -1.0
+
+        sp['Prefactor'] = gtutils.make_parameter_dict(sp['Prefactor'])
+        sp['Scale'] = gtutils.make_parameter_dict(sp['Scale'], True)
+        sp['Index'] = gtutils.make_parameter_dict(sp['Index'])
+
+    elif spectrum_type == 'LogParabola':
+
+        sp['norm']['value'] = catalog['Flux_Density']
+        sp['norm']['scale'] = None
+        sp['Eb']['value'] = catalog['Pivot_Energy']
+        sp['alpha']['value'] = catalog['Spectral_Index']
+        sp['beta']['value'] = catalog['beta']
+
+        sp['norm'] = gtutils.make_parameter_dict(sp['norm'])
+        sp['Eb'] = gtutils.make_parameter_dict(sp['Eb'], True)
+        sp['alpha'] = gtutils.make_parameter_dict(sp['alpha'])
+        sp['beta'] = gtutils.make_parameter_dict(sp['beta'])
+
+    elif spectrum_type == 'PLSuperExpCutoff':
+
+        flux_density = catalog['Flux_Density']
+        flux_density *= np.exp(
+            (catalog['Pivot_Energy'] / catalog['Cutoff']) ** catalog[
+                'Exp_Index'])
+
+        sp['Prefactor']['value'] = flux_density
+        sp['Prefactor']['scale'] = None
+        sp['Index1']['value'] = catalog['Spectral_Index']
+        sp['Index1']['scale'] = -1.0
+        sp['Index2']['value'] = catalog['Exp_Index']
+        sp['Index2']['scale'] = 1.0
+        sp['Scale']['value'] = catalog['Pivot_Energy']
+        sp['Cutoff']['value'] = catalog['Cutoff']
+
+        sp['Prefactor'] = gtutils.make_parameter_dict(sp['Prefactor'])
+        sp['Scale'] = gtutils.make_parameter_dict(sp['Scale'], True)
+        sp['Index1'] = gtutils.make_parameter_dict(sp['Index1'])
+        sp['Index2'] = gtutils.make_parameter_dict(sp['Index2'])
+        sp['Cutoff'] = gtutils.make_parameter_dict(sp['Cutoff'])
+
+    else:
+        raise Exception('Unsupported spectral type:' + spectrum_type)
+
+    return sp
+
+
 class Model(object):
     """Base class for source objects.  This class is a container for both
     spectral and spatial parameters as well as other source properties
@@ -715,63 +1094,8 @@ class Source(Model):
         """Load spectral parameters from catalog values."""
 
         self._data['spectral_pars'] = \
-            gtutils.get_function_defaults(self['SpectrumType'])
-        sp = self['spectral_pars']
-
-        catalog = self.data.get('catalog', {})
-
-        if self['SpectrumType'] == 'PowerLaw':
-
-            sp['Prefactor']['value'] = catalog['Flux_Density']
-            sp['Prefactor']['scale'] = None
-            sp['Scale']['value'] = catalog['Pivot_Energy']
-            sp['Scale']['scale'] = 1.0
-            sp['Index']['value'] = catalog['Spectral_Index']
-            sp['Index']['max'] = max(5.0, sp['Index']['value'] + 1.0)
-            sp['Index']['min'] = min(0.0, sp['Index']['value'] - 1.0)
-            sp['Index']['scale'] = -1.0
-
-            sp['Prefactor'] = gtutils.make_parameter_dict(sp['Prefactor'])
-            sp['Scale'] = gtutils.make_parameter_dict(sp['Scale'], True)
-            sp['Index'] = gtutils.make_parameter_dict(sp['Index'])
-
-        elif self['SpectrumType'] == 'LogParabola':
-
-            sp['norm']['value'] = catalog['Flux_Density']
-            sp['norm']['scale'] = None
-            sp['Eb']['value'] = catalog['Pivot_Energy']
-            sp['alpha']['value'] = catalog['Spectral_Index']
-            sp['beta']['value'] = catalog['beta']
-
-            sp['norm'] = gtutils.make_parameter_dict(sp['norm'])
-            sp['Eb'] = gtutils.make_parameter_dict(sp['Eb'], True)
-            sp['alpha'] = gtutils.make_parameter_dict(sp['alpha'])
-            sp['beta'] = gtutils.make_parameter_dict(sp['beta'])
-
-        elif self['SpectrumType'] == 'PLSuperExpCutoff':
-
-            flux_density = catalog['Flux_Density']
-            flux_density *= np.exp(
-                (catalog['Pivot_Energy'] / catalog['Cutoff']) ** catalog[
-                    'Exp_Index'])
-
-            sp['Prefactor']['value'] = flux_density
-            sp['Prefactor']['scale'] = None
-            sp['Index1']['value'] = catalog['Spectral_Index']
-            sp['Index1']['scale'] = -1.0
-            sp['Index2']['value'] = catalog['Exp_Index']
-            sp['Index2']['scale'] = 1.0
-            sp['Scale']['value'] = catalog['Pivot_Energy']
-            sp['Cutoff']['value'] = catalog['Cutoff']
-
-            sp['Prefactor'] = gtutils.make_parameter_dict(sp['Prefactor'])
-            sp['Scale'] = gtutils.make_parameter_dict(sp['Scale'], True)
-            sp['Index1'] = gtutils.make_parameter_dict(sp['Index1'])
-            sp['Index2'] = gtutils.make_parameter_dict(sp['Index2'])
-            sp['Cutoff'] = gtutils.make_parameter_dict(sp['Cutoff'])
-
-        else:
-            raise Exception('Unsupported spectral type:' + self['SpectrumType'])
+            get_catalog_spectral_pars(self['SpectrumType'],
+                                      self.data.get('catalog', {}))
 
     def update_data(self, d):
         self._data = utils.merge_dict(self._data, d, add_new_keys=True)
@@ -1135,14 +1459,15 @@ class ROIModel(fermipy.config.Configurable):
                 os.path.join('$FERMIPY_DATA_DIR',
                              'catalogs', self.config['extdir'])
 
-        self._src_radius = self.config['src_radius']
         if self.config['src_roiwidth'] is not None:
             self._config['src_radius_roi'] = self.config['src_roiwidth'] * 0.5
 
         self._srcs = []
         self._diffuse_srcs = []
         self._src_dict = collections.defaultdict(set)
-        self._src_radius = []
+        self._src_index = SkyDirIndex()
+        self._src_offset = []
+        self._src_index_stale = False
 
         self.load(coordsys=coordsys)
 
@@ -1204,6 +1529,10 @@ class ROIModel(fermipy.config.Configurable):
     def point_sources(self):
         return self._srcs
 
+    @property
+    def _src_skydir(self):
+        return self._src_index.skydir
+
     @property
     def diffuse_sources(self):
         return self._diffuse_srcs
@@ -1218,7 +1547,9 @@ class ROIModel(fermipy.config.Configurable):
         self._srcs = []
         self._diffuse_srcs = []
         self._src_dict = collections.defaultdict(set)
-        self._src_radius = []
+        self._src_index = SkyDirIndex()
+        self._src_offset = []
+        self._src_index_stale = False
 
     def load_diffuse_srcs(self):
 
@@ -1326,6 +1657,34 @@ class ROIModel(fermipy.config.Configurable):
 
         return self.get_source_by_name(name)
 
+    def create_sources(self, sources, build_index=True,
+                       merge_sources=True):
+        """Add several new sources to the ROI model.  The source
+        index is rebuilt once after all sources have been loaded.
+
+        Parameters
+        ----------
+
+        sources : list
+            List of (name, src_dict) tuples where src_dict is a
+            dictionary or `~fermipy.roi_model.Source` object.
+
+        Returns
+        -------
+
+        srcs : list
+            List of `~fermipy.roi_model.Source` objects.
+        """
+
+        srcs = [self.create_source(name, src_dict, build_index=False,
+                                   merge_sources=merge_sources)
+                for name, src_dict in sources]
+
+        if build_index and srcs:
+            self._build_src_index()
+
+        return srcs
+
     def copy_source(self, name):
         src = self.get_source_by_name(name)
         return copy.deepcopy(src)
@@ -1366,16 +1725,22 @@ class ROIModel(fermipy.config.Configurable):
 
         """
         src = copy.deepcopy(src)
-        name = src.name.replace(' ', '').lower()
 
         min_sep = kwargs.get('min_separation',None)
 
         if min_sep is not None:
 
-            sep = src.skydir.separation(self._src_skydir).deg            
+            sep, _ = self._src_index.query_nearest(src.skydir)
             if len(sep) > 0 and np.min(sep) < min_sep:
-                return        
+                return
+
+        self._load_source(src, build_index, merge_sources)
+
+    def _load_source(self, src, build_index=True, merge_sources=True):
+        """Load a source without copying it.  The ROI takes ownership
+        of the source object."""
 
+        name = src.name.replace(' ', '').lower()
         match_srcs = self.match_source(src)
 
         if len(match_srcs) == 1:
@@ -1402,13 +1767,13 @@ class ROIModel(fermipy.config.Configurable):
         for name in src.names:
             self._src_dict[name.replace(' ', '').lower()].add(src)
 
-        if isinstance(src, Source):
-            self._srcs.append(src)
-        else:
+        if not isinstance(src, Source):
             self._diffuse_srcs.append(src)
-
-        if build_index:
-            self._build_src_index()
+        elif build_index:
+            self._insert_src_index(src)
+        else:
+            self._srcs.append(src)
+            self._src_index_stale = True
 
     def match_source(self,src):
         """Look for source or sources in the model that match the
@@ -1460,18 +1825,29 @@ class ROIModel(fermipy.config.Configurable):
 
         self._build_src_index()        
 
-    def delete_sources(self, srcs):
+    def delete_sources(self, srcs, build_index=True):
 
-        for k, v in self._src_dict.items():
+        for k, v in list(self._src_dict.items()):
             for s in srcs:
                 if s in v:
                     self._src_dict[k].remove(s)
             if not v:
                 del self._src_dict[k]
 
-        self._srcs = [s for s in self._srcs if s not in srcs]
+        names = set([s.name for s in srcs])
+        idx = [i for i, s in enumerate(self._srcs) if s.name in names]
+        self._srcs = [s for i, s in enumerate(self._srcs) if s.name not in names]
         self._diffuse_srcs = [s for s in self._diffuse_srcs if s not in srcs]
-        self._build_src_index()
+
+        if not idx:
+            return
+        elif not build_index:
+            self._src_index_stale = True
+        elif self._src_index_stale:
+            self._build_src_index()
+        else:
+            self._src_index.delete(idx)
+            self._src_offset = list(np.delete(self._src_offset, idx))
 
     @staticmethod
     def create_from_roi_data(datafile):
@@ -1719,14 +2095,12 @@ class ROIModel(fermipy.config.Configurable):
 
         """
 
-        msk = get_skydir_distance_mask(self._src_skydir, skydir, dist,
-                                       min_dist=min_dist, square=square,
-                                       coordsys=coordsys)
-
-        radius = self._src_skydir.separation(skydir).deg
-        radius = radius[msk]
+        msk = self._src_index.get_mask(skydir, dist, min_dist=min_dist,
+                                       square=square, coordsys=coordsys)
+        idx = np.nonzero(msk)[0]
 
-        srcs = [self._srcs[i] for i in np.nonzero(msk)[0]]
+        radius = self._src_index.separation(skydir, idx)
+        srcs = [self._srcs[i] for i in idx]
 
         isort = np.argsort(radius)
         radius = radius[isort]
@@ -1749,16 +2123,18 @@ class ROIModel(fermipy.config.Configurable):
         coordsys = kwargs.get('coordsys', 'CEL')
         extdir = kwargs.get('extdir', self.config['extdir'])
 
-        cat = catalog.Catalog.create(name)
+        cat = catalog.Catalog.create(name,
+                                     cachedir=self.config['catalog_cachedir'])
+        index = SkyDirIndex(cat.radec, xyz=cat.xyz, glonlat=cat.glonlat)
 
-        m0 = get_skydir_distance_mask(cat.skydir, self.skydir,
+        m0 = get_skydir_distance_mask(index, self.skydir,
                                       self.config['src_radius'])
-        m1 = get_skydir_distance_mask(cat.skydir, self.skydir,
+        m1 = get_skydir_distance_mask(index, self.skydir,
                                       self.config['src_radius_roi'],
                                       square=True, coordsys=coordsys)
         m = (m0 & m1)
 
-        offset = self.skydir.separation(cat.skydir).deg
+        offset = index.separation(self.skydir)
         offset_cel = wcs_utils.sky_to_offset(self.skydir,
                                          cat.radec[:, 0], cat.radec[:, 1],
                                          'CEL')
@@ -1766,47 +2142,54 @@ class ROIModel(fermipy.config.Configurable):
                                          cat.glonlat[:, 0], cat.glonlat[:, 1],
                                          'GAL')
 
-        for i, (row, radec) in enumerate(zip(cat.table[m],
-                                             cat.radec[m])):
+        # Extract the catalog columns of the selected rows in a
+        # single pass and create the sources directly from them
+        rows = catalog.table_to_dicts(cat.table[m])
+        radec = cat.radec[m]
+        offset = offset[m]
+        offset_cel = offset_cel[m]
+        offset_gal = offset_gal[m]
+
+        search_dirs = []
+        if extdir is not None:
+            search_dirs += [extdir, os.path.join(extdir, 'Templates')]
+
+        for i, catalog_dict in enumerate(rows):
 
-            catalog_dict = catalog.row_to_dict(row)
             src_dict = {'catalog': catalog_dict}
-            src_dict['Source_Name'] = row['Source_Name']
-            src_dict['SpectrumType'] = row['SpectrumType']
+            src_dict['Source_Name'] = catalog_dict['Source_Name']
+            src_dict['SpectrumType'] = catalog_dict['SpectrumType']
 
-            if row['extended']:
+            if catalog_dict['extended']:
                 src_dict['SourceType'] = 'DiffuseSource'
                 src_dict['SpatialType'] = 'SpatialMap'
                 src_dict['SpatialModel'] = 'SpatialMap'
 
-                search_dirs = []
-                if extdir is not None:
-                    search_dirs += [extdir, os.path.join(extdir, 'Templates')]
-
-                search_dirs += [row['extdir'],
-                                os.path.join(row['extdir'], 'Templates')]
-
                 src_dict['Spatial_Filename'] = utils.resolve_file_path(
-                    row['Spatial_Filename'],
-                    search_dirs=search_dirs)
+                    catalog_dict['Spatial_Filename'],
+                    search_dirs=search_dirs +
+                    [catalog_dict['extdir'],
+                     os.path.join(catalog_dict['extdir'], 'Templates')])
 
             else:
                 src_dict['SourceType'] = 'PointSource'
                 src_dict['SpatialType'] = 'SkyDirFunction'
                 src_dict['SpatialModel'] = 'PointSource'
 
-            src = Source(src_dict['Source_Name'], src_dict, radec=radec)
-            src.load_from_catalog()
-            src.data['offset'] = offset[m][i]
-            src.data['offset_ra'] = offset_cel[:, 0][m][i]
-            src.data['offset_dec'] = offset_cel[:, 1][m][i]
-            src.data['offset_glon'] = offset_gal[:, 0][m][i]
-            src.data['offset_glat'] = offset_gal[:, 1][m][i]
-            self.load_source(src, False,
-                             merge_sources=self.config['merge_sources'])
+            src_dict['spectral_pars'] = \
+                get_catalog_spectral_pars(src_dict['SpectrumType'],
+                                          catalog_dict)
 
-        self._build_src_index()
+            src = Source(src_dict['Source_Name'], src_dict, radec=radec[i])
+            src.data['offset'] = offset[i]
+            src.data['offset_ra'] = offset_cel[i, 0]
+            src.data['offset_dec'] = offset_cel[i, 1]
+            src.data['offset_glon'] = offset_gal[i, 0]
+            src.data['offset_glat'] = offset_gal[i, 1]
+            self._load_source(src, False,
+                              merge_sources=self.config['merge_sources'])
 
+        self._build_src_index()
 
     def load_xml(self, xmlfile, **kwargs):
         """Load sources from an XML file."""
@@ -1824,14 +2207,22 @@ class ROIModel(fermipy.config.Configurable):
         srcs = []
         ra, dec = [], []
 
+        # Sources with an explicit position are only parsed if they
+        # pass the ROI selection
         for s in root.findall('source'):
-            src = Source.create_from_xml(s, extdir=extdir)            
-            if src.diffuse:
-                diffuse_srcs += [src]
+            radec = get_xml_source_radec(s)
+            if radec is None:
+                src = Source.create_from_xml(s, extdir=extdir)
+                if src.diffuse:
+                    diffuse_srcs += [src]
+                    continue
+                radec = [src['RAJ2000'], src['DEJ2000']]
             else:
-                srcs += [src]
-                ra += [src['RAJ2000']]
-                dec += [src['DEJ2000']]
+                src = s
+
+            srcs += [src]
+            ra += [radec[0]]
+            dec += [radec[1]]
 
         src_skydir = SkyCoord(ra=np.array(ra) * u.deg,
                               dec=np.array(dec) * u.deg)
@@ -1851,19 +2242,21 @@ class ROIModel(fermipy.config.Configurable):
                                       self.config['src_radius_roi'],
                                       square=True, coordsys=coordsys)
         m = (m0 & m1)
-        srcs = np.array(srcs)[m]
-        for i, s in enumerate(srcs):
-            s.data['offset'] = offset[m][i]
-            s.data['offset_ra'] = offset_cel[:, 0][m][i]
-            s.data['offset_dec'] = offset_cel[:, 1][m][i]
-            s.data['offset_glon'] = offset_gal[:, 0][m][i]
-            s.data['offset_glat'] = offset_gal[:, 1][m][i]
-            self.load_source(s, False,
-                             merge_sources=self.config['merge_sources'])
+        for i in np.nonzero(m)[0]:
+            s = srcs[i]
+            if not isinstance(s, Model):
+                s = Source.create_from_xml(s, extdir=extdir)
+            s.data['offset'] = offset[i]
+            s.data['offset_ra'] = offset_cel[i, 0]
+            s.data['offset_dec'] = offset_cel[i, 1]
+            s.data['offset_glon'] = offset_gal[i, 0]
+            s.data['offset_glat'] = offset_gal[i, 1]
+            self._load_source(s, False,
+                              merge_sources=self.config['merge_sources'])
 
         for i, s in enumerate(diffuse_srcs):
-            self.load_source(s, False,
-                             merge_sources=self.config['merge_sources'])
+            self._load_source(s, False,
+                              merge_sources=self.config['merge_sources'])
 
         self._build_src_index()
 
@@ -1872,14 +2265,25 @@ class ROIModel(fermipy.config.Configurable):
         or coordinates."""
 
         self._srcs = sorted(self._srcs, key=lambda t: t['offset'])
-        nsrc = len(self._srcs)
-        radec = np.zeros((2, nsrc))
+        radec = np.array([src.radec for src in self._srcs]).reshape((-1, 2))
+
+        self._src_index = SkyDirIndex(radec)
+        self._src_offset = [src['offset'] for src in self._srcs]
+        self._src_index_stale = False
 
-        for i, src in enumerate(self._srcs):
-            radec[:, i] = src.radec
+    def _insert_src_index(self, src):
+        """Insert a source into the sorted source list and update the
+        source index in place."""
+
+        if self._src_index_stale:
+            self._srcs.append(src)
+            self._build_src_index()
+            return
 
-        self._src_skydir = SkyCoord(ra=radec[0], dec=radec[1], unit=u.deg)
-        self._src_radius = self._src_skydir.separation(self.skydir)
+        i = bisect.bisect_right(self._src_offset, src['offset'])
+        self._srcs.insert(i, src)
+        self._src_offset.insert(i, src['offset'])
+        self._src_index.insert(i, src.radec)
 
     def write_xml(self, xmlfile):
         """Save the ROI model as an XML file."""
@@ -7,6 +7,8 @@ import argparse
 import pyLikelihood as pyLike
 
 import numpy as np
+import healpy as hp
+from astropy.io import fits
 from astropy.coordinates import SkyCoord
 from astropy.table import Table, Column
 
@@ -14,6 +16,116 @@ from fermipy import utils
 from fermipy import spectrum
 from fermipy import irfs
 from fermipy import skymap
+from fermipy.hpx_utils import HPX
+
+# Arguments of compute_sensitivity_map_chunk shared by all chunks.
+# These are set in each worker process by _init_sensitivity_map_worker.
+_map_kwargs = None
+
+
+def compute_sensitivity_map_chunk(hpx, ipix, ltc, event_class, event_types,
+                                  ebins, galdiff, isov, fn, ts_thresh,
+                                  min_counts):
+    """Compute the differential sensitivity for a set of HEALPix
+    pixels.  The exposure, PSF, and background are evaluated for all
+    pixels of the chunk at once.
+
+    Parameters
+    ----------
+    hpx : `~fermipy.hpx_utils.HPX`
+        Geometry of the sensitivity map.
+
+    ipix : `~numpy.ndarray`
+        Indices of the pixels to evaluate.
+
+    galdiff : `~fermipy.skymap.Map`
+        Galactic diffuse model.
+
+    isov : `~numpy.ndarray`
+        Isotropic intensity at the energy bin centers.
+
+    Returns
+    -------
+    norms : `~numpy.ndarray`
+        Normalization of ``fn`` at threshold with shape (nebins,
+        len(ipix)).
+
+    npred : `~numpy.ndarray`
+        Predicted source counts at threshold with shape (nebins,
+        len(ipix)).
+    """
+    log_ebins = np.log10(ebins)
+    ectr = np.exp(utils.edge_to_center(np.log(ebins)))
+
+    theta, phi = hp.pix2ang(hpx.nside, ipix, hpx.nest)
+    frame = 'galactic' if hpx.coordsys == 'GAL' else 'icrs'
+    c = SkyCoord(np.degrees(phi), np.degrees(np.pi / 2. - theta),
+                 unit='deg', frame=frame)
+
+    glon = c.galactic.l.deg[:, np.newaxis] * np.ones((1, len(ectr)))
+    glat = c.galactic.b.deg[:, np.newaxis] * np.ones((1, len(ectr)))
+    egy = ectr[np.newaxis, :] * np.ones((len(ipix), 1))
+    bkgv = galdiff.interpolate(np.ravel(glon), np.ravel(glat),
+                               np.ravel(egy)).reshape(glon.shape)
+    bkgv += isov[np.newaxis, :]
+
+    dtheta = irfs.PSFModel.create_dtheta()
+    sig = []
+    bkg = []
+    for et in event_types:
+        psfv = irfs.PSFModel.create_average_psf(c, ltc, event_class, et,
+                                                dtheta, log_ebins)
+        expv = irfs.compute_exposure(c, ltc, event_class, et,
+                                     np.log10(ectr))
+        s, b = irfs.compute_ps_counts_table(ebins, expv, log_ebins, psfv,
+                                            bkgv.T, fn)
+        sig += [np.moveaxis(s, -1, 0)]
+        bkg += [np.moveaxis(b, -1, 0)]
+
+    sig = np.concatenate([np.expand_dims(t, -1) for t in sig], axis=-1)
+    bkg = np.concatenate([np.expand_dims(t, -1) for t in bkg], axis=-1)
+
+    norms = irfs.compute_norm(sig, bkg, ts_thresh, min_counts,
+                              sum_axes=[2, 3])
+    npred = np.apply_over_axes(np.sum, norms * sig, [2, 3])
+    return norms[:, :, 0, 0].T, npred[:, :, 0, 0].T
+
+
+def _init_sensitivity_map_worker(kwargs):
+    global _map_kwargs
+    _map_kwargs = kwargs
+
+
+def _compute_sensitivity_map_chunk(ipix):
+    return compute_sensitivity_map_chunk(ipix=ipix, **_map_kwargs)
+
+
+def compute_sensitivity_map(hpx, chunk_size=1000, nworkers=1, **kwargs):
+    """Compute the differential sensitivity for every pixel of a
+    HEALPix map.  The pixels are split into chunks of ``chunk_size``
+    which are evaluated with `compute_sensitivity_map_chunk`,
+    optionally in a pool of ``nworkers`` processes.  Remaining keyword
+    arguments are passed to `compute_sensitivity_map_chunk`."""
+
+    global _map_kwargs
+    ipix = np.arange(hpx.npix)
+    chunks = [ipix[i:i + chunk_size]
+              for i in range(0, len(ipix), chunk_size)]
+
+    # The shared arguments are passed to each worker once when it
+    # starts rather than with every chunk
+    try:
+        results = utils.pool_map(_compute_sensitivity_map_chunk, chunks,
+                                 nworkers, inherit_state=False,
+                                 initializer=_init_sensitivity_map_worker,
+                                 initargs=(dict(hpx=hpx, **kwargs),))
+    finally:
+        _map_kwargs = None
+
+    norms = np.concatenate([r[0] for r in results], axis=1)
+    npred = np.concatenate([r[1] for r in results], axis=1)
+    return norms, npred
+
 
 def main():
     usage = "usage: %(prog)s [options]"
@@ -52,6 +164,17 @@ def main():
     parser.add_argument('--obs_time_yr', default=None, type=float,
                         help='Rescale the livetime cube to this observation time in years.  If none then the '
                         'calculation will use the intrinsic observation time of the livetime cube.')
+    parser.add_argument('--nside', default=None, type=int,
+                        help='Compute an all-sky sensitivity map with this HEALPix nside.  If none then the '
+                        'sensitivity is computed for the direction given by --glon and --glat.')
+    parser.add_argument('--coordsys', default='GAL', choices=['GAL', 'CEL'],
+                        help='Coordinate system of the sensitivity map.')
+    parser.add_argument('--nest', default=False, action='store_true',
+                        help='Use NESTED pixel ordering for the sensitivity map.')
+    parser.add_argument('--chunk_size', default=1000, type=int,
+                        help='Number of map pixels evaluated at once.')
+    parser.add_argument('--nworkers', default=1, type=int,
+                        help='Number of processes used to compute the sensitivity map.')
     
     args = parser.parse_args()
     event_types = [['FRONT','BACK']]
@@ -70,11 +193,12 @@ def main():
         
         ltc = irfs.LTCube.create_empty(0,args.obs_time_yr*365*24*3600.,
                                        args.obs_time_yr*365*24*3600.)
-        ltc._counts *= ltc.domega[:,np.newaxis]/(4.*np.pi)
+        ltc.scale(ltc.domega[:, np.newaxis] / (4. * np.pi))
     else:
         ltc = irfs.LTCube.create(args.ltcube)
         if args.obs_time_yr is not None:
-            ltc._counts *= args.obs_time_yr*365*24*3600./(ltc.tstop-ltc.tstart)
+            ltc.scale(args.obs_time_yr * 365 * 24 * 3600. /
+                      (ltc.tstop - ltc.tstart))
     
     m0 = skymap.Map.create_from_fits(args.galdiff)
 
@@ -87,6 +211,11 @@ def main():
         isodiff = args.isodiff
 
     iso = np.loadtxt(isodiff,unpack=True)    
+
+    if args.nside is not None:
+        run_map(args, ltc, m0, iso, fn, event_types, ebins)
+        return
+
     sig = []
     bkg = []
     for et in event_types:
@@ -124,6 +253,37 @@ def main():
     tab = Table(cols)
     tab.write(args.output, format='fits', overwrite=True)
 
+
+def run_map(args, ltc, m0, iso, fn, event_types, ebins):
+    """Compute the sensitivity over a HEALPix grid and write it as a
+    set of HEALPix map extensions with one channel per energy bin."""
+
+    ectr = np.exp(utils.edge_to_center(np.log(ebins)))
+    isov = np.exp(np.interp(np.log(ectr),np.log(iso[0]),np.log(iso[1])))
+    hpx = HPX(args.nside, args.nest, args.coordsys, ebins=np.log10(ebins))
+
+    norms, npred = compute_sensitivity_map(hpx, chunk_size=args.chunk_size,
+                                           nworkers=args.nworkers,
+                                           ltc=ltc,
+                                           event_class=args.event_class,
+                                           event_types=event_types,
+                                           ebins=ebins, galdiff=m0,
+                                           isov=isov, fn=fn,
+                                           ts_thresh=args.ts_thresh,
+                                           min_counts=args.min_counts)
+
+    flux = norms*fn.flux(ebins[:-1],ebins[1:])[:,np.newaxis]
+    eflux = norms*fn.eflux(ebins[:-1],ebins[1:])[:,np.newaxis]
+    dnde = norms*fn.dfde(ectr)[:,np.newaxis]
+    e2dnde = ectr[:,np.newaxis]**2*dnde
+
+    hdus = [fits.PrimaryHDU()]
+    for name, data in [('FLUX',flux),('EFLUX',eflux),('DNDE',dnde),
+                       ('E2DNDE',e2dnde),('NPRED',npred)]:
+        hdus += [hpx.make_hdu(data,extname=name)]
+    hdus += [hpx.make_energy_bounds_hdu()]
+    fits.HDUList(hdus).writeto(args.output, clobber=True)
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,259 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""Content-addressed cache for the products of the ST applications
+run during analysis setup."""
+from __future__ import absolute_import, division, print_function
+import os
+import json
+import errno
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from astropy.io import fits
+import fermipy.utils as utils
+
+# Parameters that have no effect on the contents of the output file
+IGNORED_PARAMS = ['outfile', 'chatter', 'clobber', 'debug', 'gui', 'mode']
+
+
+def _file_id(path):
+    """Tuple that identifies the current version of a file."""
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime,
+            st.st_ino, st.st_dev)
+
+
+def md5_file(path, blocksize=2**20):
+    """Compute the MD5 digest of the contents of a file."""
+    m = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(blocksize)
+            if not buf:
+                break
+            m.update(buf)
+    return m.hexdigest()
+
+
+def gti_digest(path):
+    """Compute a digest of the good time intervals of an FT1 file.
+    The livetime cube generated by gtltcube depends on the event file
+    only through its GTIs so this digest can be used in place of the
+    digest of the full file."""
+    with fits.open(path) as hdulist:
+        gti = hdulist['GTI'].data
+        start = np.array(gti['START'], dtype=float)
+        stop = np.array(gti['STOP'], dtype=float)
+    m = hashlib.md5()
+    m.update(start.tobytes())
+    m.update(stop.tobytes())
+    return m.hexdigest()
+
+
+class SetupCache(object):
+    """Cache of the files generated by ST applications (e.g. gtltcube,
+    gtbin, gtexpcube2) that is shared between analyses.  Products are
+    stored under a key computed from the name of the application, its
+    parameters, and the contents of its input files.  A cached product
+    is linked into the working directory of an analysis in place of
+    running the application.  Products are hard-linked when the cache
+    and working directory are on the same filesystem and copied
+    otherwise.
+
+    Digests of input files are memoized in the cache directory and
+    recomputed only when the size, modification time, or inode of the
+    file changes.  When the total size of the cached products exceeds
+    ``maxsize`` the least recently used products are evicted.
+
+    Parameters
+    ----------
+    cachedir : str
+        Path to the cache directory.
+
+    maxsize : float
+        Maximum size of the cache in GB.  If None the size of the
+        cache is not limited.
+    """
+
+    def __init__(self, cachedir, maxsize=None):
+        self._cachedir = os.path.abspath(os.path.expandvars(cachedir))
+        self._maxsize = maxsize
+        self._digests = {}
+        for d in [self.productdir, self.digestdir]:
+            try:
+                os.makedirs(d)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @staticmethod
+    def create(config):
+        """Create a cache from the ``fileio`` configuration section.
+        Returns None if ``setup_cachedir`` is not set."""
+        if not config.get('setup_cachedir'):
+            return None
+        return SetupCache(config['setup_cachedir'],
+                          config.get('setup_cache_maxsize'))
+
+    @property
+    def cachedir(self):
+        return self._cachedir
+
+    @property
+    def productdir(self):
+        return os.path.join(self._cachedir, 'products')
+
+    @property
+    def digestdir(self):
+        return os.path.join(self._cachedir, 'digests')
+
+    @property
+    def psfdir(self):
+        """Directory in which the tables of `~fermipy.irfs.PSFModel`
+        are persisted."""
+        return os.path.join(self._cachedir, 'psf')
+
+    @property
+    def ltcubedir(self):
+        """Directory in which the summed livetime cubes loaded with
+        `~fermipy.irfs.LTCube.create` are persisted."""
+        return os.path.join(self._cachedir, 'ltcube')
+
+    def file_digest(self, path):
+        """Return the digest of the contents of a file."""
+
+        fid = _file_id(path)
+        if fid in self._digests:
+            return self._digests[fid]
+
+        idfile = os.path.join(self.digestdir,
+                              hashlib.md5(repr(fid).encode()).hexdigest())
+        try:
+            with open(idfile, 'r') as f:
+                digest = f.read().strip()
+        except IOError:
+            digest = None
+
+        if not digest:
+            digest = md5_file(path)
+            _write_atomic(idfile, digest.encode(), self.digestdir)
+
+        self._digests[fid] = digest
+        return digest
+
+    def get_key(self, appname, kw, digests=None):
+        """Compute the cache key of the output of an ST application.
+
+        Parameters
+        ----------
+        appname : str
+            Name of the application.
+
+        kw : dict
+            Application parameters.  Parameters with a value that is
+            the path to an existing file are replaced by the digest of
+            that file.
+
+        digests : dict
+            Dictionary of digests that override the digest of the
+            input file of the given parameter.
+        """
+
+        digests = {} if digests is None else digests
+        pars = {}
+        for k, v in kw.items():
+            if k in IGNORED_PARAMS or v is None:
+                continue
+            if k in digests:
+                pars[k] = digests[k]
+            elif utils.isstr(v) and os.path.isfile(v):
+                pars[k] = self.file_digest(v)
+            else:
+                pars[k] = repr(v)
+
+        s = json.dumps([appname, sorted(pars.items())])
+        return hashlib.sha1(s.encode()).hexdigest()
+
+    def get_path(self, key, outfile):
+        ext = os.path.splitext(outfile)[1]
+        return os.path.join(self.productdir, key + ext)
+
+    def fetch(self, key, outfile):
+        """Link the cached product with the given key to ``outfile``.
+        Returns True if the product was found in the cache."""
+
+        path = self.get_path(key, outfile)
+        if not os.path.isfile(path):
+            return False
+
+        if os.path.lexists(outfile):
+            os.remove(outfile)
+        try:
+            _link_or_copy(path, outfile)
+        except (IOError, OSError):
+            # The product may have been evicted by another process
+            return False
+
+        # Update the access time used for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, outfile):
+        """Add ``outfile`` to the cache under the given key."""
+
+        path = self.get_path(key, outfile)
+        fd, tmpfile = tempfile.mkstemp(prefix='.tmp', dir=self.productdir)
+        os.close(fd)
+        os.remove(tmpfile)
+        _link_or_copy(outfile, tmpfile)
+        os.rename(tmpfile, path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used products until the size of
+        the cache is below the maximum size.  Products that are still
+        hard-linked into a working directory are not removed since
+        doing so would not free any space."""
+
+        if self._maxsize is None:
+            return
+
+        entries = []
+        for name in os.listdir(self.productdir):
+            if name.startswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.productdir, name))
+            except OSError:
+                continue
+            entries += [(st.st_mtime, st.st_size, st.st_nlink, name)]
+
+        size = sum([t[1] for t in entries])
+        maxsize = self._maxsize * 1024**3
+        for mtime, nbytes, nlink, name in sorted(entries):
+            if size <= maxsize:
+                break
+            if nlink > 1:
+                continue
+            try:
+                os.remove(os.path.join(self.productdir, name))
+            except OSError:
+                pass
+            size -= nbytes
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def _write_atomic(path, data, dirname):
+    fd, tmpfile = tempfile.mkstemp(prefix='.tmp', dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.rename(tmpfile, path)
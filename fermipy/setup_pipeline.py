@@ -0,0 +1,255 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""Dependency-aware execution of the stages of analysis setup.  Each
+stage records a fingerprint of its parameters and inputs in a
+manifest file and is only rerun when that fingerprint changes."""
+from __future__ import absolute_import, division, print_function
+import os
+import json
+import time
+import hashlib
+import tempfile
+import fermipy.utils as utils
+
+# Parameters that have no effect on the contents of the output files
+IGNORED_PARAMS = ['chatter', 'clobber', 'debug', 'gui', 'mode']
+
+
+class SetupStage(object):
+    """A step of the setup pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    fn : callable
+        Function that generates the outputs of this stage.  It is
+        called with a single argument, the ``overwrite`` flag passed
+        to `SetupPipeline.run`.
+
+    outputs : list
+        Paths of the files generated by this stage.
+
+    apps : list
+        List of (appname, kw) tuples with the applications run by
+        this stage and their parameters.  Parameters that point to
+        an output of this stage or one of its dependencies are
+        identified by the name of that stage.  Parameters that point
+        to any other file are identified by the size and modification
+        time of the file.
+
+    deps : list
+        Names of the stages on which this stage depends.
+
+    digests : dict
+        Digests of input files keyed by parameter name.  These
+        override the size and modification time of the file in the
+        fingerprint (e.g. for a file that is regenerated with
+        identical contents).
+
+    transient : bool
+        Set to True if the outputs of this stage may be deleted once
+        they have been consumed.  Missing outputs of a transient stage
+        only trigger a rerun when a dependent stage needs to run.
+    """
+
+    def __init__(self, name, fn, outputs=None, apps=None, deps=None,
+                 digests=None, transient=False):
+        self.name = name
+        self.fn = fn
+        self.outputs = [] if outputs is None else list(outputs)
+        self.apps = [] if apps is None else list(apps)
+        self.deps = [] if deps is None else list(deps)
+        self.digests = {} if digests is None else dict(digests)
+        self.transient = transient
+
+    def outputs_exist(self):
+        return all([os.path.isfile(f) for f in self.outputs])
+
+    def fingerprint(self, stages, fingerprints):
+        """Compute the fingerprint of this stage.
+
+        Parameters
+        ----------
+        stages : dict
+            Dictionary of upstream stages keyed by name.
+
+        fingerprints : dict
+            Fingerprints of the upstream stages keyed by name.
+        """
+
+        products = {}
+        for s in [self] + [stages[d] for d in self.deps]:
+            for f in s.outputs:
+                products[os.path.abspath(f)] = s.name
+
+        apps = []
+        for appname, kw in self.apps:
+            pars = []
+            for k, v in sorted(kw.items()):
+                if k in IGNORED_PARAMS or v is None:
+                    continue
+                if k in self.digests:
+                    v = self.digests[k]
+                elif utils.isstr(v) and os.path.abspath(v) in products:
+                    v = '@' + products[os.path.abspath(v)]
+                elif utils.isstr(v) and os.path.isfile(v):
+                    st = os.stat(v)
+                    v = [v, st.st_size, st.st_mtime]
+                else:
+                    v = repr(v)
+                pars += [[k, v]]
+            apps += [[appname, pars]]
+
+        deps = [[d, fingerprints[d]] for d in self.deps]
+        s = json.dumps([self.name, apps, deps])
+        return hashlib.sha1(s.encode()).hexdigest()
+
+
+class SetupPipeline(object):
+    """Execute a sequence of `SetupStage` objects.  A stage is run if
+    its fingerprint differs from the one recorded in the manifest or
+    if one of its outputs is missing.  Because the fingerprint of a
+    stage includes the fingerprints of its dependencies, a change to
+    a stage invalidates every stage downstream of it.  Stages without
+    a manifest entry whose outputs already exist are adopted without
+    being rerun.
+
+    The manifest records the fingerprint, outputs, and execution time
+    of each stage.
+
+    Parameters
+    ----------
+    manifest_file : str
+        Path to the JSON manifest file.
+
+    logger : `logging.Logger`
+    """
+
+    def __init__(self, manifest_file, logger):
+        self._manifest_file = manifest_file
+        self._logger = logger
+        self._stages = []
+
+    @property
+    def stages(self):
+        return self._stages
+
+    @property
+    def manifest_file(self):
+        return self._manifest_file
+
+    def add_stage(self, stage):
+        """Append a stage.  Stages must be added after the stages
+        they depend on."""
+        names = [s.name for s in self._stages]
+        for d in stage.deps:
+            if d not in names:
+                raise ValueError('Stage %s depends on undefined stage %s' %
+                                 (stage.name, d))
+        self._stages += [stage]
+
+    def read_manifest(self):
+        return read_manifest(self._manifest_file)
+
+    def write_manifest(self, manifest):
+        dirname = os.path.dirname(os.path.abspath(self._manifest_file))
+        fd, tmpfile = tempfile.mkstemp(prefix='.tmp', dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.rename(tmpfile, self._manifest_file)
+
+    def get_stale_stages(self, overwrite=False):
+        """Return the names of the stages that need to be run."""
+
+        manifest = self.read_manifest()
+        stages = {}
+        fingerprints = {}
+        for s in self._stages:
+            fingerprints[s.name] = s.fingerprint(stages, fingerprints)
+            stages[s.name] = s
+
+        stale = set()
+        for s in self._stages:
+
+            entry = manifest['stages'].get(s.name)
+            if overwrite:
+                stale.add(s.name)
+            elif entry is None:
+                # Adopt existing outputs unless an upstream stage changed
+                if any([d in stale for d in s.deps]) or \
+                        (not s.transient and not s.outputs_exist()):
+                    stale.add(s.name)
+            elif entry.get('fingerprint') != fingerprints[s.name]:
+                stale.add(s.name)
+            elif not s.transient and not s.outputs_exist():
+                stale.add(s.name)
+
+        # Regenerate transient outputs required by a stage that runs
+        for s in reversed(self._stages):
+            if s.name in stale or not s.transient or s.outputs_exist():
+                continue
+            if any([s.name in t.deps for t in self._stages
+                    if t.name in stale]):
+                stale.add(s.name)
+
+        return [s.name for s in self._stages if s.name in stale], \
+            fingerprints
+
+    def run(self, overwrite=False):
+        """Run the stages of the pipeline that are out of date.
+
+        Parameters
+        ----------
+        overwrite : bool
+            Rerun all stages regardless of the contents of the
+            manifest.
+        """
+
+        stale, fingerprints = self.get_stale_stages(overwrite)
+        manifest = self.read_manifest()
+
+        for s in self._stages:
+
+            entry = manifest['stages'].setdefault(s.name, {})
+
+            if s.name not in stale:
+                self._logger.debug('Skipping stage %s', s.name)
+                if not entry:
+                    entry.update(fingerprint=fingerprints[s.name],
+                                 outputs=s.outputs, elapsed=None,
+                                 timestamp=None)
+                continue
+
+            self._logger.debug('Running stage %s', s.name)
+            t0 = time.time()
+            s.fn(overwrite)
+            entry.update(fingerprint=fingerprints[s.name],
+                         outputs=s.outputs, elapsed=time.time() - t0,
+                         timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            # Update the manifest after each stage so that completed
+            # stages are not repeated if a later stage fails
+            self.write_manifest(manifest)
+
+        self.write_manifest(manifest)
+        return stale
+
+    def record(self, name, elapsed):
+        """Record the execution time of a stage that is not managed
+        by the pipeline (e.g. creation of the likelihood object)."""
+        manifest = self.read_manifest()
+        manifest['stages'].setdefault(name, {}).update(
+            elapsed=elapsed, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self.write_manifest(manifest)
+
+
+def read_manifest(manifest_file):
+    """Read a setup manifest.  Returns an empty manifest if the file
+    does not exist or cannot be parsed."""
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        manifest = {}
+    manifest.setdefault('stages', {})
+    return manifest
@@ -508,6 +508,14 @@ class HpxMap(Map_Base):
         
         pix = hp.ang2pix(self.hpx.nside,theta,phi,nest=self.hpx.nest)
 
+        if self.hpx.region is not None:
+            pix = self.hpx[np.asarray(pix)]
+            vals = self.data[...,pix].astype(float)
+            vals[...,pix < 0] = np.nan
+            if self.data.ndim == 2 and ibin is not None:
+                return vals[ibin]
+            return vals
+
         if self.data.ndim == 2:
             return self.data[:,pix] if ibin is None else self.data[ibin,pix] 
         else:
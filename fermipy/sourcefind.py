@@ -4,17 +4,36 @@ import copy
 import pprint
 import logging
 import numpy as np
+import scipy.optimize
 from astropy.coordinates import SkyCoord
 import fermipy.config
 import fermipy.utils as utils
 import fermipy.wcs_utils as wcs_utils
+import fermipy.gtutils as gtutils
 from fermipy.sourcefind_utils import fit_error_ellipse
 from fermipy.sourcefind_utils import find_peaks
 from fermipy.skymap import Map
+from fermipy.tsmap import cash
 from fermipy.config import ConfigSchema
+import pyLikelihood as pyLike
 from LikelihoodState import LikelihoodState
 
 
+def _tsmap_kernel_key(src):
+    """Return a key that is shared by all sources whose TS map test
+    source kernel is identical.  Point sources share a kernel when
+    they have the same spectral function and the same values of all
+    spectral parameters other than the normalization."""
+
+    if src['SpatialModel'] != 'PointSource':
+        return src.name
+
+    norm_par = gtutils.get_function_norm_par_name(src['SpectrumType'])
+    pars = [(k, float(v['value']) * float(v['scale']))
+            for k, v in sorted(src.spectral_pars.items()) if k != norm_par]
+    return tuple([src['SpectrumType']] + pars)
+
+
 class SourceFinder(object):
     """Mixin class which provides source-finding functionality to
     `~fermipy.gtanalysis.GTAnalysis`."""
@@ -197,11 +216,12 @@ class SourceFinder(object):
             names = sd['Names']
             src_dicts = sd['SrcDicts']
 
-        # Loop over the seeds and add them to the model
+        # Loop over the seeds and collect the ones to add to the model
         new_src_names = []
+        new_srcs = []
         for name, src_dict in zip(names, src_dicts):
             # Protect against finding the same source twice
-            if self.roi.has_source(name):
+            if self.roi.has_source(name) or name in new_src_names:
                 self.logger.info('Source %s found again.  Ignoring it.' % name)
                 continue
             # Skip the source if it's outside the search region
@@ -217,13 +237,17 @@ class SourceFinder(object):
                                      name)
                     continue
 
-            self.add_source(name, src_dict, free=True)
-            self.free_source(name, False)
+            new_srcs.append((name, src_dict))
             new_src_names.append(name)
 
             if len(new_src_names) >= sources_per_iter:
                 break
 
+        # Add all seeds with a single update of the source maps
+        self.add_sources(new_srcs, free=True)
+        for name in new_src_names:
+            self.free_source(name, False)
+
         # Re-fit spectral parameters of each source individually
         for name in new_src_names:
             self.logger.info('Performing spectral fit for %s.',name)
@@ -239,7 +263,7 @@ class SourceFinder(object):
 
         return srcs, peaks
 
-    def localize(self, name, **kwargs):
+    def localize(self, name=None, names=None, **kwargs):
         """Find the best-fit position of a source.  Localization is
         performed in two steps.  First a TS map is computed centered
         on the source with half-width set by ``dtheta_max``.  A fit is
@@ -255,6 +279,15 @@ class SourceFinder(object):
         name : str
             Source name.
 
+        names : list
+            List of source names.  If this argument is given all
+            sources in the list are localized in a single batch.  The
+            counts and background maps used to compute the TS map of
+            each source are extracted once and the test source kernel
+            is shared between point sources with the same spectral
+            shape.  The TS maps of all sources are computed before
+            any source position is refined.
+
         dtheta_max : float
             Maximum offset in RA/DEC in deg from the nominal source
             position that will be used to define the boundaries of the
@@ -267,6 +300,15 @@ class SourceFinder(object):
             determined from the TS map peak fit.  The total number of
             sampling points will be nstep**2.
 
+        method : str
+            Method used to refine the source position after the TS
+            map fit.  With ``scan`` the likelihood is evaluated on a
+            grid of nstep x nstep points.  With ``optimize`` the
+            position is found with a Nelder-Mead search on the sky
+            offset starting from the TS map peak and the uncertainty
+            ellipse is fit to a 3 x 3 stencil of likelihood
+            evaluations around the best-fit position.
+
         fix_background : bool
             Fix background parameters when fitting the source position.
 
@@ -290,10 +332,19 @@ class SourceFinder(object):
         localize : dict
             Dictionary containing results of the localization
             analysis.  This dictionary is also saved to the
-            dictionary of this source in 'localize'.
+            dictionary of this source in 'localize'.  If ``names``
+            is given this is a dictionary keyed by source name
+            containing the results for each source.
 
         """
 
+        if names is not None:
+            return self._localize_batch(names, **kwargs)
+
+        return self._localize(name, **kwargs)
+
+    def _localize(self, name, tsmap=None, **kwargs):
+
         name = self.roi.get_source_by_name(name).name
 
         schema = ConfigSchema(self.defaults['localize'],
@@ -322,8 +373,11 @@ class SourceFinder(object):
         skywcs = self._skywcs
         src_pix = skydir.to_pixel(skywcs)
 
-        tsmap_fit, tsmap = self._localize_tsmap(name, prefix=prefix,
-                                                dtheta_max=dtheta_max)
+        if tsmap is None:
+            tsmap_fit, tsmap = self._localize_tsmap(name, prefix=prefix,
+                                                    dtheta_max=dtheta_max)
+        else:
+            tsmap_fit = self._fit_tsmap_position(tsmap)
 
         self.logger.debug('Completed localization with TS Map.\n'
                           '(ra,dec) = (%10.4f,%10.4f)\n'
@@ -349,37 +403,51 @@ class SourceFinder(object):
 
         cdelt0 = np.abs(skywcs.wcs.cdelt[0])
         cdelt1 = np.abs(skywcs.wcs.cdelt[1])
-        scan_step = 2.0 * tsmap_fit['r95'] / (nstep - 1.0)
-
-        self.logger.debug('Refining localization search to '
-                          'region of width: %.4f deg',
-                          tsmap_fit['r95'])
-
-        scan_map = Map.create(SkyCoord(tsmap_fit['ra'],
-                                       tsmap_fit['dec'], unit='deg'),
-                              scan_step, (nstep, nstep),
-                              coordsys=wcs_utils.get_coordsys(skywcs))
-
-        scan_skydir = scan_map.get_pixel_skydirs()
-
-        lnlscan = dict(wcs=scan_map.wcs.to_header().items(),
-                       loglike=np.zeros((nstep, nstep)),
-                       dloglike=np.zeros((nstep, nstep)),
-                       dloglike_fit=np.zeros((nstep, nstep)))
-
-        for i, t in enumerate(scan_skydir):
-            model_name = '%s_localize' % (name.replace(' ', '').lower())
-            src.set_name(model_name)
-            src.set_position(t)
-            self.add_source(model_name, src, free=True,
-                            init_source=False, save_source_maps=False,
-                            loglevel=logging.DEBUG)
-            fit_output = self._fit(
-                loglevel=logging.DEBUG, **config['optimizer'])
-
-            loglike1 = fit_output['loglike']
-            lnlscan['loglike'].flat[i] = loglike1
-            self.delete_source(model_name, loglevel=logging.DEBUG)
+        coordsys = wcs_utils.get_coordsys(skywcs)
+        tsmap_skydir = SkyCoord(tsmap_fit['ra'], tsmap_fit['dec'], unit='deg')
+
+        model_name = '%s_localize' % (name.replace(' ', '').lower())
+        src.set_name(model_name)
+        loglike_fn = self._create_position_fn(src, tsmap_skydir,
+                                              config['optimizer'])
+
+        try:
+
+            if config['method'] == 'optimize':
+                scan_center = self._optimize_position(loglike_fn,
+                                                      tsmap_skydir,
+                                                      tsmap_fit['sigma'],
+                                                      coordsys)
+                scan_nstep = 3
+                scan_step = tsmap_fit['r68']
+                self.logger.debug('Fitting localization stencil with '
+                                  'step size: %.4f deg', scan_step)
+            elif config['method'] == 'scan':
+                scan_center = tsmap_skydir
+                scan_nstep = nstep
+                scan_step = 2.0 * tsmap_fit['r95'] / (nstep - 1.0)
+                self.logger.debug('Refining localization search to '
+                                  'region of width: %.4f deg',
+                                  tsmap_fit['r95'])
+            else:
+                raise Exception('Unrecognized method: %s' % config['method'])
+
+            scan_map = Map.create(scan_center, scan_step,
+                                  (scan_nstep, scan_nstep),
+                                  coordsys=coordsys)
+
+            scan_skydir = scan_map.get_pixel_skydirs()
+
+            lnlscan = dict(wcs=scan_map.wcs.to_header().items(),
+                           loglike=np.zeros((scan_nstep, scan_nstep)),
+                           dloglike=np.zeros((scan_nstep, scan_nstep)),
+                           dloglike_fit=np.zeros((scan_nstep, scan_nstep)))
+
+            for i, t in enumerate(scan_skydir):
+                lnlscan['loglike'].flat[i] = loglike_fn(t)
+
+        finally:
+            self._delete_position_fn(src)
 
         lnlscan['dloglike'] = lnlscan['loglike'] - np.max(lnlscan['loglike'])
         scan_tsmap = Map(2.0 * lnlscan['dloglike'].T, scan_map.wcs)
@@ -389,7 +457,12 @@ class SourceFinder(object):
         self._sync_params(name)
         self._update_roi()
 
-        scan_fit, new_skydir = fit_error_ellipse(scan_tsmap, dpix=3)
+        if config['method'] == 'optimize':
+            # Fit the stencil around its central point
+            scan_fit, new_skydir = fit_error_ellipse(scan_tsmap, xy=(1, 1),
+                                                     dpix=1)
+        else:
+            scan_fit, new_skydir = fit_error_ellipse(scan_tsmap, dpix=3)
         o.update(scan_fit)
 
         o['loglike_loc'] = np.max(lnlscan['loglike'])+0.5*scan_fit['offset']
@@ -475,6 +548,86 @@ class SourceFinder(object):
         self.logger.info('Finished localization.')
         return o
 
+    def _create_position_fn(self, src, skydir, optimizer):
+        """Create a function that evaluates the likelihood of the
+        model with a test source at a given position.  Where possible
+        the test source is added to the model once and its source map
+        is updated in place for each position.  If only normalization
+        parameters are free the fit at each position is then performed
+        with the NEWTON fitter.  The test source is removed with
+        `_delete_position_fn`."""
+
+        spatial_model = src['SpatialModel']
+        spatial_width = src['SpatialWidth']
+
+        if (not hasattr(self.components[0].like.logLike,
+                        'setSourceMapImage') or
+                spatial_model not in ['PointSource', 'PSFSource',
+                                      'RadialGaussian', 'GaussianSource',
+                                      'RadialDisk', 'DiskSource']):
+
+            def loglike_fn(t):
+                src.set_position(t)
+                self.add_source(src.name, src, free=True,
+                                init_source=False, save_source_maps=False,
+                                loglevel=logging.DEBUG)
+                fit_output = self._fit(loglevel=logging.DEBUG, **optimizer)
+                self.delete_source(src.name, loglevel=logging.DEBUG)
+                return fit_output['loglike']
+
+            return loglike_fn
+
+        optimizer = copy.deepcopy(optimizer)
+        if hasattr(pyLike, 'FitScanCache'):
+            optimizer['optimizer'] = 'NEWTON'
+
+        src.set_position(skydir)
+        src.set_spatial_model('PSFSource', spatial_width)
+        self.add_source(src.name, src, free=True, init_source=False,
+                        loglevel=logging.DEBUG)
+        self._fitcache = None
+
+        def loglike_fn(t):
+            self._update_srcmap(src.name, t, spatial_model, spatial_width)
+            fit_output = self._fit(loglevel=logging.DEBUG, **optimizer)
+            return fit_output['loglike']
+
+        return loglike_fn
+
+    def _delete_position_fn(self, src):
+
+        if self.roi.has_source(src.name):
+            self.delete_source(src.name, save_template=False,
+                               loglevel=logging.DEBUG)
+        self._fitcache = None
+
+    def _optimize_position(self, loglike_fn, skydir, scale, coordsys,
+                           xtol=0.05, ftol=0.01):
+        """Find the position that maximizes the likelihood with a
+        Nelder-Mead search on the sky offset from ``skydir``.  The
+        search is performed in a local projection with pixel size
+        ``scale`` (e.g. the positional uncertainty from the TS map
+        fit) and ``xtol`` is expressed in the same units."""
+
+        wcs = Map.create(skydir, scale, (1, 1), coordsys=coordsys).wcs
+
+        def fn(xy):
+            t = SkyCoord.from_pixel(xy[0], xy[1], wcs)
+            return -loglike_fn(t)
+
+        res = scipy.optimize.minimize(fn, np.zeros(2), method='Nelder-Mead',
+                                      options={'xatol': xtol,
+                                               'fatol': ftol,
+                                               'initial_simplex':
+                                               [[0.0, 0.0], [1.0, 0.0],
+                                                [0.0, 1.0]]})
+
+        self.logger.debug('Position optimizer finished after %i likelihood '
+                          'evaluations with offset (%.3f,%.3f) deg',
+                          res.nfev, res.x[0] * scale, res.x[1] * scale)
+
+        return SkyCoord.from_pixel(res.x[0], res.x[1], wcs)
+
     def _localize_tscube(self, name, **kwargs):
         """Localize a source from a TS map generated with
         `~fermipy.gtanalysis.GTAnalysis.tscube`. """
@@ -525,14 +678,98 @@ class SourceFinder(object):
                            map_size=2.0 * dtheta_max,
                            exclude=[name], make_plots=False)
 
+        return self._fit_tsmap_position(tsmap), tsmap
+
+    def _localize_tsmap_batch(self, names, prefix='', dtheta_max=0.5):
+        """Compute the localization TS maps of a list of sources.  The
+        counts and background maps are extracted once for all sources
+        and test source kernels are reused between sources with the
+        same spectral shape."""
+
+        config = self._create_tsmap_config()
+        threshold = config.get('threshold', 1E-2)
+        data = self._make_tsmap_data(config['loge_bounds'], names)
+
+        # Model counts of each of the sources being localized
+        src_maps = {}
+        for name in names:
+            src_maps[name] = [c.model_counts_map(name).counts.astype('float')[eslice, ...]
+                              for c, eslice in zip(self.components,
+                                                   data['eslices'])]
+
+        src_maps_sum = [np.sum([src_maps[name][i] for name in names], axis=0)
+                        for i in range(len(self.components))]
+
+        kernels = {}
+        o = {}
+        for name in names:
+
+            src = self.roi.copy_source(name)
+
+            # Background model with all sources except this one
+            src_data = copy.copy(data)
+            src_data['bkg'] = [bm + ms - m for bm, ms, m in
+                               zip(data['bkg'], src_maps_sum, src_maps[name])]
+            src_data['c0_map'] = [cash(cm, bm) for cm, bm in
+                                  zip(data['counts'], src_data['bkg'])]
+
+            key = _tsmap_kernel_key(src)
+            if key not in kernels:
+                kernels[key] = self._make_tsmap_kernel(
+                    src.data, src_data, threshold, config['max_kernel_radius'])
+
+            # A shared kernel carries the model of the source it was
+            # created for
+            kernel = dict(kernels[key])
+            kernel['src_dict'] = self._make_tsmap_src_dict(src.data)
+
+            src_config = self._create_tsmap_config(model=src.data,
+                                                   map_skydir=src.skydir,
+                                                   map_size=2.0 * dtheta_max,
+                                                   exclude=[name],
+                                                   make_plots=False)
+            o[name] = self._make_tsmap_fast(
+                utils.join_strings([prefix, name.lower().replace(' ', '_')]),
+                data=src_data, kernel=kernel, **src_config)
+
+        self.logger.debug('Generated %i TS maps with %i test source kernels.',
+                          len(names), len(kernels))
+
+        return o
+
+    def _fit_tsmap_position(self, tsmap):
+        """Fit the position and positional uncertainty of the peak in
+        a localization TS map."""
+
         posfit, skydir = fit_error_ellipse(tsmap['ts'], dpix=2)
-        pix = skydir.to_pixel(skywcs)
+        pix = skydir.to_pixel(self._skywcs)
 
         o = {}
         o.update(posfit)
         o['xpix'] = float(pix[0])
         o['ypix'] = float(pix[1])
-        return o, tsmap
+        return o
+
+    def _localize_batch(self, names, **kwargs):
+
+        if 'newname' in kwargs:
+            raise Exception('newname cannot be used when localizing '
+                            'multiple sources.')
+
+        names = [self.roi.get_source_by_name(t).name for t in names]
+        config = utils.create_dict(self.config['localize'], **kwargs)
+
+        self.logger.info('Generating TS maps for %i sources', len(names))
+
+        tsmaps = self._localize_tsmap_batch(names,
+                                            prefix=kwargs.get('prefix', ''),
+                                            dtheta_max=config['dtheta_max'])
+
+        o = {}
+        for name in names:
+            o[name] = self._localize(name, tsmap=tsmaps[name], **kwargs)
+
+        return o
 
     def _localize_pylike(self, name, **kwargs):
         pass
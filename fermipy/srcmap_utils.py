@@ -1,13 +1,106 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import, division, print_function
+import os
+import time
+import errno
+from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
 import astropy.io.fits as pyfits
 import fermipy.utils as utils
 import fermipy.wcs_utils as wcs_utils
 
 
+class RadialProfileCache(object):
+    """Least-recently-used cache of the PSF-convolved radial profiles
+    of extended sources.  The profile of a source does not depend on
+    its position within the map so it can be reused whenever a source
+    map is regenerated with the same PSF, spatial model, and width.
+    Profiles are evicted in least-recently-used order once the total
+    size of the cached profiles exceeds ``max_bytes``.
+
+    Cached entries hold a reference to their PSF model such that the
+    PSF object identity used in the cache key remains unique for the
+    lifetime of the entry."""
+
+    def __init__(self, max_bytes=128 * 1024**2):
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._cache = OrderedDict()
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def set_max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self._cache.clear()
+        self._nbytes = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, psf, spatial_model, sigma, psf_scale_fn=None):
+        """Return the radial profile of a PSF-convolved extended
+        source, computing it if it is not present in the cache.
+
+        Parameters
+        ----------
+        psf : `~fermipy.irfs.PSFModel`
+
+        spatial_model : str
+            Spatial model.
+
+        sigma : float
+            Spatial size parameter.
+
+        psf_scale_fn : callable
+            Function that evaluates the PSF scaling function.
+        """
+
+        if psf_scale_fn is None:
+            psf_scale_fn = psf.scale_fn
+
+        key = (id(psf), psf_scale_fn, spatial_model, float(sigma),
+               np.asarray(psf.energies).tobytes())
+
+        if key in self._cache:
+            v = self._cache.pop(key)
+            self._cache[key] = v
+            return v[1]
+
+        if spatial_model in ['GaussianSource', 'RadialGaussian']:
+            profile = utils.make_cgauss_profile(psf, sigma, psf_scale_fn)
+        elif spatial_model in ['DiskSource', 'RadialDisk']:
+            profile = utils.make_cdisk_profile(psf, sigma, psf_scale_fn)
+        else:
+            raise Exception('Unrecognized spatial model: %s' % spatial_model)
+
+        self._cache[key] = (psf, profile)
+        self._nbytes += profile.nbytes
+        self._evict()
+        return profile
+
+    def _evict(self):
+
+        while self._nbytes > self._max_bytes and self._cache:
+            k, v = self._cache.popitem(last=False)
+            self._nbytes -= v[1].nbytes
+
+
+# Process-wide cache of radial profiles used by make_srcmap
+profile_cache = RadialProfileCache()
+
+
 def make_srcmap(skydir, psf, spatial_model, sigma, npix=500, xpix=0.0, ypix=0.0,
-                cdelt=0.01, rebin=1, psf_scale_fn=None):
+                cdelt=0.01, rebin=1, psf_scale_fn=None, use_cache=True):
     """Compute the source map for a given spatial model.
 
     Parameters
@@ -37,12 +130,21 @@ def make_srcmap(skydir, psf, spatial_model, sigma, npix=500, xpix=0.0, ypix=0.0,
         Function that evaluates the PSF scaling function.
         Argument is energy in MeV.
 
+    use_cache : bool
+        Look up the radial profile of extended sources in
+        `profile_cache` rather than recomputing it.
+
     """
 
     energies = psf.energies
     nebin = len(energies)
 
-    if spatial_model == 'GaussianSource' or spatial_model == 'RadialGaussian':
+    if spatial_model in ['GaussianSource', 'RadialGaussian',
+                         'DiskSource', 'RadialDisk'] and use_cache:
+        profile = profile_cache.get(psf, spatial_model, sigma, psf_scale_fn)
+        k = utils.make_radial_kernel(psf.dtheta, profile, npix * rebin,
+                                     cdelt / rebin, xpix * rebin, ypix * rebin)
+    elif spatial_model == 'GaussianSource' or spatial_model == 'RadialGaussian':
         k = utils.make_cgauss_kernel(psf, sigma, npix * rebin, cdelt / rebin,
                                      xpix * rebin, ypix * rebin,
                                      psf_scale_fn)
@@ -65,6 +167,66 @@ def make_srcmap(skydir, psf, spatial_model, sigma, npix=500, xpix=0.0, ypix=0.0,
     return k
 
 
+def shift_kernel(k, dx, dy, flux_tol=1E-3):
+    """Translate a source map kernel by a sub-pixel offset.  The
+    kernel of each energy plane is shifted by multiplying its Fourier
+    transform with a phase ramp.  Because the shifted kernel is only
+    an approximation to one generated at the new position the result
+    is checked for flux conservation: the fraction of flux that
+    would wrap around the map edges and the fraction of flux lost
+    when clipping negative pixels generated by ringing must both be
+    less than ``flux_tol`` in every energy plane.  The clipped kernel
+    is rescaled to the flux of the input kernel.
+
+    Parameters
+    ----------
+    k : `~numpy.ndarray`
+        Kernel cube with shape (nebin, ny, nx).
+
+    dx : float
+        Offset in pixels along the X (last) dimension.
+
+    dy : float
+        Offset in pixels along the Y dimension.
+
+    flux_tol : float
+        Maximum fractional change in the flux of any energy plane.
+
+    Returns
+    -------
+    k : `~numpy.ndarray` or None
+        Shifted kernel or None if the shifted kernel does not pass
+        the flux conservation check.
+    """
+
+    ny, nx = k.shape[-2:]
+
+    # Flux that would wrap around the edges of the map
+    nedge = int(np.ceil(max(np.abs(dx), np.abs(dy))))
+    flux = np.sum(k, axis=(-2, -1))
+    flux_edge = flux - np.sum(k[..., nedge:ny - nedge, nedge:nx - nedge],
+                              axis=(-2, -1))
+    m = flux > 0
+    if np.any(flux_edge[m] / flux[m] > flux_tol):
+        return None
+
+    fx = np.fft.rfftfreq(nx)[np.newaxis, :]
+    fy = np.fft.fftfreq(ny)[:, np.newaxis]
+    ramp = np.exp(-2j * np.pi * (fx * dx + fy * dy))
+
+    kf = np.fft.rfft2(k, axes=(-2, -1))
+    ks = np.fft.irfft2(kf * ramp, s=(ny, nx), axes=(-2, -1))
+
+    ks[ks < 0] = 0.0
+    flux_shift = np.sum(ks, axis=(-2, -1))
+
+    if np.any(np.abs(flux_shift[m] / flux[m] - 1.0) > flux_tol):
+        return None
+
+    ks[m] *= (flux[m] / flux_shift[m])[:, np.newaxis, np.newaxis]
+    return ks
+
+
 def make_cgauss_mapcube(skydir, psf, sigma, outfile, npix=500, cdelt=0.01,
                         rebin=1):
     energies = psf.energies
@@ -145,8 +307,94 @@ def make_disk_spatial_map(skydir, sigma, outfile, npix=501, cdelt=0.01):
     hdulist.writeto(outfile, clobber=True)
 
 
-def delete_source_map(srcmap_file, names, logger=None):
+# Prefix added to the EXTNAME of source map HDUs that have been
+# deleted but not yet removed from the file
+DELETED_PREFIX = 'DELETED_'
+
+# Number of times each source map file (keyed by absolute path) has
+# been written under lock_source_maps in this process
+_srcmap_generation = {}
+
+
+@contextmanager
+def lock_source_maps(srcmap_file, timeout=600., poll=0.1):
+    """Context manager that acquires an exclusive lock on a source
+    map file.  The lock is implemented with a lock file
+    (``srcmap_file`` + '.lock') that is created atomically and removed
+    when the context exits.  Releasing the lock invalidates the
+    index of every `FITSSourceMapStore` for the file in this process.
+
+    Parameters
+    ----------
+    srcmap_file : str
+       Path to the source map file.
+
+    timeout : float
+       Maximum time in seconds to wait for the lock.
+
+    poll : float
+       Time in seconds between attempts to acquire the lock.
+    """
+
+    lockfile = srcmap_file + '.lock'
+    key = os.path.abspath(srcmap_file)
+    tstart = time.time()
+    while True:
+        try:
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            if time.time() - tstart > timeout:
+                raise Exception('Timed out waiting for lock on source map '
+                                'file: %s' % lockfile)
+            time.sleep(poll)
+
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        # Invalidate cached indices of the file (see
+        # FITSSourceMapStore)
+        _srcmap_generation[key] = _srcmap_generation.get(key, 0) + 1
+        os.remove(lockfile)
+
+
+def compact_source_maps(srcmap_file, logger=None):
+    """Rewrite a source map file without the HDUs of deleted source
+    maps.
+
+    Parameters
+    ----------
+    srcmap_file : str
+       Path to the source map file.
+    """
+
+    with lock_source_maps(srcmap_file):
+        _compact_source_maps(srcmap_file, logger)
+
+
+def _compact_source_maps(srcmap_file, logger=None):
+
+    if logger is not None:
+        logger.debug('Compacting source map file %s' % srcmap_file)
+
+    hdulist = pyfits.open(srcmap_file)
+    hdus = [hdu for hdu in hdulist
+            if not hdu.name.upper().startswith(DELETED_PREFIX)]
+    tmpfile = srcmap_file + '.tmp'
+    pyfits.HDUList(hdus).writeto(tmpfile, clobber=True)
+    hdulist.close()
+    os.rename(tmpfile, srcmap_file)
+
+
+def delete_source_map(srcmap_file, names, logger=None, compact_fraction=0.5):
     """Delete a map from a binned analysis source map file if it exists.
+    Deleted maps are only marked as deleted by renaming their HDU in
+    place.  The file is compacted once the deleted maps account for
+    more than ``compact_fraction`` of its size.
 
     Parameters
     ----------
@@ -156,40 +404,147 @@ def delete_source_map(srcmap_file, names, logger=None):
     names : list
        List of HDU keys of source maps to be deleted.
 
+    compact_fraction : float
+       Fraction of the file size occupied by deleted maps above which
+       the file will be compacted.
+
     """
-    hdulist = pyfits.open(srcmap_file)
-    hdunames = [hdu.name.upper() for hdu in hdulist]
 
     if not isinstance(names,list):
         names = [names]
 
-    for name in names:        
-        if not name.upper() in hdunames:
-            continue
-        del hdulist[name.upper()]
+    with lock_source_maps(srcmap_file):
+
+        with pyfits.open(srcmap_file, mode='update', memmap=True) as hdulist:
+            hdunames = [hdu.name.upper() for hdu in hdulist]
 
-    hdulist.writeto(srcmap_file, clobber=True)
+            for name in set([t.upper() for t in names]):
+                if not name in hdunames:
+                    continue
+                hdulist[name].header['EXTNAME'] = DELETED_PREFIX + name
+
+            nbytes = [hdu.filebytes() for hdu in hdulist]
+            nbytes_deleted = [n for n, hdu in zip(nbytes, hdulist)
+                              if hdu.name.upper().startswith(DELETED_PREFIX)]
+
+        if np.sum(nbytes_deleted) > compact_fraction * np.sum(nbytes):
+            _compact_source_maps(srcmap_file, logger)
 
 
 def update_source_maps(srcmap_file, srcmaps, logger=None):
-    hdulist = pyfits.open(srcmap_file)
-    hdunames = [hdu.name.upper() for hdu in hdulist]
+    """Update or add maps in a binned analysis source map file.
+    Existing maps with the same shape are overwritten in place through
+    a memory-mapped view of the file and new maps are appended to the
+    end of the file.  Neither operation rewrites the other maps in the
+    file.
 
-    for name, data in srcmaps.items():
+    Parameters
+    ----------
+    srcmap_file : str
+       Path to the source map file.
 
-        if not name.upper() in hdunames:
+    srcmaps : dict
+       Dictionary of source map arrays keyed by HDU name.
 
-            for hdu in hdulist[1:]:
-                if hdu.header['XTENSION'] == 'IMAGE':
-                    break
+    """
+
+    newhdus = []
 
-            newhdu = pyfits.ImageHDU(data, hdu.header, name=name)
-            newhdu.header['EXTNAME'] = name
-            hdulist.append(newhdu)
+    with lock_source_maps(srcmap_file):
 
-        if logger is not None:
-            logger.debug('Updating source map for %s' % name)
+        with pyfits.open(srcmap_file, mode='update', memmap=True) as hdulist:
+            hdunames = [hdu.name.upper() for hdu in hdulist]
 
-        hdulist[name].data[...] = data
+            header = hdulist[0].header
+            for hdu in hdulist[1:]:
+                if hdu.header['XTENSION'] == 'IMAGE':
+                    header = hdu.header
+                    break
 
-    hdulist.writeto(srcmap_file, clobber=True)
+            for name, data in srcmaps.items():
+
+                if logger is not None:
+                    logger.debug('Updating source map for %s' % name)
+
+                if name.upper() in hdunames:
+
+                    if hdulist[name].data.shape == data.shape:
+                        hdulist[name].data[...] = data
+                        continue
+
+                    hdulist[name].header['EXTNAME'] = \
+                        DELETED_PREFIX + name.upper()
+
+                newhdu = pyfits.ImageHDU(data, header, name=name)
+                newhdu.header['EXTNAME'] = name
+                newhdus.append(newhdu)
+
+        if newhdus:
+            with pyfits.open(srcmap_file, mode='append') as hdulist:
+                for newhdu in newhdus:
+                    hdulist.append(newhdu)
+
+
+class FITSSourceMapStore(object):
+    """Container of the source maps of a pyLikelihood source map FITS
+    file.  The store holds one map per source keyed by the
+    (upper-case) source name.  Maps are loaded lazily when they are
+    accessed and the list of source names is cached.  The cache is
+    invalidated whenever the file is written under `lock_source_maps`
+    in this process or when its modification time, size, or inode
+    changes.  Call `invalidate` after writing the file by other means
+    (e.g. with gtsrcmaps or pyLikelihood)."""
+
+    def __init__(self, path):
+        self._path = path
+        self._index = None
+        self._state = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def invalidate(self):
+        """Force the list of HDU names to be re-read."""
+        self._index = None
+
+    def names(self):
+        """Return the list of source names in the store."""
+        st = os.stat(self.path)
+        state = (_srcmap_generation.get(os.path.abspath(self.path), 0),
+                 st.st_mtime, st.st_size, st.st_ino)
+        if self._index is None or state != self._state:
+            hdulist = pyfits.open(self.path)
+            self._index = [hdu.name.upper() for hdu in hdulist[1:]
+                           if hdu.header['XTENSION'] == 'IMAGE' and
+                           not hdu.name.upper().startswith(DELETED_PREFIX)]
+            hdulist.close()
+            self._state = state
+        return self._index
+
+    def __contains__(self, name):
+        return name.upper() in self.names()
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self.get(name)
+
+    def get(self, name):
+        """Load the map of a single source."""
+        with pyfits.open(self.path, memmap=True) as hdulist:
+            return np.array(hdulist[name.upper()].data)
+
+    def update(self, srcmaps, logger=None):
+        """Add or replace source maps.
+
+        Parameters
+        ----------
+        srcmaps : dict
+           Dictionary of source map arrays keyed by source name.
+        """
+        update_source_maps(self.path, srcmaps, logger=logger)
+
+    def delete(self, names, logger=None):
+        """Delete source maps from the store."""
+        delete_source_map(self.path, names, logger=logger)
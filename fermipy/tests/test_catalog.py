@@ -0,0 +1,40 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+from __future__ import absolute_import, division, print_function
+import os
+import numpy as np
+from numpy.testing import assert_allclose
+from astropy.tests.helper import pytest
+from fermipy import catalog
+
+
+@pytest.fixture(scope='module')
+def tmppath(request, tmpdir_factory):
+    path = tmpdir_factory.mktemp('tmpdir')
+    return path
+
+
+def test_catalog_cache(tmppath):
+
+    catalog.clear_cache()
+    cat0 = catalog.Catalog.create('3FGL')
+    cat1 = catalog.Catalog.create('3FGL')
+    assert cat0 is cat1
+    assert_allclose(np.sum(cat0.xyz ** 2, axis=1), 1.0)
+
+    cat2 = catalog.Catalog.create('3FGL', cache=False)
+    assert cat2 is not cat0
+    assert_allclose(cat2.radec, cat0.radec)
+
+    cachedir = str(tmppath)
+    catalog.clear_cache()
+    cat3 = catalog.Catalog.create('3FGL', cachedir=cachedir)
+    assert len(os.listdir(cachedir)) == 1
+
+    catalog.clear_cache()
+    cat4 = catalog.Catalog.create('3FGL', cachedir=cachedir)
+    assert cat4 is not cat3
+    assert isinstance(cat4, catalog.Catalog3FGL)
+    assert len(cat4.table) == len(cat0.table)
+    assert_allclose(cat4.radec, cat0.radec)
+    assert_allclose(cat4.glonlat, cat0.glonlat)
+    assert_allclose(cat4.xyz, cat0.xyz)
@@ -4,11 +4,14 @@ import os
 import numpy as np
 from numpy.testing import assert_allclose
 from astropy.tests.helper import pytest
+from astropy.io import fits
+from astropy.wcs import WCS
 from fermipy.tests.utils import requires_dependency
 from fermipy import spectrum
 
 try:
     from fermipy import gtanalysis
+    from fermipy import irfs
 except ImportError:
     pass
 
@@ -57,6 +60,26 @@ def test_gtanalysis_load_roi(setup):
     gta.load_roi('fit0')
 
 
+def test_gtanalysis_exposure_cube(setup, tmpdir):
+    gta = setup
+    c = gta.components[0]
+
+    # Compare the native exposure calculation with gtexpcube2
+    with fits.open(c.files['bexpmap_roi']) as hdulist:
+        exp0 = hdulist[0].data
+        wcs = WCS(hdulist[0].header).dropaxis(2)
+        log_energies = np.log10(hdulist['ENERGIES'].data['Energy'])
+
+    outfile = str(tmpdir.join('bexpmap_native.fits'))
+    irfs.make_exposure_cube(outfile, c._ltc, c.config['gtlike']['irfs'],
+                            c.config['selection']['evtype'], log_energies,
+                            wcs=wcs, npix=exp0.shape[:0:-1])
+    exp1 = fits.getdata(outfile)
+
+    assert exp1.shape == exp0.shape
+    assert_allclose(exp1, exp0, rtol=0.01)
+
+
 def test_gtanalysis_optimize(setup):
     gta = setup
     gta.load_roi('fit0')
@@ -194,6 +217,46 @@ def test_gtanalysis_extension_gaussian(setup):
     gta.simulate_roi(restore=True)
 
 
+def test_gtanalysis_extension_brent(setup):
+    gta = setup
+    gta.simulate_roi(restore=True)
+    gta.load_roi('fit1')
+    np.random.seed(1)
+    spatial_width = 0.5
+
+    gta.simulate_source({'SpatialModel': 'GaussianSource',
+                         'SpatialWidth': spatial_width,
+                         'Prefactor': 3E-12})
+
+    o = gta.extension('draco', method='brent',
+                      width_min=0.1, width_max=1.0,
+                      spatial_model='GaussianSource')
+
+    assert_allclose(o['ext'], spatial_width, atol=0.1)
+    assert o['width'][0] == 0.0
+    assert len(o['width']) == len(o['loglike'])
+    assert len(o['width']) - 1 <= 12
+    assert o['ext_ul95'] > o['ext']
+
+    gta.simulate_roi(restore=True)
+
+
+def test_gtanalysis_extension_nworkers(setup):
+    gta = setup
+    gta.load_roi('fit1')
+    width = [0.1, 0.2, 0.3, 0.4]
+
+    o0 = gta.extension('draco', width=width, nworkers=1,
+                       write_fits=False, write_npy=False)
+    o1 = gta.extension('draco', width=width, nworkers=2,
+                       write_fits=False, write_npy=False)
+
+    # Every width is fitted from the same starting point so the
+    # profiles are independent of the number of workers
+    assert_allclose(o0['loglike'], o1['loglike'], rtol=1E-10)
+    assert_allclose(o0['ts_ext'], o1['ts_ext'], atol=1E-6)
+
+
 def test_gtanalysis_localization(setup):
     gta = setup
     gta.simulate_roi(restore=True)
@@ -220,3 +283,102 @@ def test_gtanalysis_localization(setup):
     gta.delete_source('testloc')
 
     gta.simulate_roi(restore=True)
+
+
+def test_gtanalysis_localization_optimize(setup):
+    gta = setup
+    gta.simulate_roi(restore=True)
+    gta.load_roi('fit1')
+    np.random.seed(1)
+
+    src_dict = {'SpatialModel': 'PointSource',
+                'Prefactor': 4E-12,
+                'glat': 36.0, 'glon': 86.0}
+
+    gta.simulate_source(src_dict)
+
+    src_dict['glat'] = 36.05
+    src_dict['glon'] = 86.05
+
+    gta.add_source('testloc', src_dict, free=True)
+    gta.fit()
+
+    result = gta.localize('testloc', method='optimize', dtheta_max=0.5)
+
+    assert result['fit_success'] is True
+    assert_allclose(result['glon'], 86.0, atol=0.02)
+    assert_allclose(result['glat'], 36.0, atol=0.02)
+    assert result['lnlscan']['loglike'].shape == (3, 3)
+    gta.delete_source('testloc')
+
+    gta.simulate_roi(restore=True)
+
+
+def test_gtanalysis_localization_batch(setup):
+    gta = setup
+    gta.simulate_roi(restore=True)
+    gta.load_roi('fit1')
+    np.random.seed(1)
+
+    src_dict0 = {'SpatialModel': 'PointSource',
+                 'Prefactor': 4E-12,
+                 'glat': 36.0, 'glon': 86.0}
+    src_dict1 = {'SpatialModel': 'PointSource',
+                 'Prefactor': 4E-12,
+                 'glat': 36.5, 'glon': 86.5}
+
+    gta.simulate_source(src_dict0)
+    gta.simulate_source(src_dict1)
+
+    src_dict0['glat'] = 36.05
+    src_dict0['glon'] = 86.05
+    src_dict1['glat'] = 36.45
+    src_dict1['glon'] = 86.45
+
+    gta.add_source('testloc0', src_dict0, free=True)
+    gta.add_source('testloc1', src_dict1, free=True)
+    gta.fit()
+
+    result = gta.localize(names=['testloc0', 'testloc1'], dtheta_max=0.5)
+
+    assert result['testloc0']['fit_success'] is True
+    assert_allclose(result['testloc0']['glon'], 86.0, atol=0.02)
+    assert_allclose(result['testloc0']['glat'], 36.0, atol=0.02)
+    assert result['testloc1']['fit_success'] is True
+    assert_allclose(result['testloc1']['glon'], 86.5, atol=0.02)
+    assert_allclose(result['testloc1']['glat'], 36.5, atol=0.02)
+    assert 'localize' in gta.roi['testloc0']
+    gta.delete_source('testloc0')
+    gta.delete_source('testloc1')
+
+    gta.simulate_roi(restore=True)
+
+
+def test_gtanalysis_add_sources(setup):
+    gta = setup
+    gta.load_roi('fit1')
+
+    npred = gta.model_counts_spectrum('3FGL J1707.4+3955')[0].sum()
+    srcs = {'testsrc%i' % i: {'SpatialModel': 'PointSource',
+                              'Prefactor': 1E-12,
+                              'glat': 36.0 + 0.2 * i, 'glon': 86.0}
+            for i in range(3)}
+
+    gta.add_sources(srcs, free=True)
+    for name in srcs.keys():
+        assert gta.roi.has_source(name)
+        assert name in gta.like.sourceNames()
+        assert gta.like.normPar(name).isFree()
+
+    gta.edit_sources(add={'testsrc3': srcs['testsrc0']},
+                     delete=['testsrc0'])
+    assert not gta.roi.has_source('testsrc0')
+    assert gta.roi.has_source('testsrc3')
+    assert not gta.like.normPar('testsrc3').isFree()
+
+    gta.delete_sources(names=['testsrc1', 'testsrc2', 'testsrc3'])
+    for i in range(4):
+        assert not gta.roi.has_source('testsrc%i' % i)
+
+    assert_allclose(gta.model_counts_spectrum('3FGL J1707.4+3955')[0].sum(),
+                    npred)
@@ -4,9 +4,12 @@ import os
 import numpy as np
 from numpy.testing import assert_allclose
 from astropy.tests.helper import pytest
+from astropy.io import fits
 from astropy.coordinates import SkyCoord
 from fermipy.tests.utils import requires_dependency
 from fermipy import spectrum
+from fermipy import utils
+from fermipy import srcmap_utils
 
 try:
     from fermipy import irfs
@@ -37,6 +40,106 @@ def test_psfmodel():
                               0.09068469,  0.08329654]))
 
 
+def test_psfmodel_tables():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    c = SkyCoord(10.0, 10.0, unit='deg')
+    psf = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                        log_energies, ndtheta=400, ncth=20)
+
+    # The table lookup should reproduce linear interpolation of log(PSF)
+    dtheta = np.concatenate(([0.0, 1E-5, 1E-4, 100.0],
+                             np.linspace(0.0, 10.0, 1001),
+                             np.logspace(-4, 1.75, 100)))
+    for i in range(len(log_energies)):
+        vals = np.exp(np.interp(dtheta, psf.dtheta, np.log(psf.val[:, i])))
+        assert_allclose(psf.eval(i, dtheta), vals, rtol=1E-10)
+        assert_allclose(psf.interp(10**log_energies[i], dtheta), vals,
+                        rtol=1E-10)
+
+
+def test_psf_kernels():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    c = SkyCoord(10.0, 10.0, unit='deg')
+    psf = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'], log_energies,
+                        ndtheta=400, ncth=20)
+
+    npix, cdelt = 41, 0.1
+    x = utils.make_pixel_offset(npix, 0.3, -0.2) * cdelt
+
+    k = utils.make_psf_kernel(psf, npix, cdelt, 0.3, -0.2)
+    for i in range(len(log_energies)):
+        assert_allclose(k[i], psf.eval(i, x), rtol=1E-6)
+
+    k = utils.make_cgauss_kernel(psf, 0.5, npix, cdelt, 0.3, -0.2)
+    for i in range(len(log_energies)):
+        psfc = utils.convolve2d_gauss(lambda t: psf.eval(i, t), psf.dtheta,
+                                      0.5 / 1.5095921854516636)
+        assert_allclose(k[i], np.interp(x, psf.dtheta, psfc), rtol=1E-6)
+
+    k = utils.make_cdisk_kernel(psf, 0.5, npix, cdelt, 0.3, -0.2)
+    for i in range(len(log_energies)):
+        psfc = utils.convolve2d_disk(lambda t: psf.eval(i, t), psf.dtheta, 0.5)
+        assert_allclose(k[i], np.interp(x, psf.dtheta, psfc), rtol=1E-6)
+
+
+def test_srcmap_profile_cache():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    c = SkyCoord(10.0, 10.0, unit='deg')
+    psf = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'], log_energies,
+                        ndtheta=400, ncth=20)
+
+    cache = srcmap_utils.profile_cache
+    cache.clear()
+
+    for spatial_model in ['RadialGaussian', 'RadialDisk']:
+        k0 = srcmap_utils.make_srcmap(c, psf, spatial_model, 0.5, npix=41,
+                                      xpix=0.3, ypix=-0.2, cdelt=0.1,
+                                      use_cache=False)
+        k1 = srcmap_utils.make_srcmap(c, psf, spatial_model, 0.5, npix=41,
+                                      xpix=0.3, ypix=-0.2, cdelt=0.1)
+        k2 = srcmap_utils.make_srcmap(c, psf, spatial_model, 0.5, npix=41,
+                                      xpix=-0.1, ypix=0.4, cdelt=0.1)
+        k3 = srcmap_utils.make_srcmap(c, psf, spatial_model, 0.5, npix=41,
+                                      xpix=-0.1, ypix=0.4, cdelt=0.1,
+                                      use_cache=False)
+        assert_allclose(k0, k1)
+        assert_allclose(k2, k3)
+
+    assert len(cache) == 2
+    cache.set_max_bytes(cache.nbytes // 2)
+    assert len(cache) == 1
+    cache.clear()
+    cache.set_max_bytes(128 * 1024**2)
+
+
+def test_srcmap_shift_kernel():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(3.0, 5.0, 5)
+    c = SkyCoord(10.0, 10.0, unit='deg')
+    psf = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'], log_energies,
+                        ndtheta=400, ncth=20)
+
+    k0 = srcmap_utils.make_srcmap(c, psf, 'RadialGaussian', 0.3, npix=101,
+                                  xpix=0.2, ypix=0.1, cdelt=0.05, rebin=5)
+    k1 = srcmap_utils.make_srcmap(c, psf, 'RadialGaussian', 0.3, npix=101,
+                                  xpix=0.45, ypix=-0.2, cdelt=0.05, rebin=5)
+    ks = srcmap_utils.shift_kernel(k0, 0.25, -0.3, flux_tol=1E-2)
+
+    assert ks is not None
+    assert_allclose(np.sum(ks, axis=(1, 2)), np.sum(k0, axis=(1, 2)))
+    assert_allclose(ks, k1, atol=1E-3 * np.max(k1))
+
+    # Shifting a kernel with significant flux at the map edge should fail
+    assert srcmap_utils.shift_kernel(k0[:, 40:61, 40:61], 0.5, 0.5) is None
+
+
 def test_ltcube():
 
     ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
@@ -46,3 +149,195 @@ def test_ltcube():
     lthist0 = ltc.get_skydir_lthist(c, cth_edges)
     lthist1 = ltc.get_skydir_lthist(c, ltc.costh_edges)
     assert_allclose(np.sum(lthist0), np.sum(lthist1))
+
+    # Multiple directions
+    c = SkyCoord([10.0, 50.0, 200.0], [10.0, -20.0, 60.0], unit='deg')
+    lthist2 = ltc.get_skydir_lthist(c, cth_edges)
+    assert lthist2.shape == (3, 10)
+    for i in range(3):
+        assert_allclose(lthist2[i], ltc.get_skydir_lthist(c[i], cth_edges))
+
+
+def test_psfmodel_cache(tmpdir):
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    c = SkyCoord(10.0, 10.0, unit='deg')
+    cachedir = str(tmpdir.join('psf'))
+
+    irfs.psf_cache.clear()
+    psf0 = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                         log_energies, use_cache=False)
+    psf1 = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                         log_energies, cachedir=cachedir)
+    assert len(irfs.psf_cache) == 1
+    assert len(os.listdir(cachedir)) == 1
+
+    # Tables are reloaded from disk once evicted from memory
+    irfs.psf_cache.clear()
+    psf2 = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                         log_energies, cachedir=cachedir)
+    for psf in [psf1, psf2]:
+        assert_allclose(psf.val, psf0.val)
+        assert_allclose(psf.exp, psf0.exp)
+
+    psf3 = irfs.PSFModel(c, ltc, 'P8R2_SOURCE_V6', ['FRONT'],
+                         log_energies, cachedir=cachedir)
+    assert len(os.listdir(cachedir)) == 2
+    irfs.psf_cache.clear()
+
+
+def test_exposure():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    exp = irfs.Exposure.create(ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                               log_energies)
+    assert exp.data.shape == (9, ltc.hpx.npix)
+
+    aeff = irfs.create_aeff_sum('P8R2_SOURCE_V6', 3, log_energies,
+                                ltc.costh_center)
+    assert_allclose(exp.data[:, 0], np.sum(aeff, axis=1))
+
+    # Restricting the map to a region should not change the exposure
+    expr = irfs.Exposure.create(ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                                log_energies, region='DISK(10.0,10.0,5.0)')
+    assert expr.data.shape[1] < exp.data.shape[1]
+    assert_allclose(expr.get_map_values(10.0, 10.0),
+                    exp.get_map_values(10.0, 10.0))
+    assert np.all(np.isnan(expr.get_map_values(100.0, -30.0)))
+
+    # Livetime-dependent efficiency correction
+    ltc_wt = irfs.LTCube(ltc.data, ltc.hpx, ltc.costh_edges, ltc.tstart,
+                         ltc.tstop, data_wt=0.8 * ltc.data)
+    expw = irfs.Exposure.create(ltc_wt, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                                log_energies)
+    expv = np.zeros(len(log_energies))
+    for et in ['FRONT', 'BACK']:
+        aeff = irfs.create_aeff('P8R2_SOURCE_V6', et, log_energies,
+                                ltc.costh_center)
+        f1, f2 = irfs.create_efficiency('P8R2_SOURCE_V6', et, log_energies)
+        expv += np.sum(aeff, axis=1) * (f1 + 0.8 * f2)
+    assert_allclose(expw.data[:, 0], expv)
+
+    # Scaling the livetime cube scales the corrected exposure
+    ltc_wt.scale(10.0)
+    exps = irfs.Exposure.create(ltc_wt, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                                log_energies)
+    assert_allclose(exps.data, 10.0 * expw.data)
+    assert_allclose(ltc_wt.data_wt, 0.8 * ltc_wt.data)
+
+
+def test_compute_norm():
+
+    rnd = np.random.RandomState(1)
+    sig = rnd.uniform(0.01, 1.0, (5, 4, 30, 2))
+    bkg = 10**rnd.uniform(-2.0, 4.0, (5, 4, 30, 2))
+    norms = irfs.compute_norm(sig, bkg, 25.0, 3.0, sum_axes=[2, 3])
+    assert norms.shape == (5, 4, 1, 1)
+
+    # Compare with a threshold search on each TS curve separately
+    sig_scale = 10**np.linspace(0.0, 5.0, 101)
+    for idx in np.ndindex(5, 4):
+        scale = sig_scale * 3.0 / np.sum(sig[idx])
+        ts = [np.sum(irfs.poisson_ts(sig[idx] * x, bkg[idx]))
+              for x in scale]
+        assert_allclose(norms[idx], np.interp(25.0, ts, scale),
+                        rtol=1E-10)
+
+
+def test_compute_ps_counts_table():
+
+    ltc = irfs.LTCube.create_empty(239557417.0, 428902995.0, 1.0)
+    log_energies = np.linspace(2.0, 6.0, 9)
+    ebins = 10**log_energies
+    c = SkyCoord([10.0, 120.0], [10.0, -40.0], unit='deg')
+    dtheta = irfs.PSFModel.create_dtheta(400)
+    psfv, expv = irfs.PSFModel.create_average_psf(
+        c, ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'], dtheta, log_energies,
+        ncth=20, return_exp=True)
+    assert psfv.shape == (401, 9, 2)
+    assert expv.shape == (9, 2)
+
+    fn = spectrum.PowerLaw([1E-13, -2.0], 1000.)
+    exp = np.full((8, 2), 1E11)
+    bkg = np.outer(1E-5 * (utils.edge_to_center(ebins) / 1E3)**-2.5,
+                   [1.0, 3.0])
+    sig, bkgc = irfs.compute_ps_counts_table(ebins, exp, log_energies,
+                                             psfv, bkg, fn)
+    assert sig.shape == (8, 30, 2)
+
+    # Compare with the PSF model of each direction
+    for i in range(2):
+        psf = irfs.PSFModel(c[i], ltc, 'P8R2_SOURCE_V6', ['FRONT', 'BACK'],
+                            log_energies, ndtheta=400, ncth=20,
+                            use_cache=False)
+        s, b = irfs.compute_ps_counts(ebins, exp[:, i], psf, bkg[:, i], fn)
+        assert_allclose(sig[..., i], s, rtol=1E-10)
+        assert_allclose(bkgc[..., i], b, rtol=1E-10)
+
+
+def _write_ltcube(path, data, tstart, tstop, nside, data_wt=None):
+    cth_min = np.linspace(1.0, 0.0, data.shape[1] + 1)[1:]
+    hdu_exp = fits.BinTableHDU.from_columns(
+        [fits.Column('COSBINS', '%iE' % data.shape[1], array=data)],
+        name='EXPOSURE')
+    hpx_keys = dict(PIXTYPE='HEALPIX', ORDERING='NESTED', NSIDE=nside,
+                    COORDSYS='CEL')
+    hdu_exp.header.update(hpx_keys)
+    hdu_cth = fits.BinTableHDU.from_columns(
+        [fits.Column('CTHETA_MIN', 'E', array=cth_min)],
+        name='CTHETABOUNDS')
+    hdu_prim = fits.PrimaryHDU()
+    hdu_prim.header['TSTART'] = tstart
+    hdu_prim.header['TSTOP'] = tstop
+    hdulist = fits.HDUList([hdu_prim, hdu_exp, hdu_cth])
+    if data_wt is not None:
+        hdu_wt = fits.BinTableHDU.from_columns(
+            [fits.Column('COSBINS', '%iE' % data.shape[1], array=data_wt)],
+            name='WEIGHTED_EXPOSURE')
+        hdu_wt.header.update(hpx_keys)
+        hdulist.insert(2, hdu_wt)
+    hdulist.writeto(path)
+
+
+def test_ltcube_create_multi(tmpdir):
+
+    nside = 16
+    rnd = np.random.RandomState(1)
+    files = []
+    for i in range(5):
+        data = rnd.uniform(0.0, 1.0, (12 * nside**2, 10))
+        files += [str(tmpdir.join('ltcube_%02i.fits' % i))]
+        _write_ltcube(files[-1], data, 100. * i, 100. * i + 50., nside,
+                      data_wt=0.9 * data)
+
+    ltc0 = irfs.LTCube.create_from_file(files[0])
+    for f in files[1:]:
+        ltc0.load_ltfile(f)
+
+    ltc1 = irfs.LTCube.create(files, nthread=2)
+    assert_allclose(ltc1.data, ltc0.data, rtol=1E-6)
+    assert_allclose(ltc1.data_wt, ltc0.data_wt, rtol=1E-6)
+    assert_allclose(ltc1.data_wt, 0.9 * ltc1.data, rtol=1E-6)
+    assert_allclose(ltc1.costh_edges, ltc0.costh_edges)
+    assert ltc1.tstart == 0.0
+    assert ltc1.tstop == 450.0
+
+    # Summed cube is reloaded from the cache
+    cachedir = str(tmpdir.join('cache'))
+    irfs.LTCube.create(str(tmpdir.join('ltcube_*.fits')), cachedir=cachedir)
+    assert len(os.listdir(cachedir)) == 1
+    ltc2 = irfs.LTCube.create(files, cachedir=cachedir)
+    assert_allclose(ltc2.data, ltc1.data)
+    assert_allclose(ltc2.data_wt, ltc1.data_wt)
+    assert ltc2.hpx.nside == nside
+
+    # Only pixels inside the region are summed
+    region = 'DISK(83.6,22.0,10.0)'
+    ltc3 = irfs.LTCube.create(files, region=region)
+    ipix = ltc3.hpx.get_index_list(nside, True, region)
+    m = np.zeros(ltc3.hpx.npix, dtype=bool)
+    m[ipix] = True
+    assert_allclose(ltc3.data[:, m], ltc1.data[:, m])
+    assert np.all(ltc3.data[:, ~m] == 0)
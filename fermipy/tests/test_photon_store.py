@@ -0,0 +1,210 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+from __future__ import absolute_import, division, print_function
+import os
+import socket
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+from astropy.io import fits
+from astropy.coordinates import SkyCoord
+from fermipy import photon_store
+from fermipy import wcs_utils
+from fermipy.photon_store import PhotonStore
+
+
+def _write_ft1(path, nevt, tmin, tmax, seed):
+
+    rnd = np.random.RandomState(seed)
+    ra = rnd.uniform(0.0, 360.0, nevt)
+    dec = np.degrees(np.arcsin(rnd.uniform(-1.0, 1.0, nevt)))
+    c = SkyCoord(ra, dec, unit='deg')
+    evclass = rnd.choice([128, 128 | 256, 1024], nevt)
+    evtype = rnd.choice([4, 8, 16, 32], nevt)
+
+    def bits(v):
+        v = v.astype('>u4').view(np.uint8).reshape(-1, 4)
+        return np.unpackbits(v, axis=1).astype(bool)
+
+    cols = [fits.Column('ENERGY', 'E',
+                        array=10**rnd.uniform(2.0, 5.0, nevt)),
+            fits.Column('RA', 'E', array=ra),
+            fits.Column('DEC', 'E', array=dec),
+            fits.Column('L', 'E', array=c.galactic.l.deg),
+            fits.Column('B', 'E', array=c.galactic.b.deg),
+            fits.Column('ZENITH_ANGLE', 'E',
+                        array=rnd.uniform(0.0, 120.0, nevt)),
+            fits.Column('TIME', 'D',
+                        array=np.sort(rnd.uniform(tmin, tmax, nevt))),
+            fits.Column('EVENT_CLASS', '32X', array=bits(evclass)),
+            fits.Column('EVENT_TYPE', '32X', array=bits(evtype))]
+    gti = [fits.Column('START', 'D', array=[tmin]),
+           fits.Column('STOP', 'D', array=[tmax])]
+    hdulist = fits.HDUList([fits.PrimaryHDU(),
+                            fits.BinTableHDU.from_columns(cols,
+                                                          name='EVENTS'),
+                            fits.BinTableHDU.from_columns(gti, name='GTI')])
+    hdulist['EVENTS'].header['PASS_VER'] = 'P8R2'
+    hdulist.writeto(path)
+    return dict(ra=ra, dec=dec, energy=cols[0].array, zenith=cols[5].array,
+                time=cols[6].array, evclass=evclass, evtype=evtype)
+
+
+def test_intervals():
+
+    start, stop = photon_store.merge_intervals([5., 0., 2., 10.],
+                                               [6., 3., 4., 11.])
+    assert_allclose(start, [0., 5., 10.])
+    assert_allclose(stop, [4., 6., 11.])
+
+    start, stop = photon_store.intersect_intervals(start, stop,
+                                                   [1., 5.5], [5.2, 20.])
+    assert_allclose(start, [1., 5., 5.5, 10.])
+    assert_allclose(stop, [4., 5.2, 6., 11.])
+
+    m = photon_store.in_intervals(np.array([0.5, 1.5, 4.5, 10.5]),
+                                  start, stop)
+    assert list(m) == [False, True, False, True]
+
+
+def test_apply_filter(tmpdir):
+
+    cols = [fits.Column('START', 'D', array=np.arange(0., 100., 10.)),
+            fits.Column('STOP', 'D', array=np.arange(10., 110., 10.)),
+            fits.Column('DATA_QUAL', 'I',
+                        array=[1, 1, 0, 1, 1, 1, 1, 1, 1, 1]),
+            fits.Column('LAT_CONFIG', 'I',
+                        array=[1, 1, 1, 1, 1, 1, 0, 1, 1, 1]),
+            fits.Column('IN_SAA', 'L',
+                        array=[False] * 8 + [True, False]),
+            fits.Column('RA_ZENITH', 'D', array=np.arange(0., 100., 10.)),
+            fits.Column('DEC_ZENITH', 'D', array=np.zeros(10))]
+    scfile = str(tmpdir.join('ft2.fits'))
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols, name='SC_DATA')]
+                 ).writeto(scfile)
+
+    start, stop = photon_store.apply_filter(
+        [5.], [95.], scfile, '(DATA_QUAL>0)&&(LAT_CONFIG==1)')
+    assert_allclose(start, [5., 30., 70.])
+    assert_allclose(stop, [20., 60., 95.])
+
+    start, stop = photon_store.apply_filter(
+        [5.], [95.], scfile, 'DATA_QUAL==0 || LAT_CONFIG!=1')
+    assert_allclose(start, [20., 60.])
+    assert_allclose(stop, [30., 70.])
+
+    start, stop = photon_store.apply_filter(
+        [5.], [95.], scfile,
+        '(DATA_QUAL>0)&&(IN_SAA!=T)&&'
+        '(angsep(RA_ZENITH,DEC_ZENITH,40.,0.)<=30.)')
+    assert_allclose(start, [10., 30.])
+    assert_allclose(stop, [20., 80.])
+
+    photon_store.check_filter('DATA_QUAL>0 .and. abs(LAT_CONFIG)==1',
+                              scfile)
+    for expr in ['gtifilter("gti.fits",START)', 'ROCK_ANGLE<52',
+                 '__import__("os").getcwd()', 'DATA_QUAL.real>0']:
+        with pytest.raises(ValueError):
+            photon_store.check_filter(expr, scfile)
+
+
+def test_photon_store_select(tmpdir):
+
+    evts = [_write_ft1(str(tmpdir.join('ft1_%02i.fits' % i)), 20000,
+                       1000. * i, 1000. * i + 500., i) for i in range(2)]
+    evfiles = [str(tmpdir.join('ft1_%02i.fits' % i)) for i in range(2)]
+    with open(str(tmpdir.join('ft1.lst')), 'w') as f:
+        f.write('\n'.join(evfiles))
+
+    store = PhotonStore.create(str(tmpdir.join('store')),
+                               str(tmpdir.join('ft1.lst')), order=3)
+    assert store.nevents == 40000
+    assert_allclose(store.gti, [[0., 500.], [1000., 1500.]])
+
+    skydir = SkyCoord(83.6, 22.0, unit='deg')
+    kw = dict(emin=300., emax=30000., zmax=90., evclass=128, evtype=12,
+              tmin=200., tmax=1300.)
+    events, gti = store.select(skydir, 20.0, **kw)
+    assert_allclose(gti, [[200., 500.], [1000., 1300.]])
+
+    # Compare with a brute-force selection
+    ev = {k: np.concatenate([e[k] for e in evts]) for k in evts[0]}
+    sep = skydir.separation(SkyCoord(ev['ra'], ev['dec'], unit='deg')).deg
+    m = (sep <= 20.0) & (ev['energy'] >= 300.) & (ev['energy'] <= 30000.)
+    m &= (ev['zenith'] <= 90.) & ((ev['evclass'] & 128) != 0)
+    m &= ((ev['evtype'] & 12) != 0)
+    m &= photon_store.in_intervals(ev['time'], gti[:, 0], gti[:, 1])
+    assert len(events['TIME']) == np.sum(m)
+    assert_allclose(np.sort(events['TIME']), np.sort(ev['time'][m]))
+    assert np.all((events['EVENT_CLASS'] & 128) != 0)
+
+    # Write the selection and bin it into a counts cube
+    ft1file = str(tmpdir.join('ft1_sel.fits'))
+    store.write_ft1(ft1file, skydir, 20.0, **kw)
+    with fits.open(ft1file) as hdulist:
+        assert len(hdulist['EVENTS'].data) == np.sum(m)
+        assert hdulist['EVENTS'].header['DSTYP1'] == 'POS(RA,DEC)'
+
+    npix = 100
+    wcs = wcs_utils.create_wcs(skydir, coordsys='CEL', projection='AIT',
+                               cdelt=0.2, crpix=1.0 + 0.5 * (npix - 1))
+    ebin_edges = np.linspace(np.log10(300.), np.log10(30000.), 9)
+    ccube = str(tmpdir.join('ccube.fits'))
+    photon_store.make_ccube(ft1file, ccube, wcs, npix, ebin_edges)
+
+    with fits.open(ccube) as hdulist:
+        counts = hdulist[0].data
+        assert counts.shape == (8, npix, npix)
+        assert_allclose(hdulist['EBOUNDS'].data['E_MIN'][0], 300E3,
+                        rtol=1E-5)
+
+    xpix, ypix = wcs.wcs_world2pix(ev['ra'][m], ev['dec'][m], 0)
+    inside = (np.abs(xpix - 49.5) < 50.) & (np.abs(ypix - 49.5) < 50.)
+    assert np.sum(counts) == np.sum(inside)
+
+
+def test_photon_store_rebuild(tmpdir):
+
+    evfiles = [str(tmpdir.join('ft1_%02i.fits' % i)) for i in range(2)]
+    for i, f in enumerate(evfiles):
+        _write_ft1(f, 1000, 1000. * i, 1000. * i + 500., i)
+
+    path = str(tmpdir.join('store'))
+    store = PhotonStore.open(path, evfiles[0], order=3)
+    assert store.nevents == 1000
+    assert PhotonStore.open(path, evfiles[0]).nevents == 1000
+
+    # Changing the input files replaces the store without touching
+    # the columns memory-mapped by the existing instance
+    time0 = np.array(store._cols['TIME'])
+    with open(str(tmpdir.join('ft1.lst')), 'w') as f:
+        f.write('\n'.join(evfiles))
+    store2 = PhotonStore.open(path, str(tmpdir.join('ft1.lst')))
+    assert store2.nevents == 2000
+    assert_allclose(store._cols['TIME'], time0)
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        [os.path.basename(f) for f in evfiles] + ['ft1.lst', 'store'])
+
+
+def test_photon_store_lock(tmpdir):
+
+    path = str(tmpdir.join('store'))
+    lockfile = path + '.lock'
+
+    # Lock held by a process that no longer exists
+    with open(lockfile, 'w') as f:
+        f.write('%s %i' % (socket.gethostname(), 2**22 + 1))
+    with photon_store.StoreLock(path, timeout=1.0, poll=0.01):
+        assert os.path.isfile(lockfile)
+    assert not os.path.isfile(lockfile)
+
+    # Lock held by this process is only broken once it is too old
+    with photon_store.StoreLock(path) as lock:
+        with pytest.raises(Exception):
+            with photon_store.StoreLock(path, timeout=0.05, poll=0.01):
+                pass
+        os.utime(lockfile, (0., 0.))
+        with photon_store.StoreLock(path, max_age=60., poll=0.01):
+            pass
+        assert lock.lockfile == lockfile
+    assert not os.path.isfile(lockfile)
@@ -1,7 +1,9 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import, division, print_function
 import xml.etree.cElementTree as ElementTree
+import numpy as np
 from numpy.testing import assert_allclose
+from astropy.coordinates import SkyCoord
 from astropy.tests.helper import pytest
 from fermipy.tests.utils import requires_dependency
 
@@ -35,6 +37,26 @@ def test_load_3fgl_catalog_xml():
     assert len(rm.sources) == 3034
 
 
+def test_load_3fgl_catalog_roi():
+    skydir = SkyCoord(83.6, 22.0, unit='deg')
+    rm0 = roi_model.ROIModel(catalogs=['3FGL'], skydir=skydir,
+                             src_radius=10.0)
+    rm1 = roi_model.ROIModel(catalogs=['gll_psc_v16.xml'], skydir=skydir,
+                             src_radius=10.0,
+                             extdir='Extended_archive_v15')
+
+    assert len(rm0.sources) > 0
+    assert (sorted([s.name for s in rm0.sources if not s.extended]) ==
+            sorted([s.name for s in rm1.sources if not s.extended]))
+
+    for s0 in rm0.point_sources:
+        if s0.extended:
+            continue
+        s1 = rm1[s0.name]
+        assert s0['SpatialModel'] == s1['SpatialModel']
+        assert s0['offset'] < 10.0
+
+
 def test_load_2fhl_catalog_fits():
     rm = roi_model.ROIModel(catalogs=['2FHL'])
     assert len(rm.sources) == 360
@@ -251,3 +273,62 @@ def test_set_spatial_model(tmppath):
     assert src['SpatialModel'] == 'PointSource'
     assert src['SpatialType'] == 'SkyDirFunction'
     assert src['SourceType'] == 'PointSource'
+
+
+def test_skydir_index():
+    np.random.seed(1)
+    ra = np.random.uniform(0.0, 360.0, 1000)
+    dec = np.degrees(np.arcsin(np.random.uniform(-1.0, 1.0, 1000)))
+    src_skydir = SkyCoord(ra, dec, unit='deg')
+    index = roi_model.SkyDirIndex(np.vstack((ra, dec)).T)
+
+    for skydir in [SkyCoord(10.0, 20.0, unit='deg'),
+                   SkyCoord(200.0, -89.0, unit='deg')]:
+
+        assert_allclose(index.separation(skydir),
+                        skydir.separation(src_skydir).deg, atol=1E-8)
+
+        for dist, min_dist, square, coordsys in [(5.0, None, False, 'CEL'),
+                                                 (30.0, 2.0, False, 'CEL'),
+                                                 (10.0, None, True, 'CEL'),
+                                                 (10.0, 1.0, True, 'GAL'),
+                                                 (None, None, False, 'CEL')]:
+            m0 = roi_model.get_skydir_distance_mask(src_skydir, skydir,
+                                                    dist, min_dist=min_dist,
+                                                    square=square,
+                                                    coordsys=coordsys)
+            m1 = index.get_mask(skydir, dist, min_dist=min_dist,
+                                square=square, coordsys=coordsys)
+            assert np.all(m0 == m1)
+
+        sep, idx = index.query_nearest(skydir, k=3)
+        assert_allclose(sep, np.sort(skydir.separation(src_skydir).deg)[:3])
+
+
+def test_roi_model_incremental_index():
+    np.random.seed(1)
+    roi = roi_model.ROIModel(skydir=SkyCoord(10.0, 20.0, unit='deg'),
+                             src_radius=20.0)
+
+    def check_index():
+        offset = [s['offset'] for s in roi.point_sources]
+        assert np.all(np.diff(offset) >= 0)
+        radec = np.array([s.radec for s in roi.point_sources])
+        assert_allclose(roi._src_index.radec, radec.reshape((-1, 2)))
+
+    for i in range(50):
+        roi.create_source('src%i' % i,
+                          {'ra': np.random.uniform(0.0, 20.0),
+                           'dec': np.random.uniform(10.0, 30.0),
+                           'SpatialModel': 'PointSource'})
+    check_index()
+
+    roi.delete_sources([roi['src3'], roi['src17']])
+    check_index()
+    roi.delete_sources([roi['src4']], build_index=False)
+    roi.create_source('src50', {'ra': 10.5, 'dec': 20.5})
+    check_index()
+
+    radius, srcs = roi.get_sources_by_position(roi.skydir, 2.0)
+    assert srcs[0].name == 'src50'
+    assert_allclose(radius[0], roi['src50']['offset'], rtol=1E-6)
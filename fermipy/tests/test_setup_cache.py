@@ -0,0 +1,93 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+from __future__ import absolute_import, division, print_function
+import os
+import time
+import numpy as np
+from astropy.io import fits
+from fermipy.setup_cache import SetupCache, gti_digest
+
+
+def _write_evfile(path, start, stop, nevt):
+    cols = [fits.Column('ENERGY', 'E', array=np.ones(nevt))]
+    gti = [fits.Column('START', 'D', array=start),
+           fits.Column('STOP', 'D', array=stop)]
+    hdulist = fits.HDUList([fits.PrimaryHDU(),
+                            fits.BinTableHDU.from_columns(cols,
+                                                          name='EVENTS'),
+                            fits.BinTableHDU.from_columns(gti, name='GTI')])
+    hdulist.writeto(path)
+
+
+def test_setup_cache_key(tmpdir):
+
+    cache = SetupCache(str(tmpdir.join('cache')))
+
+    infile0 = str(tmpdir.join('ltcube0.fits'))
+    infile1 = str(tmpdir.join('ltcube1.fits'))
+    for f in [infile0, infile1]:
+        with open(f, 'w') as fh:
+            fh.write('ltcube')
+
+    kw = dict(infile=infile0, cmap='none', emin=100., emax=1E5,
+              outfile=str(tmpdir.join('bexpmap_00.fits')), chatter=3)
+    key0 = cache.get_key('gtexpcube2', kw)
+
+    # Identical inputs at a different path with a different output
+    kw1 = dict(kw, infile=infile1, chatter=1,
+               outfile=str(tmpdir.join('bexpmap_01.fits')))
+    assert cache.get_key('gtexpcube2', kw1) == key0
+    assert cache.get_key('gtexpcube2', dict(kw, emin=1000.)) != key0
+    assert cache.get_key('gtbin', kw) != key0
+
+    time.sleep(0.01)
+    with open(infile1, 'w') as fh:
+        fh.write('ltcube2')
+    assert cache.get_key('gtexpcube2', kw1) != key0
+    assert cache.get_key('gtexpcube2', kw1, {'infile': 'x'}) == \
+        cache.get_key('gtexpcube2', kw, {'infile': 'x'})
+
+
+def test_setup_cache_fetch_store(tmpdir):
+
+    cache = SetupCache(str(tmpdir.join('cache')), maxsize=1.5 / 1024**3)
+
+    outfile0 = str(tmpdir.join('out0.fits'))
+    outfile1 = str(tmpdir.join('out1.fits'))
+
+    assert not cache.fetch('a', outfile1)
+    with open(outfile0, 'wb') as fh:
+        fh.write(b'a')
+    cache.store('a', outfile0)
+    assert cache.fetch('a', outfile1)
+    with open(outfile1, 'rb') as fh:
+        assert fh.read() == b'a'
+
+    # Products linked into a working directory are not evicted
+    os.remove(outfile0)
+    with open(outfile0, 'wb') as fh:
+        fh.write(b'b')
+    os.utime(outfile0, (time.time() + 10, time.time() + 10))
+    cache.store('b', outfile0)
+    assert os.path.isfile(cache.get_path('a', outfile1))
+
+    # The least recently used product is evicted once it is no longer
+    # linked
+    os.remove(outfile1)
+    cache.evict()
+    assert not cache.fetch('a', outfile1)
+    assert cache.fetch('b', outfile1)
+
+
+def test_gti_digest(tmpdir):
+
+    start = np.array([0., 100., 200.])
+    stop = np.array([50., 150., 250.])
+    evfile0 = str(tmpdir.join('ft1_00.fits'))
+    evfile1 = str(tmpdir.join('ft1_01.fits'))
+    evfile2 = str(tmpdir.join('ft1_02.fits'))
+    _write_evfile(evfile0, start, stop, 10)
+    _write_evfile(evfile1, start, stop, 20)
+    _write_evfile(evfile2, start, stop + 1.0, 10)
+
+    assert gti_digest(evfile0) == gti_digest(evfile1)
+    assert gti_digest(evfile0) != gti_digest(evfile2)
@@ -0,0 +1,92 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+from __future__ import absolute_import, division, print_function
+import os
+import logging
+from fermipy.setup_pipeline import SetupPipeline, SetupStage, read_manifest
+
+
+def _create_pipeline(tmpdir, binsz=0.1, transient=False):
+
+    files = dict(ft1=str(tmpdir.join('ft1.fits')),
+                 ltcube=str(tmpdir.join('ltcube.fits')),
+                 ccube=str(tmpdir.join('ccube.fits')),
+                 srcmap=str(tmpdir.join('srcmap.fits')))
+
+    def touch(path):
+        def fn(overwrite):
+            with open(path, 'w') as f:
+                f.write('')
+        return fn
+
+    pipeline = SetupPipeline(str(tmpdir.join('manifest.json')),
+                             logging.getLogger(__name__))
+    pipeline.add_stage(SetupStage('select', touch(files['ft1']),
+                                  outputs=[files['ft1']],
+                                  apps=[('gtselect', dict(emin=100.))],
+                                  transient=transient))
+    pipeline.add_stage(SetupStage('ltcube', touch(files['ltcube']),
+                                  outputs=[files['ltcube']],
+                                  apps=[('gtltcube',
+                                         dict(evfile=files['ft1']))],
+                                  deps=['select']))
+    pipeline.add_stage(SetupStage('bin', touch(files['ccube']),
+                                  outputs=[files['ccube']],
+                                  apps=[('gtbin', dict(evfile=files['ft1'],
+                                                       binsz=binsz))],
+                                  deps=['select']))
+    pipeline.add_stage(SetupStage('srcmaps', touch(files['srcmap']),
+                                  outputs=[files['srcmap']],
+                                  apps=[('gtsrcmaps',
+                                         dict(cmap=files['ccube'],
+                                              expcube=files['ltcube']))],
+                                  deps=['ltcube', 'bin']))
+    return pipeline, files
+
+
+def test_setup_pipeline(tmpdir):
+
+    pipeline, files = _create_pipeline(tmpdir)
+    assert pipeline.run() == ['select', 'ltcube', 'bin', 'srcmaps']
+    assert pipeline.run() == []
+
+    manifest = read_manifest(pipeline.manifest_file)
+    for k in ['select', 'ltcube', 'bin', 'srcmaps']:
+        assert manifest['stages'][k]['elapsed'] is not None
+
+    # Changing the binning only invalidates the downstream stages
+    pipeline, files = _create_pipeline(tmpdir, binsz=0.2)
+    assert pipeline.run() == ['bin', 'srcmaps']
+
+    os.remove(files['ltcube'])
+    assert pipeline.run() == ['ltcube']
+    assert pipeline.run(overwrite=True) == \
+        ['select', 'ltcube', 'bin', 'srcmaps']
+
+    pipeline.record('likelihood', 1.0)
+    manifest = read_manifest(pipeline.manifest_file)
+    assert manifest['stages']['likelihood']['elapsed'] == 1.0
+
+
+def test_setup_pipeline_transient(tmpdir):
+
+    pipeline, files = _create_pipeline(tmpdir, transient=True)
+    assert pipeline.run() == ['select', 'ltcube', 'bin', 'srcmaps']
+
+    # Deleted transient outputs are only regenerated when needed
+    os.remove(files['ft1'])
+    assert pipeline.run() == []
+    os.remove(files['ccube'])
+    assert pipeline.run() == ['select', 'bin']
+
+
+def test_setup_pipeline_adopt(tmpdir):
+
+    pipeline, files = _create_pipeline(tmpdir)
+    for f in files.values():
+        with open(f, 'w') as fh:
+            fh.write('')
+
+    # Existing outputs without a manifest are adopted
+    assert pipeline.run() == []
+    pipeline, files = _create_pipeline(tmpdir, binsz=0.2)
+    assert pipeline.run() == ['bin', 'srcmaps']
@@ -0,0 +1,93 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+from __future__ import absolute_import, division, print_function
+import os
+import numpy as np
+from numpy.testing import assert_allclose
+import astropy.io.fits as pyfits
+from fermipy import srcmap_utils
+
+
+def make_srcmap_file(filename, names, shape=(3, 10, 10)):
+    hdus = [pyfits.PrimaryHDU(np.zeros(shape, dtype=np.float32))]
+    for name in names:
+        hdus += [pyfits.ImageHDU(np.ones(shape, dtype=np.float32), name=name)]
+    pyfits.HDUList(hdus).writeto(filename, clobber=True)
+
+
+def test_update_source_maps(tmpdir):
+
+    filename = str(tmpdir / 'srcmap.fits')
+    make_srcmap_file(filename, ['SRC0', 'SRC1'])
+    inode = os.stat(filename).st_ino
+
+    srcmap_utils.update_source_maps(filename,
+                                    {'SRC0': 2.0 * np.ones((3, 10, 10)),
+                                     'SRC2': 3.0 * np.ones((3, 10, 10))})
+
+    # Maps should be updated and appended without replacing the file
+    assert os.stat(filename).st_ino == inode
+    assert not os.path.isfile(filename + '.lock')
+
+    hdulist = pyfits.open(filename)
+    assert [hdu.name for hdu in hdulist] == ['PRIMARY', 'SRC0', 'SRC1', 'SRC2']
+    assert_allclose(hdulist['SRC0'].data, 2.0)
+    assert_allclose(hdulist['SRC1'].data, 1.0)
+    assert_allclose(hdulist['SRC2'].data, 3.0)
+    hdulist.close()
+
+
+def test_delete_source_map(tmpdir):
+
+    filename = str(tmpdir / 'srcmap.fits')
+    make_srcmap_file(filename, ['SRC0', 'SRC1', 'SRC2', 'SRC3'])
+
+    srcmap_utils.delete_source_map(filename, 'SRC0')
+    hdulist = pyfits.open(filename)
+    assert [hdu.name for hdu in hdulist] == ['PRIMARY', 'DELETED_SRC0',
+                                             'SRC1', 'SRC2', 'SRC3']
+    hdulist.close()
+
+    # Deleted maps exceed half of the file size
+    srcmap_utils.delete_source_map(filename, ['SRC1', 'SRC2'])
+    hdulist = pyfits.open(filename)
+    assert [hdu.name for hdu in hdulist] == ['PRIMARY', 'SRC3']
+    assert_allclose(hdulist['SRC3'].data, 1.0)
+    hdulist.close()
+
+
+def test_fits_source_map_store(tmpdir):
+
+    filename = str(tmpdir / 'srcmap.fits')
+    make_srcmap_file(filename, [])
+    store = srcmap_utils.FITSSourceMapStore(filename)
+
+    srcmaps = {'SRC0': np.random.uniform(size=(3, 10, 10)),
+               'SRC1': np.random.uniform(size=(3, 10, 10))}
+
+    store.update(srcmaps)
+    assert sorted(store.names()) == ['SRC0', 'SRC1']
+    assert 'src0' in store
+    assert_allclose(store['SRC1'], srcmaps['SRC1'])
+
+    store.update({'SRC1': np.ones((3, 10, 10))})
+    assert_allclose(store.get('SRC1'), 1.0)
+
+    store.delete('SRC0')
+    assert store.names() == ['SRC1']
+
+
+def test_fits_source_map_store_index(tmpdir):
+
+    filename = str(tmpdir / 'srcmap.fits')
+    make_srcmap_file(filename, ['SRC0', 'SRC1'])
+    store = srcmap_utils.FITSSourceMapStore(filename)
+    assert store.names() == ['SRC0', 'SRC1']
+
+    # Renaming an HDU in place preserves the size and inode of the
+    # file.  Restore the modification time to check that the index is
+    # invalidated by the write itself.
+    st = os.stat(filename)
+    srcmap_utils.delete_source_map(filename, 'SRC0', compact_fraction=1.0)
+    os.utime(filename, (st.st_atime, st.st_mtime))
+    assert os.stat(filename).st_size == st.st_size
+    assert store.names() == ['SRC1']
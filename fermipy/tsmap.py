@@ -732,6 +732,21 @@ class TSMapGenerator(object):
 
         self.logger.info('Generating TS map')
 
+        config = self._create_tsmap_config(**kwargs)
+        maps = self._make_tsmap_fast(prefix, **config)
+
+        if config['make_plots']:
+            plotter = plotting.AnalysisPlotter(self.config['plotting'],
+                                               fileio=self.config['fileio'],
+                                               logging=self.config['logging'])
+
+            plotter.make_tsmap_plots(maps, self.roi)
+
+        self.logger.info('Finished TS map')
+        return maps
+
+    def _create_tsmap_config(self, **kwargs):
+
         schema = ConfigSchema(self.defaults['tsmap'])        
         schema.add_option('make_plots',True)
         schema.add_option('write_fits', True)
@@ -746,20 +761,9 @@ class TSMapGenerator(object):
         config['model'].setdefault('SpectrumType', 'PowerLaw')
         config['model'].setdefault('SpatialModel', 'PointSource')
         config['model'].setdefault('Prefactor', 1E-13)
-        
-        maps = self._make_tsmap_fast(prefix, **config)
-
-        if config['make_plots']:
-            plotter = plotting.AnalysisPlotter(self.config['plotting'],
-                                               fileio=self.config['fileio'],
-                                               logging=self.config['logging'])
+        return config
 
-            plotter.make_tsmap_plots(maps, self.roi)
-
-        self.logger.info('Finished TS map')
-        return maps
-
-    def _make_tsmap_fast(self, prefix, **kwargs):
+    def _make_tsmap_fast(self, prefix, data=None, kernel=None, **kwargs):
         """
         Make a TS map from a GTAnalysis instance.  This is a
         simplified implementation optimized for speed that only fits
@@ -775,98 +779,41 @@ class TSMapGenerator(object):
            Dictionary or Source object defining the properties of the
            test source that will be used in the scan.
 
-        """
+        data : dict
+           Counts and background maps returned by
+           `_make_tsmap_data`.  If None these will be extracted from
+           the current model.
 
-        src_dict = copy.deepcopy(kwargs.setdefault('model', {}))
-        src_dict = {} if src_dict is None else src_dict
-        
-        multithread = kwargs.setdefault('multithread', False)
-        threshold = kwargs.setdefault('threshold', 1E-2)
-        max_kernel_radius = kwargs.get('max_kernel_radius')
-        loge_bounds = kwargs.setdefault('loge_bounds', None)
+        kernel : dict
+           Test source kernel returned by `_make_tsmap_kernel`.  If
+           None the kernel will be generated from ``model``.
 
-        if loge_bounds is not None:
-            if len(loge_bounds) == 0:
-                loge_bounds = [None, None]
-            elif len(loge_bounds) == 1:
-                loge_bounds += [None]
-            loge_bounds[0] = (loge_bounds[0] if loge_bounds[0] is not None
-                              else self.log_energies[0])
-            loge_bounds[1] = (loge_bounds[1] if loge_bounds[1] is not None
-                              else self.log_energies[-1])
-        else:
-            loge_bounds = [self.log_energies[0], self.log_energies[-1]]
+        """
 
-        # Put the test source at the pixel closest to the ROI center
-        xpix, ypix = (np.round((self.npix - 1.0) / 2.),
-                      np.round((self.npix - 1.0) / 2.))
-        cpix = np.array([xpix, ypix])
+        multithread = kwargs.setdefault('multithread', False)
+        kwargs.setdefault('threshold', 1E-2)
+        kwargs.setdefault('loge_bounds', None)
+
+        if data is None:
+            data = self._make_tsmap_data(kwargs['loge_bounds'],
+                                         kwargs['exclude'])
+
+        if kernel is None:
+            kernel = self._make_tsmap_kernel(kwargs.setdefault('model', {}),
+                                             data,
+                                             kwargs['threshold'],
+                                             kwargs.get('max_kernel_radius'))
+
+        counts = data['counts']
+        bkg = data['bkg']
+        c0_map = data['c0_map']
+        enumbins = data['enumbins']
+        src_dict = kernel['src_dict']
+        model = kernel['model']
+        model_npred = kernel['model_npred']
+        modelname = kernel['name']
 
         skywcs = self._skywcs
-        skydir = wcs_utils.pix_to_skydir(cpix[0], cpix[1], skywcs)
-
-        src_dict['ra'] = skydir.ra.deg
-        src_dict['dec'] = skydir.dec.deg
-        src_dict.setdefault('SpatialModel', 'PointSource')
-        src_dict.setdefault('SpatialWidth', 0.3)
-        src_dict.setdefault('Index', 2.0)
-        src_dict.setdefault('Prefactor', 1E-13)
-
-        counts = []
-        bkg = []
-        model = []
-        c0_map = []
-        eslices = []
-        enumbins = []
-        model_npred = 0
-        for c in self.components:
-
-            imin = utils.val_to_edge(c.log_energies, loge_bounds[0])[0]
-            imax = utils.val_to_edge(c.log_energies, loge_bounds[1])[0]
-
-            eslice = slice(imin, imax)
-            bm = c.model_counts_map(exclude=kwargs['exclude']).counts.astype('float')[eslice, ...]
-            cm = c.counts_map().counts.astype('float')[eslice, ...]
-
-            bkg += [bm]
-            counts += [cm]
-            c0_map += [cash(cm, bm)]
-            eslices += [eslice]
-            enumbins += [cm.shape[0]]
-
-        self.add_source('tsmap_testsource', src_dict, free=True,
-                        init_source=False)
-        src = self.roi['tsmap_testsource']
-        # self.logger.info(str(src_dict))
-        modelname = utils.create_model_name(src)
-        for c, eslice in zip(self.components, eslices):
-            mm = c.model_counts_map('tsmap_testsource').counts.astype('float')[
-                eslice, ...]
-            model_npred += np.sum(mm)
-            model += [mm]
-
-        self.delete_source('tsmap_testsource')
-
-        for i, mm in enumerate(model):
-
-            dpix = 3
-            for j in range(mm.shape[0]):
-
-                ix, iy = np.unravel_index(
-                    np.argmax(mm[j, ...]), mm[j, ...].shape)
-
-                mx = mm[j, ix, :] > mm[j, ix, iy] * threshold
-                my = mm[j, :, iy] > mm[j, ix, iy] * threshold
-                dpix = max(dpix, np.round(np.sum(mx) / 2.))
-                dpix = max(dpix, np.round(np.sum(my) / 2.))
-
-            if max_kernel_radius is not None and \
-                    dpix > int(max_kernel_radius / self.components[i].binsz):
-                dpix = int(max_kernel_radius / self.components[i].binsz)
-
-            xslice = slice(max(int(xpix - dpix), 0),
-                           min(int(xpix + dpix + 1), self.npix))
-            model[i] = model[i][:, xslice, xslice]
 
         ts_values = np.zeros((self.npix, self.npix))
         amp_values = np.zeros((self.npix, self.npix))
@@ -923,7 +870,7 @@ class TSMapGenerator(object):
         ts_map = Map(ts_values, map_wcs)
         sqrt_ts_map = Map(ts_values**0.5, map_wcs)
         npred_map = Map(amp_values * model_npred, map_wcs)
-        amp_map = Map(amp_values * src.get_norm(), map_wcs)
+        amp_map = Map(amp_values * kernel['norm'], map_wcs)
 
         o = {'name': utils.join_strings([prefix, modelname]),
              'src_dict': copy.deepcopy(src_dict),
@@ -953,6 +900,138 @@ class TSMapGenerator(object):
 
         return o
 
+    def _make_tsmap_data(self, loge_bounds=None, exclude=None):
+        """Extract the counts and background maps of each component
+        that are used to compute the TS of a test source.
+
+        Parameters
+        ----------
+        loge_bounds : list
+           Energy range (emin,emax) in log10(E/MeV).
+
+        exclude : list
+           Sources that will be removed from the background model.
+
+        """
+
+        if loge_bounds is not None:
+            loge_bounds = list(loge_bounds)
+            if len(loge_bounds) == 0:
+                loge_bounds = [None, None]
+            elif len(loge_bounds) == 1:
+                loge_bounds += [None]
+            loge_bounds[0] = (loge_bounds[0] if loge_bounds[0] is not None
+                              else self.log_energies[0])
+            loge_bounds[1] = (loge_bounds[1] if loge_bounds[1] is not None
+                              else self.log_energies[-1])
+        else:
+            loge_bounds = [self.log_energies[0], self.log_energies[-1]]
+
+        counts = []
+        bkg = []
+        c0_map = []
+        eslices = []
+        enumbins = []
+        for c in self.components:
+
+            imin = utils.val_to_edge(c.log_energies, loge_bounds[0])[0]
+            imax = utils.val_to_edge(c.log_energies, loge_bounds[1])[0]
+
+            eslice = slice(imin, imax)
+            bm = c.model_counts_map(exclude=exclude).counts.astype('float')[eslice, ...]
+            cm = c.counts_map().counts.astype('float')[eslice, ...]
+
+            bkg += [bm]
+            counts += [cm]
+            c0_map += [cash(cm, bm)]
+            eslices += [eslice]
+            enumbins += [cm.shape[0]]
+
+        return {'counts': counts, 'bkg': bkg, 'c0_map': c0_map,
+                'eslices': eslices, 'enumbins': enumbins}
+
+    def _make_tsmap_src_dict(self, src_dict):
+        """Create the source dictionary of a TS map test source.  The
+        test source is placed at the pixel closest to the ROI
+        center."""
+
+        src_dict = copy.deepcopy(src_dict)
+        src_dict = {} if src_dict is None else src_dict
+
+        xpix, ypix = (np.round((self.npix - 1.0) / 2.),
+                      np.round((self.npix - 1.0) / 2.))
+        skydir = wcs_utils.pix_to_skydir(xpix, ypix, self._skywcs)
+
+        src_dict['ra'] = skydir.ra.deg
+        src_dict['dec'] = skydir.dec.deg
+        src_dict.setdefault('SpatialModel', 'PointSource')
+        src_dict.setdefault('SpatialWidth', 0.3)
+        src_dict.setdefault('Index', 2.0)
+        src_dict.setdefault('Prefactor', 1E-13)
+        return src_dict
+
+    def _make_tsmap_kernel(self, src_dict, data, threshold=1E-2,
+                           max_kernel_radius=None):
+        """Generate the model counts kernel of a test source.  The
+        kernel does not depend on the position at which the TS is
+        evaluated and can be reused for any TS map computed with the
+        same test source model and energy range.
+
+        Parameters
+        ----------
+        src_dict : dict or `~fermipy.roi_model.Source`
+           Dictionary or Source object defining the properties of the
+           test source.
+
+        data : dict
+           Output of `_make_tsmap_data`.
+
+        """
+
+        src_dict = self._make_tsmap_src_dict(src_dict)
+        xpix, ypix = (np.round((self.npix - 1.0) / 2.),
+                      np.round((self.npix - 1.0) / 2.))
+
+        model = []
+        model_npred = 0
+
+        self.add_source('tsmap_testsource', src_dict, free=True,
+                        init_source=False)
+        src = self.roi['tsmap_testsource']
+        modelname = utils.create_model_name(src)
+        norm = src.get_norm()
+        for c, eslice in zip(self.components, data['eslices']):
+            mm = c.model_counts_map('tsmap_testsource').counts.astype('float')[
+                eslice, ...]
+            model_npred += np.sum(mm)
+            model += [mm]
+
+        self.delete_source('tsmap_testsource')
+
+        for i, mm in enumerate(model):
+
+            dpix = 3
+            for j in range(mm.shape[0]):
+
+                ix, iy = np.unravel_index(
+                    np.argmax(mm[j, ...]), mm[j, ...].shape)
+
+                mx = mm[j, ix, :] > mm[j, ix, iy] * threshold
+                my = mm[j, :, iy] > mm[j, ix, iy] * threshold
+                dpix = max(dpix, np.round(np.sum(mx) / 2.))
+                dpix = max(dpix, np.round(np.sum(my) / 2.))
+
+            if max_kernel_radius is not None and \
+                    dpix > int(max_kernel_radius / self.components[i].binsz):
+                dpix = int(max_kernel_radius / self.components[i].binsz)
+
+            xslice = slice(max(int(xpix - dpix), 0),
+                           min(int(xpix + dpix + 1), self.npix))
+            model[i] = model[i][:, xslice, xslice]
+
+        return {'name': modelname, 'src_dict': src_dict, 'model': model,
+                'model_npred': model_npred, 'norm': norm}
+
     def _tsmap_pylike(self, prefix, **kwargs):
         """Evaluate the TS for an additional source component at each point
         in the ROI.  This is the brute force implementation of TS map
@@ -2,7 +2,9 @@
 from __future__ import absolute_import, division, print_function
 import os
 import re
+import sys
 import copy
+import multiprocessing
 from collections import OrderedDict
 import xml.etree.cElementTree as et
 import yaml
@@ -35,6 +37,76 @@ def init_matplotlib_backend(backend=None):
             matplotlib.use(backend)
 
 
+def get_start_method():
+    """Return the method used by `multiprocessing` to start worker
+    processes ('fork', 'spawn', or 'forkserver')."""
+    try:
+        return multiprocessing.get_start_method()
+    except AttributeError:
+        # python 2 forks on every platform except Windows
+        return 'spawn' if sys.platform == 'win32' else 'fork'
+
+
+def pool_map(fn, args, nworkers=1, inherit_state=True, initializer=None,
+             initargs=(), logger=None):
+    """Apply a function to every element of a sequence of arguments in
+    a pool of worker processes and return the list of results.
+
+    Parameters
+    ----------
+    fn : callable
+        Module-level function called with a single element of
+        ``args``.
+
+    args : list
+        Sequence of arguments.
+
+    nworkers : int
+        Number of worker processes.  If one the arguments are
+        processed sequentially in this process.
+
+    inherit_state : bool
+        Set to True if ``fn`` relies on state that the calling process
+        stored in a module-level variable.  This state is only
+        inherited by workers started with the ``fork`` method.  With
+        any other start method (e.g. on Windows, or by default on
+        macOS with python >= 3.8) the arguments are processed
+        sequentially in this process.
+
+    initializer : callable
+        Function called with ``initargs`` in every worker process (or
+        in this process when running sequentially) before ``fn`` is
+        applied.  This can be used to pass state that is shared by
+        all arguments to workers that are not forked.
+
+    initargs : tuple
+        Arguments of ``initializer``.
+
+    logger : `~logging.Logger`
+        Logger used to report the fallback to sequential execution.
+    """
+
+    nworkers = min(nworkers, len(args))
+    if nworkers > 1 and inherit_state and get_start_method() != 'fork':
+        if logger is not None:
+            logger.warning('Worker processes cannot be forked with the %s '
+                           'start method.  Running sequentially.',
+                           get_start_method())
+        nworkers = 1
+
+    if nworkers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [fn(t) for t in args]
+
+    pool = multiprocessing.Pool(nworkers, initializer, initargs)
+    try:
+        return pool.map(fn, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def unicode_representer(dumper, uni):
     node = yaml.ScalarNode(tag=u'tag:yaml.org,2002:str', value=uni)
     return node
@@ -1118,6 +1190,27 @@ def convolve2d_disk(fn, r, sig, nstep=200):
       Number of sampling point for numeric integration.
     """
 
+    rp, w = convolve2d_disk_weights(r, sig, nstep)
+    return np.sum(fn(rp) * w, axis=1)
+
+
+def convolve2d_disk_weights(r, sig, nstep=200):
+    """Compute the sampling points and integration weights for the
+    convolution of an azimuthally symmetric function with a disk (see
+    `convolve2d_disk`).  The convolution at each point ``r[i]`` is
+    given by ``np.sum(fn(rp[i]) * w[i])``.  Because the weights do not
+    depend on the input function they can be shared when convolving
+    many functions (e.g. the PSF at different energies).
+
+    Returns
+    -------
+    rp : `~numpy.ndarray`
+      Array of sampling points with shape (len(r), nstep).
+
+    w : `~numpy.ndarray`
+      Array of integration weights with shape (len(r), nstep).
+    """
+
     r = np.array(r, ndmin=1)
     sig = np.array(sig, ndmin=1)
 
@@ -1130,10 +1223,8 @@ def convolve2d_disk(fn, r, sig, nstep=200):
             delta[:, np.newaxis] * np.linspace(0, nstep, nstep + 1)[np.newaxis, :]
     rp = 0.5 * (redge[:, 1:] + redge[:, :-1])
     dr = redge[:, 1:] - redge[:, :-1]
-    fnv = fn(rp)
 
     r = r.reshape(r.shape + (1,))
-    saxis = 1
 
     cphi = -np.ones(dr.shape)
     m = ((rp + r) / sig < 1) | (r == 0)
@@ -1142,10 +1233,9 @@ def convolve2d_disk(fn, r, sig, nstep=200):
     sx = r ** 2 + rp ** 2 - sig ** 2
     cphi[~m] = sx[~m] / (2 * rrp[~m])
     dphi = 2 * np.arccos(cphi)
-    v = rp * fnv * dphi * dr / (np.pi * sig * sig)
-    s = np.sum(v, axis=saxis)
+    w = rp * dphi * dr / (np.pi * sig * sig)
 
-    return s
+    return rp, w
 
 
 def convolve2d_gauss(fn, r, sig, nstep=200):
@@ -1171,6 +1261,24 @@ def convolve2d_gauss(fn, r, sig, nstep=200):
       Number of sampling point for numeric integration.
 
     """
+    rp, w = convolve2d_gauss_weights(r, sig, nstep)
+    return np.sum(fn(rp) * w, axis=1)
+
+
+def convolve2d_gauss_weights(r, sig, nstep=200):
+    """Compute the sampling points and integration weights for the
+    convolution of an azimuthally symmetric function with a gaussian
+    (see `convolve2d_gauss`).  The convolution at each point ``r[i]``
+    is given by ``np.sum(fn(rp[i]) * w[i])``.
+
+    Returns
+    -------
+    rp : `~numpy.ndarray`
+      Array of sampling points with shape (len(r), nstep).
+
+    w : `~numpy.ndarray`
+      Array of integration weights with shape (len(r), nstep).
+    """
     r = np.array(r, ndmin=1)
     sig = np.array(sig, ndmin=1)
 
@@ -1185,10 +1293,8 @@ def convolve2d_gauss(fn, r, sig, nstep=200):
 
     rp = 0.5 * (redge[:, 1:] + redge[:, :-1])
     dr = redge[:, 1:] - redge[:, :-1]
-    fnv = fn(rp)
 
     r = r.reshape(r.shape + (1,))
-    saxis = 1
 
     sig2 = sig * sig
     x = r * rp / (sig2)
@@ -1201,11 +1307,10 @@ def convolve2d_gauss(fn, r, sig, nstep=200):
 
     je = convolve2d_gauss.je_fn(x.flat).reshape(x.shape)
     #    je2 = special.ive(0,x)
-    v = (rp * fnv / (sig2) * je * np.exp(x - (r * r + rp * rp) /
-                                         (2 * sig2)) * dr)
-    s = np.sum(v, axis=saxis)
+    w = (rp / (sig2) * je * np.exp(x - (r * r + rp * rp) /
+                                   (2 * sig2)) * dr)
 
-    return s
+    return rp, w
 
 
 def make_pixel_offset(npix, xpix=0.0, ypix=0.0):
@@ -1264,9 +1369,114 @@ def make_disk_kernel(sigma, npix=501, cdelt=0.01, xpix=0.0, ypix=0.0):
     return k
 
 
-def make_cdisk_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
-                      normalize=False):
-    """Make a kernel for a PSF-convolved 2D disk.
+def interp_profiles(x, xp, fp):
+    """Linearly interpolate a set of profiles that are sampled on a
+    common grid.  This is equivalent to calling `numpy.interp` for
+    each profile but the interpolation indices are only computed once
+    when the evaluation points are shared between profiles.
+
+    Parameters
+    ----------
+    x : `~numpy.ndarray`
+      Evaluation points.  The first dimension should either have size
+      1 (points shared by all profiles) or the number of profiles.
+
+    xp : `~numpy.ndarray`
+      Monotonically increasing sampling points of the profiles.
+
+    fp : `~numpy.ndarray`
+      Array of profiles with shape (nprofile, len(xp)).
+
+    Returns
+    -------
+    f : `~numpy.ndarray`
+      Array with shape (nprofile,) + x.shape[1:].
+    """
+
+    x = np.clip(x, xp[0], xp[-1])
+    idx = np.searchsorted(xp, x, side='right') - 1
+    idx = np.clip(idx, 0, len(xp) - 2)
+    w = (x - xp[idx]) / (xp[idx + 1] - xp[idx])
+
+    if x.shape[0] == 1:
+        f0 = np.take(fp, idx[0], axis=1)
+        f1 = np.take(fp, idx[0] + 1, axis=1)
+    else:
+        idx += (np.arange(fp.shape[0]) *
+                fp.shape[1]).reshape((-1,) + (1,) * (x.ndim - 1))
+        f0 = np.take(fp, idx)
+        f1 = np.take(fp, idx + 1)
+
+    f1 -= f0
+    f1 *= w
+    f1 += f0
+    return f1
+
+
+def eval_psf_profiles(psf, dtheta, scale_fn=None):
+    """Evaluate the PSF at all energies of a PSF model.  This gives
+    the same result as calling `~fermipy.irfs.PSFModel.eval` for each
+    energy bin.
+
+    Parameters
+    ----------
+    psf : `~fermipy.irfs.PSFModel`
+
+    dtheta : array_like
+      Array of angular separations in degrees.
+
+    scale_fn : callable
+      Function that evaluates the PSF scaling function.  Argument is
+      energy in MeV.
+
+    Returns
+    -------
+    vals : `~numpy.ndarray`
+      Array with shape (len(psf.energies),) + dtheta.shape.
+    """
+
+    if scale_fn is None and psf.scale_fn is not None:
+        scale_fn = psf.scale_fn
+
+    dtheta = np.array(dtheta, ndmin=1)[np.newaxis, ...]
+
+    if scale_fn is None:
+        return np.exp(interp_profiles(dtheta, psf.dtheta, psf.log_val))
+
+    # With a scaling function the radii differ for each energy so
+    # the interpolation is performed separately for each profile
+    vals = np.zeros((len(psf.energies),) + dtheta.shape[1:])
+    for i in range(len(psf.energies)):
+        vals[i] = psf.eval(i, dtheta[0], scale_fn=scale_fn)
+    return vals
+
+
+def make_cdisk_profile(psf, sigma, psf_scale_fn=None):
+    """Compute the radial profile of a PSF-convolved 2D disk at each
+    energy of a PSF model.
+
+    Parameters
+    ----------
+
+    psf : `~fermipy.irfs.PSFModel`
+
+    sigma : float
+      Disk radius in degrees.
+
+    Returns
+    -------
+    profile : `~numpy.ndarray`
+      Array with shape (len(psf.energies), len(psf.dtheta)) containing
+      the profile evaluated at each point of ``psf.dtheta``.
+    """
+
+    rp, w = convolve2d_disk_weights(psf.dtheta, sigma)
+    return np.sum(eval_psf_profiles(psf, rp, psf_scale_fn) * w, axis=2)
+
+
+def make_cgauss_profile(psf, sigma, psf_scale_fn=None):
+    """Compute the radial profile of a PSF-convolved 2D gaussian at
+    each energy of a PSF model.
 
     Parameters
     ----------
@@ -1275,19 +1485,43 @@ def make_cdisk_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
 
     sigma : float
       68% containment radius in degrees.
+
+    Returns
+    -------
+    profile : `~numpy.ndarray`
+      Array with shape (len(psf.energies), len(psf.dtheta)) containing
+      the profile evaluated at each point of ``psf.dtheta``.
     """
 
-    dtheta = psf.dtheta
-    egy = psf.energies
+    sigma /= 1.5095921854516636
+    rp, w = convolve2d_gauss_weights(psf.dtheta, sigma)
+    return np.sum(eval_psf_profiles(psf, rp, psf_scale_fn) * w, axis=2)
+
+
+def make_radial_kernel(dtheta, profile, npix, cdelt, xpix, ypix,
+                       normalize=False):
+    """Project a set of radial profiles onto a pixel grid.
+
+    Parameters
+    ----------
+
+    dtheta : `~numpy.ndarray`
+      Angular separations in degrees at which the profiles are sampled.
+
+    profile : `~numpy.ndarray`
+      Array of profiles with shape (nebin, len(dtheta)).
+
+    npix : int
+        Number of pixels in X and Y dimensions.
+
+    cdelt : float
+        Pixel size in degrees.
+    """
 
     x = make_pixel_offset(npix, xpix, ypix)
     x *= cdelt
 
-    k = np.zeros((len(egy), npix, npix))
-    for i in range(len(egy)):        
-        fn = lambda t: psf.eval(i, t, scale_fn=psf_scale_fn)
-        psfc = convolve2d_disk(fn, dtheta, sigma)
-        k[i] = np.interp(np.ravel(x), dtheta, psfc).reshape(x.shape)
+    k = interp_profiles(x[np.newaxis, ...], dtheta, profile)
 
     if normalize:
         k /= (np.sum(k, axis=0)[np.newaxis, ...] * np.radians(cdelt) ** 2)
@@ -1295,9 +1529,9 @@ def make_cdisk_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
     return k
 
 
-def make_cgauss_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
-                       normalize=False):
-    """Make a kernel for a PSF-convolved 2D gaussian.
+def make_cdisk_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
+                      normalize=False):
+    """Make a kernel for a PSF-convolved 2D disk.
 
     Parameters
     ----------
@@ -1308,24 +1542,27 @@ def make_cgauss_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
       68% containment radius in degrees.
     """
 
-    sigma /= 1.5095921854516636
+    psfc = make_cdisk_profile(psf, sigma, psf_scale_fn)
+    return make_radial_kernel(psf.dtheta, psfc, npix, cdelt, xpix, ypix,
+                              normalize)
 
-    dtheta = psf.dtheta
-    egy = psf.energies
 
-    x = make_pixel_offset(npix, xpix, ypix)
-    x *= cdelt
+def make_cgauss_kernel(psf, sigma, npix, cdelt, xpix, ypix, psf_scale_fn=None,
+                       normalize=False):
+    """Make a kernel for a PSF-convolved 2D gaussian.
 
-    k = np.zeros((len(egy), npix, npix))
-    for i in range(len(egy)):
-        fn = lambda t: psf.eval(i, t, scale_fn=psf_scale_fn)
-        psfc = convolve2d_gauss(fn, dtheta, sigma)
-        k[i] = np.interp(np.ravel(x), dtheta, psfc).reshape(x.shape)
+    Parameters
+    ----------
 
-    if normalize:
-        k /= (np.sum(k, axis=0)[np.newaxis, ...] * np.radians(cdelt) ** 2)
+    psf : `~fermipy.irfs.PSFModel`
 
-    return k
+    sigma : float
+      68% containment radius in degrees.
+    """
+
+    psfc = make_cgauss_profile(psf, sigma, psf_scale_fn)
+    return make_radial_kernel(psf.dtheta, psfc, npix, cdelt, xpix, ypix,
+                              normalize)
 
 
 def make_psf_kernel(psf, npix, cdelt, xpix, ypix, psf_scale_fn=None, normalize=False):
@@ -1345,13 +1582,10 @@ def make_psf_kernel(psf, npix, cdelt, xpix, ypix, psf_scale_fn=None, normalize=F
 
     """
 
-    egy = psf.energies
     x = make_pixel_offset(npix, xpix, ypix)
     x *= cdelt
 
-    k = np.zeros((len(egy), npix, npix))
-    for i in range(len(egy)):
-        k[i] = psf.eval(i, x, scale_fn=psf_scale_fn)
+    k = eval_psf_profiles(psf, x, psf_scale_fn)
 
     if normalize:
         k /= (np.sum(k, axis=0)[np.newaxis, ...] * np.radians(cdelt) ** 2)